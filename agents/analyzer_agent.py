@@ -1,8 +1,65 @@
-from typing import Dict, Any
-from .base_agent import BaseAgent
+from typing import Dict, Any, List, Optional
+from weakref import WeakKeyDictionary
+from .base_agent import BaseAgent, InvalidResponseError
+from .deadline import deadline_at, deadline_scope, within_deadline
+from .llm_client import count_prompt_tokens, estimate_tokens, record_prompt_tokens
+from .pregrader import (
+    DOWNGRADE_CONFIDENCE, DOWNGRADE_MODEL, PREGRADER_ENABLED, SKIP_CONFIDENCE, PreGrader, get_pregrader,
+)
+from .schemas import ANALYSIS_SCHEMA, BATCH_ANALYSIS_SCHEMA, validate_schema
+from .tracing import current_span, trace_span
+import asyncio
+import contextvars
+import os
+import re
+import time
+
+
+ANALYSIS_PROMPT = """Analyze these student results and return a JSON object with the following structure:
+{{"total_score": number, "grade": "grade letter", "recommendations": ["improvement1", "improvement2"], "strengths": ["strength1", "strength2"]}}
+
+The grading scale must be exactly as follows:
+- A: 70-100 points
+- B: 60-69 points
+- C: 50-59 points
+- F: Below 50 points
+
+Be critical in your assessment and provide a fair score based on the quality of the work.
+Evaluate the content quality, depth, organization, and completeness.
+
+Student results:
+{structured_data}
+
+Return ONLY the JSON object, no other text."""
+
+BATCH_ANALYSIS_PROMPT = """Analyze each of the following student submissions independently and return a JSON object with one result per submission:
+{{"results": [{{"id": "submission id", "total_score": number, "grade": "grade letter", "recommendations": ["improvement1", "improvement2"], "strengths": ["strength1", "strength2"]}}]}}
+
+The grading scale must be exactly as follows:
+- A: 70-100 points
+- B: 60-69 points
+- C: 50-59 points
+- F: Below 50 points
+
+Be critical in your assessment and provide a fair score based on the quality of each work on its own.
+Evaluate the content quality, depth, organization, and completeness.
+
+{submissions}
+
+Return ONLY the JSON object with exactly one entry in "results" per submission id, no other text."""
+
+# Prompt token budget and item limit for one batched analysis request
+ANALYSIS_BATCH_TOKENS = int(os.getenv("EDUMARK_ANALYSIS_BATCH_TOKENS", "6000"))
+ANALYSIS_BATCH_SIZE = int(os.getenv("EDUMARK_ANALYSIS_BATCH_SIZE", "8"))
+# Seconds run() waits to batch concurrent analyses together (0 sends each on its own)
+ANALYSIS_BATCH_WINDOW = float(os.getenv("EDUMARK_ANALYSIS_BATCH_WINDOW", "0"))
+# Response tokens to allow per item in a batch
+BATCH_ITEM_TOKENS = 300
 
 
 class EduMarkAgent(BaseAgent):
+    response_schema = ANALYSIS_SCHEMA
+
     def __init__(self):
         super().__init__(
             name="EduMark",
@@ -18,60 +75,198 @@ class EduMarkAgent(BaseAgent):
 
             Format the output as structured data.""",
         )
+        self.batch_window = ANALYSIS_BATCH_WINDOW
+        # Analyses waiting for the batch window, per event loop
+        self._pending: WeakKeyDictionary = WeakKeyDictionary()
+        self._flushes: set = set()
 
     async def run(self, messages: list) -> Dict[str, Any]:
         """Analyze the uploaded student results"""
         print("📘 EduMark: Analyzing student results")
 
         uploaded_results = eval(messages[-1]["content"])
+        structured_data = uploaded_results["structured_data"]
+
+        # Clear-cut submissions are scored locally, or on a smaller model. An extraction that
+        # found nothing is never one of them: that needs the LLM's judgement, not a confident 0.
+        pregrade = None
+        if PREGRADER_ENABLED and PreGrader.has_content(structured_data):
+            pregrade = get_pregrader().assess(structured_data)
+        if pregrade is not None and pregrade.confidence >= SKIP_CONFIDENCE:
+            print(f"📘 EduMark: Scored locally ({pregrade.reason}, confidence {pregrade.confidence})")
+            result = self._finalize(PreGrader.local_analysis(pregrade, structured_data), pregrade.confidence)
+            result["analysis_method"] = "local"
+        elif pregrade is not None and pregrade.confidence >= DOWNGRADE_CONFIDENCE:
+            result = await self._analyze(structured_data, DOWNGRADE_MODEL)
+            result["analysis_method"] = f"llm:{DOWNGRADE_MODEL}"
+        elif self.batch_window > 0:
+            result = await self._analyze_in_batch(structured_data)
+            result["analysis_method"] = "llm"
+        else:
+            result = await self._analyze(structured_data)
+            result["analysis_method"] = "llm"
+        if pregrade is not None:
+            result["pregrade"] = {"score": pregrade.score, "confidence": pregrade.confidence, "reason": pregrade.reason}
+        return result
+
+    async def _analyze(self, structured_data: Any, model: Optional[str] = None) -> Dict[str, Any]:
+        """One analysis request for one submission"""
+        analysis_prompt = ANALYSIS_PROMPT.format(structured_data=structured_data)
+        parsed_results = await self._query_json(analysis_prompt, model=model)
+        return self._finalize(parsed_results)
 
-        # Get structured analysis from Ollama
-        analysis_prompt = f"""
-        Analyze these student results and return a JSON object with the following structure:
-        {{
-            "total_score": number,
-            "grade": "grade letter",
-            "recommendations": ["improvement1", "improvement2"],
-            "strengths": ["strength1", "strength2"]
-        }}
-
-        The grading scale must be exactly as follows:
-        - A: 70-100 points
-        - B: 60-69 points
-        - C: 50-59 points
-        - F: Below 50 points
-
-        Be critical in your assessment and provide a fair score based on the quality of the work.
-        Evaluate the content quality, depth, organization, and completeness.
-
-        Student results:
-        {uploaded_results["structured_data"]}
-
-        Return ONLY the JSON object, no other text.
+    async def analyze_batch(self, submissions: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Analyze many submissions' structured_data, packed into as few requests as the budget allows.
+
+        Returns the analysis results keyed like `submissions`. Items missing from a batch
+        response, or failing validation, are re-analyzed on their own.
         """
+        batches = self._pack_batches({key: str(data) for key, data in submissions.items()})
+        print(f"📘 EduMark: Analyzing {len(submissions)} submissions in {len(batches)} requests")
+        results: Dict[str, Dict[str, Any]] = {}
+        for outcome in await asyncio.gather(*(self._analyze_packed(batch) for batch in batches)):
+            results.update(outcome)
+        return {key: results[key] for key in submissions}
 
-        analysis_results = self._query_llama(analysis_prompt)
-        parsed_results = self._parse_json_safely(analysis_results)
-
-        # Ensure we have valid data even if parsing fails
-        if "error" in parsed_results:
-            parsed_results = {
-                "total_score": 0,
-                "grade": "F",
-                "recommendations": ["Improve understanding of core concepts", "Practice problem-solving"],
-                "strengths": ["Consistency in effort"],
-            }
-        else:
-            # Ensure grade follows our scale
-            score = parsed_results["total_score"]
-            parsed_results["grade"] = self._calculate_grade(score)
+    def _pack_batches(self, rendered: Dict[str, str]) -> List[Dict[str, str]]:
+        """Greedily group submissions in order under the token budget and item limit"""
+        budget = ANALYSIS_BATCH_TOKENS - estimate_tokens(self.instructions + BATCH_ANALYSIS_PROMPT)
+        batches: List[Dict[str, str]] = []
+        current: Dict[str, str] = {}
+        used = 0
+        for key, text in rendered.items():
+            tokens = estimate_tokens(text)
+            if current and (used + tokens > budget or len(current) >= ANALYSIS_BATCH_SIZE):
+                batches.append(current)
+                current, used = {}, 0
+            current[key] = text
+            used += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _analyze_packed(self, batch: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        keys = list(batch)
+        if len(keys) == 1:
+            return {keys[0]: await self._analyze(batch[keys[0]])}
+
+        # Short positional IDs are cheap to echo back and easy to match
+        ids = {str(position): key for position, key in enumerate(keys, start=1)}
+        submissions = "\n\n".join(f"Submission id: {sid}\n{batch[key]}" for sid, key in ids.items())
+        try:
+            parsed = await self._query_json(
+                BATCH_ANALYSIS_PROMPT.format(submissions=submissions),
+                schema=BATCH_ANALYSIS_SCHEMA,
+                max_tokens=BATCH_ITEM_TOKENS * len(keys) + 200,
+            )
+        except InvalidResponseError:
+            parsed = {}  # Every item is analyzed on its own below
+        items = self._demux(parsed, list(ids))
+
+        results: Dict[str, Dict[str, Any]] = {}
+        retry: List[str] = []
+        for sid, key in ids.items():
+            item = items.get(sid)
+            if item is not None and not validate_schema(item, ANALYSIS_SCHEMA):
+                results[key] = self._finalize(item)
+            else:
+                retry.append(key)
+        if retry:
+            print(f"⚠️ {self.name}: {len(retry)}/{len(keys)} batch items unusable, analyzing them individually")
+            current_span().add("batch_item_fallbacks", len(retry))
+            for key, result in zip(retry, await asyncio.gather(*(self._analyze(batch[key]) for key in retry))):
+                results[key] = result
+        return results
+
+    @staticmethod
+    def _demux(parsed: Dict[str, Any], ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Map a batch response's items back to submission IDs"""
+        items = parsed.get("results")
+        if not isinstance(items, list):
+            return {}
+        by_id: Dict[str, Dict[str, Any]] = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            # Accept 2, "2" and "Submission 2"
+            match = re.search(r"\d+", str(item.get("id", "")))
+            if match and match.group() in ids and match.group() not in by_id:
+                by_id[match.group()] = {k: v for k, v in item.items() if k != "id"}
+        if not by_id and len(items) == len(ids) and all(isinstance(i, dict) and "id" not in i for i in items):
+            # No IDs at all but one item per submission: trust the order
+            by_id = dict(zip(ids, items))
+        return by_id
+
+    async def _analyze_in_batch(self, structured_data: Any) -> Dict[str, Any]:
+        """Queue this analysis and wait for the batch it joins to be sent.
+
+        The batch is sent when the window since its first item closes or it reaches
+        ANALYSIS_BATCH_SIZE items. It runs in a context of its own, bounded by the latest
+        deadline among its items, so one item running out of time never fails the others:
+        each item waits for its result within its own deadline.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(loop, [])
+        pending.append((structured_data, future, deadline_at()))
+        if len(pending) == 1:
+            loop.call_later(self.batch_window, self._flush_batch, loop, pending, context=contextvars.Context())
+        elif len(pending) >= ANALYSIS_BATCH_SIZE:
+            self._flush_batch(loop, pending)
+        try:
+            result, prompt_tokens, batch_size = await within_deadline(future)
+        finally:
+            future.cancel()  # No-op once settled; otherwise the batch stops waiting on us
+        # Charge this item its share of the batch request, in its own stage metrics and span
+        record_prompt_tokens(prompt_tokens)
+        current_span().set(analysis_batch_size=batch_size)
+        return result
+
+    def _flush_batch(self, loop: asyncio.AbstractEventLoop, pending: List[Any]) -> None:
+        if self._pending.get(loop) is not pending:
+            return  # Already sent because it filled up
+        del self._pending[loop]
+        # A fresh context: the batch must not inherit the deadline or span of whichever item filled it
+        task = contextvars.Context().run(loop.create_task, self._settle_batch(pending))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _settle_batch(self, pending: List[Any]) -> None:
+        waiting = [(data, future, deadline) for data, future, deadline in pending if not future.done()]
+        if not waiting:
+            return
+        deadlines = [deadline for _, _, deadline in waiting]
+        budget = None if None in deadlines else max(max(deadlines) - time.monotonic(), 0.001)
+        try:
+            with trace_span("analysis.batch", items=len(waiting)), deadline_scope(budget), \
+                    count_prompt_tokens() as counts:
+                results = await within_deadline(
+                    self.analyze_batch({str(i): data for i, (data, _, _) in enumerate(waiting)})
+                )
+        except Exception as e:
+            for _, future, _ in waiting:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        share = sum(counts) // len(waiting)
+        for i, (_, future, _) in enumerate(waiting):
+            if not future.done():
+                future.set_result((results[str(i)], share, len(waiting)))
+
+    def _finalize(self, parsed_results: Dict[str, Any], confidence: Optional[float] = None) -> Dict[str, Any]:
+        """Apply the grading scale to a validated analysis response"""
+        # Ensure grade follows our scale
+        score = parsed_results["total_score"]
+        parsed_results["grade"] = self._calculate_grade(score)
 
         # Dynamically generate timestamp and confidence score
         from datetime import datetime
         import random
 
         current_timestamp = datetime.now().isoformat()
-        confidence_score = random.uniform(0.7, 0.95) if "error" not in parsed_results else random.uniform(0.4, 0.6)
+        confidence_score = random.uniform(0.7, 0.95)
+        if confidence is not None:
+            confidence_score = confidence
 
         return {
             "student_analysis": parsed_results,
@@ -1,46 +1,234 @@
 #from phi.agent import Agent
 #from phi.model.groq import Groq
-from groq import Groq
-from dotenv import load_dotenv  
-from typing import Dict, Any
+from groq import AsyncGroq
+from typing import Dict, Any, AsyncIterator, Optional
+from .llm_backends import LLMRequest, StreamInterruptedError, get_llm_backend
+from .llm_client import MODEL_NAME, estimate_tokens, get_llm_client, record_prompt_tokens
+from .llm_scheduler import get_llm_scheduler
+from .llm_cache import get_llm_cache
+from .progress import emit_progress, streaming_enabled
+from .schemas import validate_schema
+from .tracing import current_span, trace_span
+import asyncio
+import inspect
 import json
 import os
-load_dotenv()
+
+# Total attempts per stage when a structured response fails validation
+JSON_ATTEMPTS = int(os.getenv("EDUMARK_JSON_ATTEMPTS", "2"))
+
+
+class InvalidResponseError(Exception):
+    """Every attempt at a structured response failed to parse or validate"""
+
+    def __init__(self, agent: str, validation_errors: list):
+        super().__init__(f"{agent}: response failed schema validation: {validation_errors[:3]}")
+        self.validation_errors = validation_errors
+
 
 class BaseAgent:
+    # JSON Schema (see agents.schemas) for the agent's structured response, if it has one
+    response_schema: Optional[Dict[str, Any]] = None
+
     def __init__(self, name: str, instructions: str):
         self.name = name
-        self.instructions = instructions
-        self.llama_client =Groq(api_key=os.getenv("GROQ_API_KEY"))
+        # Strip the source indentation of triple-quoted instructions; it is pure prompt overhead
+        self.instructions = inspect.cleandoc(instructions)
+
+    @property
+    def llama_client(self) -> AsyncGroq:
+        """Pooled async client shared by every agent in the process"""
+        return get_llm_client()
+
     async def run(self, messages: list) -> Dict[str, Any]:
         """Default run method to be overridden by child classes"""
         raise NotImplementedError("Subclasses must implement run()")
-    def _query_llama(self, prompt: str) -> str:
-        """Query llama model with the given prompt"""
-        try:
-            response = self.llama_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",  
-                messages=[
-                    {"role": "system", "content": self.instructions},
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=0.7,
-                max_tokens=2000,
+    def _build_request(
+        self, prompt: str, temperature: float, max_tokens: int, json_mode: bool = False, model: Optional[str] = None
+    ) -> LLMRequest:
+        return LLMRequest(
+            agent=self.name,
+            model=model or MODEL_NAME,
+            instructions=self.instructions,
+            prompt=prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            json_mode=json_mode,
+        )
+
+    async def _query_llama(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        use_cache: bool = True,
+        json_mode: bool = False,
+        model: Optional[str] = None,
+    ) -> str:
+        """Query llama model with the given prompt, serving repeats from the response cache"""
+        record_prompt_tokens(estimate_tokens(self.instructions + prompt))
+        with trace_span(
+            "llm.call", agent=self.name, model=model or MODEL_NAME, json_mode=json_mode, prompt_chars=len(prompt)
+        ) as span:
+            if streaming_enabled():
+                # Someone is watching: stream and forward deltas as they arrive
+                span.set(streamed=True, cache_hit=False)
+                parts = []
+                async for delta in self._stream_llama(prompt, temperature, max_tokens, use_cache, json_mode, model):
+                    parts.append(delta)
+                    emit_progress("token", delta)
+                content = "".join(parts)
+                span.set(
+                    prompt_tokens=estimate_tokens(self.instructions + prompt),
+                    completion_tokens=estimate_tokens(content),
+                    response_chars=len(content),
+                )
+                return content
+
+            request = self._build_request(prompt, temperature, max_tokens, json_mode, model)
+            cache = get_llm_cache()
+            cache_key = request.cache_key()
+            if use_cache:
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    span.set(cache_hit=True, response_chars=len(cached))
+                    return cached
+            span.set(cache_hit=False)
+
+            scheduler = get_llm_scheduler()
+            backend = get_llm_backend()
+            reserved_tokens = estimate_tokens(self.instructions + prompt) + max_tokens
+            try:
+                response = await scheduler.submit(lambda: backend.complete(request), tokens=reserved_tokens)
+            except Exception as e:
+                print(f"Error querying llama: {str(e)}")
+                raise
+            scheduler.refund_tokens(reserved_tokens - response.total_tokens)
+            span.set(
+                prompt_tokens=response.prompt_tokens,
+                completion_tokens=response.completion_tokens,
+                response_chars=len(response.content),
             )
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"Error querying llama: {str(e)}")
-            raise
-    def _parse_json_safely(self, text: str) -> Dict[str, Any]:
 
-        """Safely parse JSON from text, handling potential errors"""
+            if use_cache and response.content:
+                cache.set(cache_key, response.content)
+            return response.content
+
+    async def _stream_llama(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        use_cache: bool = True,
+        json_mode: bool = False,
+        model: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """Streaming variant of _query_llama that yields text deltas as they arrive"""
+        request = self._build_request(prompt, temperature, max_tokens, json_mode, model)
+        cache = get_llm_cache()
+        cache_key = request.cache_key()
+        if use_cache:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                current_span().set(cache_hit=True)
+                yield cached
+                return
+
+        scheduler = get_llm_scheduler()
+        backend = get_llm_backend()
+        reserved_tokens = estimate_tokens(self.instructions + prompt) + max_tokens
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        async def consume() -> None:
+            emitted = False
+            try:
+                async for delta in backend.stream(request):
+                    emitted = True
+                    queue.put_nowait(delta)
+            except Exception as e:
+                if emitted:
+                    raise StreamInterruptedError(str(e)) from e
+                raise
+
+        async def produce() -> None:
+            # The scheduler slot is held for the whole stream
+            try:
+                await scheduler.submit(consume, tokens=reserved_tokens)
+                queue.put_nowait(done)
+            except Exception as e:
+                queue.put_nowait(e)
+
+        producer = asyncio.create_task(produce())
+        parts = []
         try:
-            # Try to find JSON-like content between curly braces
-            start = text.find("{")
-            end = text.rfind("}")
-            if start != -1 and end != -1:
-                json_str = text[start : end + 1]
-                return json.loads(json_str)
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    print(f"Error querying llama: {str(item)}")
+                    raise item
+                parts.append(item)
+                yield item
+        finally:
+            if not producer.done():
+                producer.cancel()
+
+        content = "".join(parts)
+        scheduler.refund_tokens(reserved_tokens - estimate_tokens(self.instructions + prompt) - estimate_tokens(content))
+        if use_cache and content:
+            cache.set(cache_key, content)
+
+    async def _query_json(
+        self,
+        prompt: str,
+        schema: Optional[Dict[str, Any]] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        model: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Request a JSON response, validate it against the schema and retry only this call.
+
+        Raises InvalidResponseError when every attempt fails, so the stage fails (and can be
+        resumed) instead of carrying on with placeholder output. When output is being
+        streamed to a listener, the request is made in plain mode, because JSON mode
+        responses arrive in one piece; the text is validated the same way afterwards.
+        """
+        schema = schema or self.response_schema
+        json_mode = not streaming_enabled()
+        errors = []
+        for attempt in range(1, JSON_ATTEMPTS + 1):
+            text = await self._query_llama(prompt, temperature, max_tokens, json_mode=json_mode, model=model)
+            parsed = self._parse_json_safely(text)
+            if "error" in parsed and len(parsed) == 1:
+                errors = [parsed["error"]]
+            else:
+                errors = validate_schema(parsed, schema) if schema else []
+                if not errors:
+                    return parsed
+            print(f"⚠️ {self.name}: invalid JSON response (attempt {attempt}/{JSON_ATTEMPTS}): {errors[:3]}")
+            current_span().add("json_retries")
+            # Never serve the rejected response from the cache again
+            get_llm_cache().delete(self._build_request(prompt, temperature, max_tokens, json_mode, model).cache_key())
+        raise InvalidResponseError(self.name, errors)
+
+    def _parse_json_safely(self, text: str) -> Dict[str, Any]:
+        """Safely parse JSON from text, handling potential errors"""
+        if not text:
             return {"error": "No JSON content found"}
+        try:
+            # JSON mode responses are a bare object, so this is normally the only pass
+            parsed = json.loads(text)
         except json.JSONDecodeError:
-            return {"error": "Invalid JSON content"}
+            # Otherwise decode the first complete object, ignoring any prose around it
+            start = text.find("{")
+            if start == -1:
+                return {"error": "No JSON content found"}
+            try:
+                parsed, _ = json.JSONDecoder().raw_decode(text, start)
+            except json.JSONDecodeError:
+                return {"error": "Invalid JSON content"}
+        if not isinstance(parsed, dict):
+            return {"error": "JSON content is not an object"}
+        return parsed
@@ -0,0 +1,47 @@
+from typing import List
+import re
+from .llm_client import estimate_tokens
+
+
+def split_text_into_chunks(text: str, max_tokens: int) -> List[str]:
+    """Split text into chunks of at most `max_tokens`, preferring paragraph boundaries"""
+    max_chars = max_tokens * 4
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+
+    for paragraph in _split_oversized(re.split(r"\n\s*\n", text), max_chars):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        tokens = estimate_tokens(paragraph)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += tokens
+
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _split_oversized(paragraphs: List[str], max_chars: int) -> List[str]:
+    """Break paragraphs longer than one chunk on line, then character, boundaries"""
+    pieces: List[str] = []
+    for paragraph in paragraphs:
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        buffer = ""
+        for line in paragraph.splitlines(keepends=True):
+            while len(line) > max_chars:
+                pieces.append(line[:max_chars])
+                line = line[max_chars:]
+            if len(buffer) + len(line) > max_chars:
+                pieces.append(buffer)
+                buffer = ""
+            buffer += line
+        if buffer:
+            pieces.append(buffer)
+    return pieces
@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Iterator, Optional, TypeVar
+import asyncio
+import time
+
+T = TypeVar("T")
+
+# Absolute time.monotonic() by which the current submission must finish
+_deadline: ContextVar[Optional[float]] = ContextVar("edumark_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The submission's time budget ran out"""
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[None]:
+    """Bound everything in the block to `seconds` from now (never extends an outer deadline)"""
+    current = _deadline.get()
+    if seconds is None or seconds <= 0:
+        new = current
+    else:
+        new = time.monotonic() + seconds
+        if current is not None:
+            new = min(new, current)
+    token = _deadline.set(new)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def deadline_at() -> Optional[float]:
+    """The current deadline as a time.monotonic() value, or None when there is no deadline"""
+    return _deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the deadline, or None when there is no deadline"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def check_deadline() -> None:
+    """Raise DeadlineExceeded if the deadline has already passed"""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Deadline exceeded")
+
+
+async def within_deadline(awaitable: Awaitable[T]) -> T:
+    """Await `awaitable`, cancelling it when the deadline passes"""
+    left = remaining()
+    if left is None:
+        return await awaitable
+    if left <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded("Deadline exceeded")
+    try:
+        return await asyncio.wait_for(awaitable, timeout=left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Deadline exceeded") from None
+
+
+async def sleep_within_deadline(seconds: float) -> None:
+    """Sleep, failing fast if the sleep would outlast the deadline"""
+    left = remaining()
+    if left is not None and seconds >= left:
+        raise DeadlineExceeded(f"Waiting {seconds:.1f}s would exceed the deadline")
+    await asyncio.sleep(seconds)
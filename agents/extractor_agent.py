@@ -1,8 +1,50 @@
-from typing import Dict, Any
-from pdfminer.high_level import extract_text 
+from collections import deque
+from typing import Dict, Any, AsyncIterator, List
 from .base_agent import BaseAgent
+from .chunking import split_text_into_chunks
+from .llm_client import estimate_tokens
+from .pdf_text import extract_pdf_pages, file_sha256, get_pdf_text_cache, pdf_page_count, stream_pdf_pages
+from .schemas import EXTRACTION_SCHEMA
+from .section_splitter import get_section_splitter
+from .tracing import trace_span
+import asyncio
+import os
+
+EXTRACTION_FIELDS = [
+    "introduction",
+    "content",
+    "references",
+    "citations",
+    "data",
+    "tables",
+    "images",
+    "recommendations",
+    "summary",
+]
+
+EXTRACTION_PROMPT = """Analyze the following extracted text from a student solution sheet{scope} and structure it into a JSON object with the following fields:
+{{"introduction": "", "content": "", "references": "", "citations": "", "data": "", "tables": "", "images": "", "recommendations": "", "summary": ""}}
+
+Extracted text:
+{text}
+
+Return ONLY the JSON object, no other text."""
+
+# Documents larger than this are extracted chunk by chunk
+CHUNK_TOKENS = int(os.getenv("EDUMARK_EXTRACT_CHUNK_TOKENS", "3000"))
+# PDFs with more pages are streamed page by page instead of loaded whole (0 never streams)
+STREAM_PAGES = int(os.getenv("EDUMARK_STREAM_PAGES", "40"))
+# Chunk requests in flight while streaming
+STREAM_CONCURRENCY = int(os.getenv("EDUMARK_STREAM_CONCURRENCY", "4"))
+# raw_text of a streamed document keeps only this much of the text
+RAW_TEXT_PREVIEW_CHARS = int(os.getenv("EDUMARK_RAW_TEXT_PREVIEW_CHARS", "20000"))
+# Upper bound on each merged field of a streamed document
+FIELD_MAX_CHARS = int(os.getenv("EDUMARK_FIELD_MAX_CHARS", "20000"))
+
 
 class ExtractorAgent(BaseAgent):
+    response_schema = EXTRACTION_SCHEMA
+
     def __init__(self):
         super().__init__(
             name="Extractor",
@@ -16,53 +58,198 @@ class ExtractorAgent(BaseAgent):
         print("📄 Extractor: Processing student solution sheet")
         
         report_data = eval(messages[-1]["content"])
-        
-        # Extract text from PDF
-        if report_data.get("file_path"):
-            raw_text = extract_text(report_data["file_path"])
-        else:
-            raw_text = report_data.get("text", "")
-
-        # Get structured information from EduMark
-        extraction_prompt = f"""
-        Analyze the following extracted text from a student solution sheet and structure it into a JSON object with the following fields:
-        {{
-            "introduction": "",
-            "content": "",
-            "references": "",
-            "citations": "",
-            "data": "",
-            "tables": "",
-            "images": "",
-            "recommendations": "",
-            "summary": ""
-        }}
-
-        Extracted text:
-        {raw_text}
-
-        Return ONLY the JSON object, no other text.
+        extracted = await self._load_document(report_data)
+        extracted["structured_data"] = await self._structure_document(extracted)
+        extracted["extraction_status"] = "completed"
+        return extracted
+
+    async def _load_document(self, report_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract text from the PDF, or use the text supplied directly.
+
+        PDF pages are parsed in parallel page ranges in worker processes, so the event loop
+        never blocks on pdfminer. Text and page layout are cached by the SHA-256 of the file,
+        so re-uploads and page reruns skip parsing. Byte-identical files submitted under other
+        student IDs are listed in duplicate_of. PDFs longer than STREAM_PAGES are not loaded here:
+        the document gets a page_stream for _structure_document to consume instead.
+        """
+        if not report_data.get("file_path"):
+            return {"raw_text": report_data.get("text", "")}
+
+        file_path = report_data["file_path"]
+        cache = get_pdf_text_cache()
+        document: Dict[str, Any] = {}
+        with trace_span("pdf.extract", file_bytes=os.path.getsize(file_path)) as span:
+            sha256 = await asyncio.to_thread(file_sha256, file_path)
+            pages = await asyncio.to_thread(cache.get, sha256)
+            span.set(cache_hit=pages is not None)
+            total_pages = await pdf_page_count(file_path) if pages is None else len(pages)
+            if pages is None and STREAM_PAGES and total_pages > STREAM_PAGES:
+                # Too big to cache or hold whole; metrics are filled in while streaming
+                document["pdf_metrics"] = {}
+                document["page_stream"] = stream_pdf_pages(file_path, total_pages, document["pdf_metrics"])
+                document["raw_text"] = ""
+                span.set(streamed=True, pages=total_pages)
+            else:
+                if pages is None:
+                    pages, layouts, metrics = await extract_pdf_pages(file_path, total_pages=total_pages)
+                    await asyncio.to_thread(cache.set, sha256, pages, layouts=layouts)
+                    document["pdf_metrics"] = metrics
+                    self._report_page_timings(metrics)
+                    span.set(tasks=metrics["tasks"], truncated=metrics["truncated"])
+                document["raw_text"] = "\f".join(pages)
+                span.set(chars=len(document["raw_text"]), pages=len(pages))
+
+        duplicate_of = await asyncio.to_thread(cache.record_submitter, sha256, str(report_data.get("student_id", "")))
+        if duplicate_of:
+            print(f"⚠️ Extractor: Identical file already submitted by {', '.join(duplicate_of)}")
+            document["duplicate_of"] = duplicate_of
+        return document
+
+    @staticmethod
+    def _report_page_timings(metrics: Dict[str, Any]) -> None:
+        page_seconds = metrics["page_seconds"]
+        message = (f"📄 Extractor: Parsed {metrics['pages_extracted']}/{metrics['pages']} pages in "
+                   f"{metrics['extract_seconds']}s across {metrics['tasks']} tasks")
+        if page_seconds:
+            slowest = max(range(len(page_seconds)), key=page_seconds.__getitem__)
+            message += f" (slowest page {slowest + 1}: {page_seconds[slowest]}s)"
+        print(message)
+
+    async def _structure_document(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Structure a loaded document, streaming its pages if it has a page_stream.
+
+        Documents whose headings the local section splitter recognises confidently skip
+        the LLM; extraction_method records which path was taken.
         """
+        page_stream = document.pop("page_stream", None)
+        if page_stream is not None:
+            document["extraction_method"] = "llm"
+            return await self._structure_stream(page_stream, document)
+
+        local = get_section_splitter().try_split(document["raw_text"])
+        if local is not None:
+            print(f"📄 Extractor: Split {', '.join(local.headings)} locally (confidence {local.confidence})")
+            document.update({"extraction_method": "local", "section_confidence": local.confidence})
+            return local.fields
+        document["extraction_method"] = "llm"
+        return await self._structure(document["raw_text"])
+
+    async def _structure(self, raw_text: str) -> Dict[str, Any]:
+        """Split the text into the nine extraction fields"""
+        if estimate_tokens(raw_text) > CHUNK_TOKENS:
+            return await self._extract_chunked(raw_text)
+        return await self._query_json(self._build_prompt(raw_text))
+
+    def _build_prompt(self, text: str, part: str = "") -> str:
+        """Build the extraction prompt for a whole document or one part of it"""
+        scope = f" (this is {part} of the document; leave fields empty if they are not in this part)" if part else ""
+        return EXTRACTION_PROMPT.format(scope=scope, text=text)
+
+    async def _extract_chunked(self, raw_text: str) -> Dict[str, Any]:
+        """Map: extract fields from each chunk concurrently. Reduce: merge them per field.
+
+        A chunk that cannot be parsed fails the extraction rather than silently dropping
+        its part of the document; the chunks that did parse are served from the response
+        cache when the stage is retried.
+        """
+        chunks = split_text_into_chunks(raw_text, CHUNK_TOKENS)
+        print(f"📄 Extractor: Splitting submission into {len(chunks)} chunks")
+        partials = await asyncio.gather(
+            *(
+                self._query_json(self._build_prompt(chunk, f"part {index} of {len(chunks)}"))
+                for index, chunk in enumerate(chunks, start=1)
+            ),
+            return_exceptions=True,
+        )
+        for partial in partials:
+            if isinstance(partial, BaseException):
+                raise partial
+        return self._merge_chunks(partials)
+
+    async def _structure_stream(self, pages: AsyncIterator[str], document: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract fields chunk by chunk as pages arrive, holding a bounded amount of text.
+
+        Only the pages of the chunk being filled, STREAM_CONCURRENCY chunk requests and the
+        merged fields (each capped at FIELD_MAX_CHARS) are kept in memory. raw_text keeps
+        the first RAW_TEXT_PREVIEW_CHARS of the document.
+        """
+        preview: List[str] = []
+        preview_chars = total_chars = 0
+        buffer: List[str] = []
+        buffer_tokens = 0
+        values: Dict[str, List[str]] = {field: [] for field in EXTRACTION_FIELDS}
+        in_flight: deque = deque()
+        chunk_count = 0
+
+        async def collect_oldest() -> None:
+            self._fold_chunk(values, await in_flight.popleft(), FIELD_MAX_CHARS)
+
+        async def send(text: str) -> None:
+            nonlocal chunk_count
+            chunk_count += 1
+            prompt = self._build_prompt(text, f"part {chunk_count} of a long document")
+            in_flight.append(asyncio.create_task(self._query_json(prompt)))
+            while len(in_flight) >= STREAM_CONCURRENCY:
+                await collect_oldest()
+
+        with trace_span("pdf.stream") as span:
+            try:
+                async for page in pages:
+                    total_chars += len(page)
+                    if preview_chars < RAW_TEXT_PREVIEW_CHARS:
+                        preview.append(page[:RAW_TEXT_PREVIEW_CHARS - preview_chars])
+                        preview_chars += len(preview[-1])
+                    buffer.append(page)
+                    buffer_tokens += estimate_tokens(page)
+                    if buffer_tokens >= CHUNK_TOKENS:
+                        chunks = split_text_into_chunks("\n\n".join(buffer), CHUNK_TOKENS)
+                        if not chunks:
+                            # Blank or scanned pages: whitespace only, nothing to send
+                            buffer, buffer_tokens = [], 0
+                            continue
+                        # Send full chunks now; the remainder starts the next one
+                        *full, rest = chunks
+                        for chunk in full:
+                            await send(chunk)
+                        buffer, buffer_tokens = [rest], estimate_tokens(rest)
+                if any(part.strip() for part in buffer):
+                    for chunk in split_text_into_chunks("\n\n".join(buffer), CHUNK_TOKENS):
+                        await send(chunk)
+                while in_flight:
+                    await collect_oldest()
+            finally:
+                for task in in_flight:
+                    task.cancel()
+            span.set(chars=total_chars, chunks=chunk_count)
+
+        print(f"📄 Extractor: Streamed {total_chars} characters in {chunk_count} chunks")
+        document["raw_text"] = "\f".join(preview)
+        document["raw_chars"] = total_chars
+        document["raw_text_truncated"] = total_chars > preview_chars
+        return self._finish_merge(values)
+
+    @staticmethod
+    def _fold_chunk(values: Dict[str, List[str]], partial: Dict[str, Any], max_chars: int = 0) -> None:
+        """Add one chunk's field values, dropping empties, repeats and (optionally) overflow"""
+        for field in EXTRACTION_FIELDS:
+            value = partial.get(field, "")
+            if isinstance(value, (list, dict)):
+                value = str(value)
+            value = str(value).strip()
+            if not value or value.lower() in ("not found", "n/a", "none") or value in values[field]:
+                continue
+            if max_chars and sum(len(existing) for existing in values[field]) + len(value) > max_chars:
+                continue
+            values[field].append(value)
+
+    @staticmethod
+    def _finish_merge(values: Dict[str, List[str]]) -> Dict[str, Any]:
+        return {field: "\n\n".join(values[field]) if values[field] else "Not found" for field in EXTRACTION_FIELDS}
 
-        extracted_info = self._query_llama(extraction_prompt)
-        parsed_info = self._parse_json_safely(extracted_info)
-
-        # Ensure valid data even if parsing fails
-        if "error" in parsed_info:
-            parsed_info = {
-                "introduction": "Not found",
-                "content": "Not found",
-                "references": "Not found",
-                "citations": "Not found",
-                "data": "Not found",
-                "tables": "Not found",
-                "images": "Not found",
-                "recommendations": "Not found",
-                "summary": "Not found",
-            }
-
-        return {
-            "raw_text": raw_text,
-            "structured_data": parsed_info,
-            "extraction_status": "completed"
-        }
\ No newline at end of file
+    @staticmethod
+    def _merge_chunks(partials: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Combine per-chunk field values in document order, dropping empties and repeats"""
+        values: Dict[str, List[str]] = {field: [] for field in EXTRACTION_FIELDS}
+        for partial in partials:
+            ExtractorAgent._fold_chunk(values, partial)
+        return ExtractorAgent._finish_merge(values)
@@ -0,0 +1,77 @@
+from typing import Dict, Any, Optional
+from .base_agent import BaseAgent, InvalidResponseError
+from .analyzer_agent import EduMarkAgent
+from .extractor_agent import CHUNK_TOKENS, ExtractorAgent
+from .llm_client import estimate_tokens
+from .schemas import ANALYSIS_SCHEMA, EXTRACTION_SCHEMA
+
+
+FUSED_PROMPT = """Read the following extracted text from a student solution sheet and return ONE JSON object with two parts:
+1. "structured_data": the text organised into these fields:
+{{"introduction": "", "content": "", "references": "", "citations": "", "data": "", "tables": "", "images": "", "recommendations": "", "summary": ""}}
+2. "analysis": your assessment of the work:
+{{"total_score": number, "grade": "grade letter", "recommendations": ["improvement1", "improvement2"], "strengths": ["strength1", "strength2"]}}
+
+The grading scale must be exactly as follows:
+- A: 70-100 points
+- B: 60-69 points
+- C: 50-59 points
+- F: Below 50 points
+
+Be critical in your assessment and provide a fair score based on the quality of the work.
+Evaluate the content quality, depth, organization, and completeness.
+
+Extracted text:
+{text}
+
+Return ONLY the JSON object {{"structured_data": {{...}}, "analysis": {{...}}}}, no other text."""
+
+FUSED_SCHEMA = {
+    "type": "object",
+    "required": ["structured_data", "analysis"],
+    "properties": {"structured_data": EXTRACTION_SCHEMA, "analysis": ANALYSIS_SCHEMA},
+}
+
+
+class ExtractAnalyzeAgent(BaseAgent):
+    """Extraction and analysis in a single LLM round-trip"""
+
+    response_schema = FUSED_SCHEMA
+
+    def __init__(self, extractor: ExtractorAgent, analyzer: EduMarkAgent):
+        super().__init__(
+            name="ExtractAnalyze",
+            instructions="""Extract and structure information from student solution sheets, then analyze the work.
+            Focus on: Introduction, content, references, citations, data, tables, images, recommendations, and summary.
+            Score the work from 0-100 with a grade (A/B/C/F), recommendations for improvement and highlighted strengths.""",
+        )
+        self.extractor = extractor
+        self.analyzer = analyzer
+
+    async def run(self, messages: list) -> Dict[str, Any]:
+        """Return both extracted_data and analysis_results for the submission"""
+        print("📄📘 ExtractAnalyze: Extracting and analyzing in one request")
+
+        report_data = eval(messages[-1]["content"])
+        extracted_data = await self.extractor._load_document(report_data)
+        raw_text = extracted_data["raw_text"]
+
+        parsed: Optional[Dict[str, Any]] = None
+        if "page_stream" not in extracted_data and estimate_tokens(raw_text) <= CHUNK_TOKENS:
+            try:
+                parsed = await self._query_json(FUSED_PROMPT.format(text=raw_text), max_tokens=3000)
+            except InvalidResponseError as e:
+                print(f"⚠️ ExtractAnalyze: {e}; falling back to separate calls")
+
+        if parsed is None:
+            # Fall back to split mode: (chunked or streamed) extraction, then a separate analysis call
+            structured_data = await self.extractor._structure_document(extracted_data)
+            analysis_results = await self.analyzer.run(
+                [{"role": "user", "content": str({"structured_data": structured_data})}]
+            )
+        else:
+            structured_data = parsed["structured_data"]
+            analysis_results = self.analyzer._finalize(parsed["analysis"])
+
+        extracted_data.update({"structured_data": structured_data, "extraction_status": "completed"})
+        return {"extracted_data": extracted_data, "analysis_results": analysis_results}
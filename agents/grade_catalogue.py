@@ -0,0 +1,179 @@
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from scipy import sparse
+import numpy as np
+import json
+import os
+import sqlite3
+import threading
+import time
+from db.database import EduMarkDatabase
+from .tracing import traced
+
+# How often a cached catalogue asks SQLite whether it changed; between checks lookups do no I/O
+CHECK_SECONDS = float(os.getenv("EDUMARK_CATALOGUE_CHECK_SECONDS", "5"))
+
+
+class GradeCatalogue:
+    """The grades table encoded once as a sparse requirement × grade matrix.
+
+    Row r, column g is 1 when grade g lists requirement r. The overlap of a submission
+    with every grade is then the sum of the rows of its requirements, one sparse
+    operation however many grades there are. It is the in-memory form of the
+    grade_requirements table and answers the same question as
+    EduMarkDatabase.candidate_grades without a round trip to SQLite.
+    """
+
+    def __init__(
+        self,
+        grades: List[Dict[str, Any]],
+        version: int = 0,
+        normalized: Optional[Dict[int, List[str]]] = None,
+    ):
+        # `normalized` maps grade ids to requirements already normalized, as grade_requirements stores them
+        self.grades = grades
+        self.version = version
+        self.vocabulary: Dict[str, int] = {}
+        rows: List[int] = []
+        cols: List[int] = []
+        for column, grade in enumerate(grades):
+            if normalized is not None:
+                requirements = normalized.get(grade["id"], [])
+            else:
+                requirements = EduMarkDatabase.normalize_requirements(grade["requirements"])
+            for requirement in requirements:
+                rows.append(self.vocabulary.setdefault(requirement, len(self.vocabulary)))
+                cols.append(column)
+        self.matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(self.vocabulary), len(grades)),
+        )
+        self.required_counts = np.asarray(self.matrix.sum(axis=0)).ravel()
+        bands = np.array([grade["grade_band"] for grade in grades], dtype=object)
+        self.band_masks = {band: bands == band for band in set(bands.tolist())}
+
+    @classmethod
+    @traced("sqlite.load_grade_catalogue")
+    def load(cls, db_path) -> "GradeCatalogue":
+        """Read and encode the whole grades table, with the catalogue version it was read at"""
+        with sqlite3.connect(db_path) as conn:
+            # One read transaction, so the version matches the rows
+            conn.execute("BEGIN")
+            version = conn.execute("SELECT version FROM catalogue_version WHERE id = 1").fetchone()[0]
+            rows = conn.execute("SELECT id, title, location, grade_band, requirements FROM grades ORDER BY id").fetchall()
+            normalized: Dict[int, List[str]] = {}
+            for grade_id, requirement in conn.execute(
+                "SELECT grade_id, requirement FROM grade_requirements ORDER BY grade_id, requirement"
+            ):
+                normalized.setdefault(grade_id, []).append(requirement)
+            conn.execute("COMMIT")
+        return cls([
+            {
+                "id": grade_id,
+                "title": title,
+                "location": location,
+                "grade_band": grade_band,
+                "requirements": json.loads(requirements or "[]"),
+            }
+            for grade_id, title, location, grade_band, requirements in rows
+        ], version, normalized)
+
+    def __len__(self) -> int:
+        return len(self.grades)
+
+    def match_scores(self, contents: Sequence[str], grade_band: str) -> np.ndarray:
+        """Percentage of each grade's requirements found in `contents`; 0 outside the band"""
+        hits = [self.vocabulary[r] for r in EduMarkDatabase.normalize_requirements(contents) if r in self.vocabulary]
+        mask = self.band_masks.get(grade_band)
+        if not hits or mask is None:
+            return np.zeros(len(self.grades), dtype=np.float32)
+        overlap = np.asarray(self.matrix[hits].sum(axis=0)).ravel()
+        scores = np.divide(overlap * 100, self.required_counts, out=np.zeros_like(overlap), where=self.required_counts > 0)
+        return np.where(mask, scores, 0)
+
+    def top_k(
+        self, contents: Sequence[str], grade_band: str, k: int = 3, min_score: float = 30
+    ) -> Tuple[List[Tuple[Dict[str, Any], float]], int]:
+        """The k best grades scoring at least `min_score`, best first, and how many qualified"""
+        scores = self.match_scores(contents, grade_band)
+        candidates = np.flatnonzero(scores >= min_score)
+        qualified = len(candidates)
+        if qualified > k:
+            # Partial sort: find the k-th best score, then only order grades at or above it
+            kth_best = np.partition(scores[candidates], qualified - k)[qualified - k]
+            candidates = candidates[scores[candidates] >= kth_best]
+        # Best score first; ties keep catalogue order
+        ordered = candidates[np.lexsort((candidates, -scores[candidates]))][:k]
+        return [(self.grades[i], float(scores[i])) for i in ordered], qualified
+
+
+class CatalogueCache:
+    """Process-wide parsed catalogue, reloaded only when the catalogue version changes.
+
+    Triggers bump the version on every edit to the grades table (and re-index its
+    requirements in grade_requirements in the same statement), whichever
+    process makes it, so running workers pick up edits within `check_seconds` without
+    a restart. Between checks, `peek` returns the cached catalogue without touching SQLite.
+    """
+
+    def __init__(self, db_path, check_seconds: Optional[float] = None):
+        self.db_path = Path(db_path)
+        self.check_seconds = CHECK_SECONDS if check_seconds is None else check_seconds
+        self._catalogue: Optional[GradeCatalogue] = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.loads = 0
+
+    def peek(self) -> Optional[GradeCatalogue]:
+        """The cached catalogue if it was checked recently, else None (no I/O either way)"""
+        if self._catalogue is not None and time.monotonic() - self._checked_at < self.check_seconds:
+            return self._catalogue
+        return None
+
+    def get(self) -> GradeCatalogue:
+        """Return the catalogue, checking the version and reloading it if it changed"""
+        catalogue = self.peek()
+        if catalogue is not None:
+            return catalogue
+        with self._lock:
+            catalogue = self.peek()
+            if catalogue is not None:
+                return catalogue
+            self.checks += 1
+            if self._catalogue is None or self._read_version() != self._catalogue.version:
+                self._catalogue = GradeCatalogue.load(self.db_path)
+                self.loads += 1
+                print(f"📚 Grade catalogue: loaded {len(self._catalogue)} grades (version {self._catalogue.version})")
+            self._checked_at = time.monotonic()
+            return self._catalogue
+
+    @traced("sqlite.catalogue_version")
+    def _read_version(self) -> int:
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute("SELECT version FROM catalogue_version WHERE id = 1").fetchone()[0]
+
+    def invalidate(self) -> None:
+        """Force a version check on the next lookup"""
+        self._checked_at = float("-inf")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return version checks and reloads for this process"""
+        return {
+            "version": self._catalogue.version if self._catalogue is not None else None,
+            "checks": self.checks,
+            "loads": self.loads,
+        }
+
+
+_caches: Dict[Path, CatalogueCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_catalogue_cache(db_path) -> CatalogueCache:
+    """Return the process-wide catalogue cache for a database file"""
+    key = Path(db_path).resolve()
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = CatalogueCache(key)
+        return _caches[key]
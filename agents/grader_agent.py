@@ -1,15 +1,20 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Optional
 from .base_agent import BaseAgent
-from db.database import EduMarkDatabase
+from .grade_catalogue import CatalogueCache, get_catalogue_cache
+from db.database import EduMarkDatabase, get_database
+import asyncio
 import json
 import ast
 import re
-import sqlite3
 from datetime import datetime
 
 
+# Lowest total_score (0-100) of each grade band, best band first
+BAND_THRESHOLDS = (("Distinction", 70), ("Merit", 60), ("Pass", 40), ("Fail", 0))
+
+
 class GraderAgent(BaseAgent):
-    def __init__(self):
+    def __init__(self, db: Optional[EduMarkDatabase] = None):
         super().__init__(
             name="Grader",
             instructions="""Grade student results with grade bands.
@@ -17,7 +22,16 @@ class GraderAgent(BaseAgent):
             Provide detailed reasoning and compatibility scores.
             Return grades in JSON format with grade, score, and location fields.""",
         )
-        self.db = EduMarkDatabase()
+        self.db = db or get_database()
+        self.catalogues: CatalogueCache = get_catalogue_cache(self.db.db_path)
+
+    @staticmethod
+    def band_for_score(total_score: float) -> str:
+        """Grade band of an analysis score"""
+        for band, lowest in BAND_THRESHOLDS:
+            if total_score >= lowest:
+                return band
+        return "Fail"
 
     async def run(self, messages: list) -> Dict[str, Any]:
         """Grade student results based on available criteria"""
@@ -58,79 +72,25 @@ class GraderAgent(BaseAgent):
             grade_band = "Pass"
 
         print(f" ==>>> Contents: {contents}, Grade Band: {grade_band}")
-        # Search grades database
-        matching_grades = self.search_grades(contents, grade_band)
-
-        # Calculate match scores
-        scored_grades = []
-        for grade in matching_grades:
-            # Calculate match score based on requirements overlap
-            required_grades = set(grade["requirements"])
-            candidate_grades = set(contents)
-            overlap = len(required_grades.intersection(candidate_grades))
-            total_required = len(required_grades)
-            match_score = (
-                int((overlap / total_required) * 100) if total_required > 0 else 0
-            )
-
-            # Lower threshold for matching to 30%
-            if match_score >= 30:  # Include grades with >30% match
-                scored_grades.append(
-                    {
-                        "title": grade['title'],
-                        "match_score": f"{match_score}%",
-                        "location": grade["location"],
-                        "grade_band": grade["grade_band"],
-                        "requirements": grade["requirements"],
-                    }
-                )
-
+        # Score every grade in the band in one sparse operation, keeping scores numeric
+        catalogue = self.catalogues.peek()
+        if catalogue is None:  # an empty catalogue is falsy but still a valid cache hit
+            catalogue = await asyncio.to_thread(self.catalogues.get)
+        top_grades, number_of_grades = catalogue.top_k(contents, grade_band, k=3, min_score=30)  # >=30% match
+        scored_grades = [
+            {
+                "title": grade["title"],
+                "match_score": f"{int(score)}%",
+                "location": grade["location"],
+                "grade_band": grade["grade_band"],
+                "requirements": grade["requirements"],
+            }
+            for grade, score in top_grades
+        ]
         print(f" ==>>> Scored Grades: {scored_grades}")
-        # Sort by match score
-        scored_grades.sort(key=lambda x: int(x["match_score"].rstrip("%")), reverse=True)
 
         return {
-            "graded_results": scored_grades[:3],  # Top 3 grades
+            "graded_results": scored_grades,  # Top 3 grades
             "grade_timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "number_of_grades": len(scored_grades),
+            "number_of_grades": number_of_grades,
         }
-
-    def search_grades(
-        self, contents: List[str], grade_band: str
-    ) -> List[Dict[str, Any]]:
-        """Search grades based on contents and grade level"""
-        query = """
-        SELECT * FROM grades
-        WHERE grade_band = ?
-        AND (
-        """
-        query_conditions = []
-        params = [grade_band]
-
-        # Create LIKE conditions for each content
-        for content in contents:
-            query_conditions.append("requirements LIKE ?")
-            params.append(f"%{content}%")
-
-        query += " OR ".join(query_conditions) + ")"
-
-        try:
-            with sqlite3.connect(self.db.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute(query, params)
-                rows = cursor.fetchall()
-
-                return [
-                    {
-                        "id": row["id"],
-                        "title": row["title"],
-                        "location": row["location"],
-                        "grade_band": row["grade_band"],
-                        "requirements": json.loads(row["requirements"]),
-                    }
-                    for row in rows
-                ]
-        except Exception as e:
-            print(f"Error searching grades: {e}")
-            return []
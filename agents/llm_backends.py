@@ -0,0 +1,295 @@
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, Any, AsyncIterator, List, Optional
+import asyncio
+import itertools
+import json
+import os
+import re
+import time
+from .deadline import remaining
+from .llm_cache import LLMResponseCache
+from .llm_client import estimate_tokens, get_llm_client
+
+
+@dataclass
+class LLMRequest:
+    agent: str
+    model: str
+    instructions: str
+    prompt: str
+    temperature: float
+    max_tokens: int
+    json_mode: bool = False
+
+    def cache_key(self) -> str:
+        return LLMResponseCache.make_key(
+            self.model, self.instructions, self.prompt, self.temperature, self.max_tokens,
+            json_mode=self.json_mode,
+        )
+
+    def completion_kwargs(self) -> Dict[str, Any]:
+        """Arguments for chat.completions.create"""
+        kwargs: Dict[str, Any] = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self.instructions},
+                {"role": "user", "content": self.prompt},
+            ],
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+        if self.json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        left = remaining()
+        if left is not None:
+            # Let the HTTP layer give up no later than the submission deadline
+            kwargs["timeout"] = max(left, 1.0)
+        return kwargs
+
+
+@dataclass
+class LLMResponse:
+    content: str
+    prompt_tokens: int
+    completion_tokens: int
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+class StreamInterruptedError(Exception):
+    """A stream failed after emitting output, so it cannot be transparently retried"""
+
+
+class LLMBackend:
+    """Where BaseAgent sends chat completions"""
+
+    async def complete(self, request: LLMRequest) -> LLMResponse:
+        raise NotImplementedError("Backends must implement complete()")
+
+    async def stream(self, request: LLMRequest) -> AsyncIterator[str]:
+        """Yield the completion as text deltas; by default in a single piece"""
+        response = await self.complete(request)
+        yield response.content
+
+
+class GroqBackend(LLMBackend):
+    """Live Groq API through the shared pooled client"""
+
+    async def complete(self, request: LLMRequest) -> LLMResponse:
+        response = await get_llm_client().chat.completions.create(**request.completion_kwargs())
+        content = response.choices[0].message.content or ""
+        usage = getattr(response, "usage", None)
+        return LLMResponse(
+            content=content,
+            prompt_tokens=usage.prompt_tokens if usage else estimate_tokens(request.instructions + request.prompt),
+            completion_tokens=usage.completion_tokens if usage else estimate_tokens(content),
+        )
+
+
+    async def stream(self, request: LLMRequest) -> AsyncIterator[str]:
+        if request.json_mode:
+            # Groq does not stream JSON mode responses
+            response = await self.complete(request)
+            yield response.content
+            return
+        stream = await get_llm_client().chat.completions.create(**request.completion_kwargs(), stream=True)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+# Canned answers in the shape each agent's prompt asks for
+SYNTHETIC_RESPONSES: Dict[str, Dict[str, Any]] = {
+    "Extractor": {
+        "introduction": "The submission introduces the role of AI in education.",
+        "content": "The body discusses personalised learning and automated assessment.",
+        "references": "Smith (2020); Jones (2021)",
+        "citations": "(Smith, 2020), (Jones, 2021)",
+        "data": "Survey of 120 students",
+        "tables": "Table 1: survey results",
+        "images": "Figure 1: system overview",
+        "recommendations": "Adopt AI tutoring in first-year modules.",
+        "summary": "AI can improve feedback speed and personalisation.",
+    },
+    "EduMark": {
+        "total_score": 68,
+        "grade": "B",
+        "recommendations": ["Expand the literature review", "Justify the survey sample size"],
+        "strengths": ["Clear structure", "Relevant examples"],
+    },
+    "Marker": {
+        "strengths": ["Clear structure", "Relevant examples"],
+        "weaknesses": ["Limited critical analysis", "Few citations"],
+        "grading_details": {
+            "introduction": "7/10",
+            "content": "7/10",
+            "references": "6/10",
+            "citation": "6/10",
+            "data_usage": "6/10",
+            "tables": "5/10",
+            "images": "5/10",
+            "recommendation": "7/10",
+            "summary": "7/10",
+        },
+    },
+}
+
+
+SYNTHETIC_RESPONSES["ExtractAnalyze"] = {
+    "structured_data": SYNTHETIC_RESPONSES["Extractor"],
+    "analysis": SYNTHETIC_RESPONSES["EduMark"],
+}
+
+# Batched analysis prompts list their submissions as "Submission id: <id>" lines
+_BATCH_SUBMISSION_ID = re.compile(r"^Submission id: (\S+)$", re.MULTILINE)
+
+
+def _batch_ids(request: LLMRequest) -> List[str]:
+    return _BATCH_SUBMISSION_ID.findall(request.prompt) if request.agent == "EduMark" else []
+
+
+def synthetic_content(request: LLMRequest) -> str:
+    """Canned answer for the request's agent, with one result per id for batched analyses"""
+    ids = _batch_ids(request)
+    if ids:
+        return json.dumps({"results": [{"id": sid, **SYNTHETIC_RESPONSES["EduMark"]} for sid in ids]})
+    return json.dumps(SYNTHETIC_RESPONSES.get(request.agent, {}))
+
+
+class ReplayBackend(LLMBackend):
+    """Offline backend serving recorded or synthetic responses with simulated latency"""
+
+    def __init__(
+        self,
+        replay_file: Optional[str] = None,
+        latency: Optional[float] = None,
+        tokens_per_second: Optional[float] = None,
+        completion_tokens: Optional[int] = None,
+        synthetic_fallback: bool = True,
+    ):
+        self.latency = latency if latency is not None else float(os.getenv("EDUMARK_LLM_SIMULATED_LATENCY", "0.5"))
+        self.tokens_per_second = tokens_per_second or float(os.getenv("EDUMARK_LLM_SIMULATED_TPS", "250"))
+        self.completion_tokens = completion_tokens
+        self.synthetic_fallback = synthetic_fallback
+        self._by_key: Dict[str, Dict[str, Any]] = {}
+        self._by_agent: Dict[str, List[Dict[str, Any]]] = {}
+        self._agent_cycles: Dict[str, Any] = {}
+        if replay_file and Path(replay_file).exists():
+            self._load(Path(replay_file))
+
+    def _load(self, path: Path) -> None:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self._by_key[record["key"]] = record
+                self._by_agent.setdefault(record["agent"], []).append(record)
+        self._agent_cycles = {agent: itertools.cycle(records) for agent, records in self._by_agent.items()}
+
+    def _lookup(self, request: LLMRequest) -> Dict[str, Any]:
+        record = self._by_key.get(request.cache_key())
+        if record is not None:
+            return record
+        # Prompts carry timestamps and paths, so fall back to any answer the same agent gave.
+        # A recorded single analysis cannot answer a batch, so batches prefer a synthetic answer.
+        if request.agent in self._agent_cycles and not (_batch_ids(request) and self.synthetic_fallback):
+            return next(self._agent_cycles[request.agent])
+        if not self.synthetic_fallback:
+            raise KeyError(f"No recorded response for agent {request.agent}")
+        content = synthetic_content(request)
+        return {"content": content, "completion_tokens": estimate_tokens(content)}
+
+    async def complete(self, request: LLMRequest) -> LLMResponse:
+        record = self._lookup(request)
+        completion_tokens = self.completion_tokens or record.get("completion_tokens") or estimate_tokens(record["content"])
+        await asyncio.sleep(self.latency + completion_tokens / self.tokens_per_second)
+        return LLMResponse(
+            content=record["content"],
+            prompt_tokens=estimate_tokens(request.instructions + request.prompt),
+            completion_tokens=completion_tokens,
+        )
+
+
+    async def stream(self, request: LLMRequest) -> AsyncIterator[str]:
+        record = self._lookup(request)
+        content = record["content"]
+        await asyncio.sleep(self.latency)
+        # Emit roughly one token (4 characters) at a time at the simulated rate
+        for start in range(0, len(content), 4):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield content[start : start + 4]
+
+
+class RecordingBackend(LLMBackend):
+    """Wraps another backend and appends every exchange to a JSONL replay file"""
+
+    def __init__(self, inner: LLMBackend, record_file: str):
+        self.inner = inner
+        self.record_file = Path(record_file)
+        self.record_file.parent.mkdir(parents=True, exist_ok=True)
+
+    async def complete(self, request: LLMRequest) -> LLMResponse:
+        started = time.perf_counter()
+        response = await self.inner.complete(request)
+        self._record(request, response, time.perf_counter() - started)
+        return response
+
+    async def stream(self, request: LLMRequest) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        parts = []
+        async for delta in self.inner.stream(request):
+            parts.append(delta)
+            yield delta
+        content = "".join(parts)
+        response = LLMResponse(
+            content=content,
+            prompt_tokens=estimate_tokens(request.instructions + request.prompt),
+            completion_tokens=estimate_tokens(content),
+        )
+        self._record(request, response, time.perf_counter() - started)
+
+    def _record(self, request: LLMRequest, response: LLMResponse, latency: float) -> None:
+        record = {
+            "key": request.cache_key(),
+            "agent": request.agent,
+            "request": asdict(request),
+            "content": response.content,
+            "prompt_tokens": response.prompt_tokens,
+            "completion_tokens": response.completion_tokens,
+            "latency": round(latency, 4),
+        }
+        with open(self.record_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+_backend: Optional[LLMBackend] = None
+
+
+def _backend_from_env() -> LLMBackend:
+    mode = os.getenv("EDUMARK_LLM_BACKEND", "groq").lower()
+    replay_file = os.getenv("EDUMARK_LLM_REPLAY_FILE", "results/llm_replay.jsonl")
+    if mode == "replay":
+        return ReplayBackend(replay_file)
+    if mode == "synthetic":
+        return ReplayBackend()
+    if mode == "record":
+        return RecordingBackend(GroqBackend(), replay_file)
+    return GroqBackend()
+
+
+def get_llm_backend() -> LLMBackend:
+    """Return the backend selected by EDUMARK_LLM_BACKEND (groq, record, replay, synthetic)"""
+    global _backend
+    if _backend is None:
+        _backend = _backend_from_env()
+    return _backend
+
+
+def set_llm_backend(backend: Optional[LLMBackend]) -> None:
+    """Install a backend for the whole process; None re-reads the environment"""
+    global _backend
+    _backend = backend
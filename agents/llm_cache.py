@@ -0,0 +1,134 @@
+from pathlib import Path
+from typing import Dict, Any, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from .tracing import traced
+
+
+class LLMResponseCache:
+    """On-disk, content-addressed cache of LLM responses"""
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        enabled: Optional[bool] = None,
+    ):
+        self.db_path = Path(db_path or os.getenv("EDUMARK_LLM_CACHE_PATH", ".cache/llm_responses.sqlite"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("EDUMARK_LLM_CACHE_MAX_ENTRIES", "5000"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("EDUMARK_LLM_CACHE_TTL", str(7 * 24 * 3600)))
+        if enabled is None:
+            enabled = os.getenv("EDUMARK_LLM_CACHE", "on").lower() not in ("0", "off", "false", "no")
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        if self.enabled:
+            self._init_db()
+
+    def _init_db(self):
+        """Create the cache table if needed"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    cache_key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_llm_responses_last_accessed ON llm_responses(last_accessed)"
+            )
+
+    @staticmethod
+    def make_key(model: str, instructions: str, prompt: str, temperature: float, max_tokens: int, **extra: Any) -> str:
+        """Hash everything that can change the model output into a cache key"""
+        payload = {
+            "model": model,
+            "instructions": instructions,
+            "prompt": prompt,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            **extra,
+        }
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    @traced("sqlite.llm_cache.get")
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response, or None on a miss or expired entry"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT response, created_at FROM llm_responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl_seconds > 0 and now - row[1] > self.ttl_seconds):
+                self.misses += 1
+                return None
+            conn.execute("UPDATE llm_responses SET last_accessed = ? WHERE cache_key = ?", (now, key))
+        self.hits += 1
+        return row[0]
+
+    @traced("sqlite.llm_cache.set")
+    def set(self, key: str, response: str) -> None:
+        """Store a response and evict expired or least recently used entries"""
+        if not self.enabled:
+            return
+        now = time.time()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO llm_responses (cache_key, response, created_at, last_accessed)
+                   VALUES (?, ?, ?, ?)""",
+                (key, response, now, now),
+            )
+            if self.ttl_seconds > 0:
+                conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            if self.max_entries > 0:
+                conn.execute(
+                    """DELETE FROM llm_responses WHERE cache_key IN (
+                           SELECT cache_key FROM llm_responses
+                           ORDER BY last_accessed DESC LIMIT -1 OFFSET ?
+                       )""",
+                    (self.max_entries,),
+                )
+
+    @traced("sqlite.llm_cache.delete")
+    def delete(self, key: str) -> None:
+        """Drop one entry, e.g. a response that failed validation"""
+        if self.enabled:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("DELETE FROM llm_responses WHERE cache_key = ?", (key,))
+
+    def clear(self) -> None:
+        """Remove every cached response"""
+        if self.enabled:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("DELETE FROM llm_responses")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for this process"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+_cache: Optional[LLMResponseCache] = None
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Return the process-wide response cache"""
+    global _cache
+    if _cache is None:
+        _cache = LLMResponseCache()
+    return _cache
@@ -0,0 +1,71 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from groq import AsyncGroq
+from dotenv import load_dotenv
+from typing import Iterator, List, Optional
+import asyncio
+import httpx
+import os
+import weakref
+
+load_dotenv()
+
+MODEL_NAME = "llama-3.3-70b-versatile"
+
+# One pooled client per event loop. httpx connections are bound to the loop
+# that opened them, and Streamlit starts a fresh loop with every asyncio.run.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncGroq]" = weakref.WeakKeyDictionary()
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    """Create the pooled HTTP transport shared by all agents"""
+    max_connections = int(os.getenv("EDUMARK_LLM_MAX_CONNECTIONS", "20"))
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+    )
+    return httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(120.0, connect=10.0))
+
+
+def get_llm_client() -> AsyncGroq:
+    """Return the process-wide async Groq client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        # Retries are owned by the LLM scheduler, which shares backoff across requests
+        client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), http_client=_build_http_client(), max_retries=0)
+        _clients[loop] = client
+    return client
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) for budgeting"""
+    return max(1, len(text) // 4)
+
+
+# Estimated prompt tokens of each LLM request made in the current context, when counted
+_prompt_tokens: ContextVar[Optional[List[int]]] = ContextVar("edumark_prompt_tokens", default=None)
+
+
+@contextmanager
+def count_prompt_tokens() -> Iterator[List[int]]:
+    """Collect the prompt size (instructions and prompt) of every LLM request made in the block"""
+    counts: List[int] = []
+    token = _prompt_tokens.set(counts)
+    try:
+        yield counts
+    finally:
+        _prompt_tokens.reset(token)
+
+
+def record_prompt_tokens(tokens: int) -> None:
+    counts = _prompt_tokens.get()
+    if counts is not None:
+        counts.append(tokens)
+
+
+async def close_llm_client() -> None:
+    """Close the client bound to the running event loop, if any"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
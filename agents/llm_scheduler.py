@@ -0,0 +1,242 @@
+from typing import Any, Awaitable, Callable, Deque, Optional, Tuple, TypeVar
+from collections import deque
+from groq import APIConnectionError
+from .deadline import DeadlineExceeded, remaining, sleep_within_deadline, within_deadline
+from .tracing import current_span
+import asyncio
+import os
+import random
+import threading
+import time
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Continuously refilling token bucket expressed as a per-minute rate.
+
+    Safe to share between event loops on different threads.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        """Wait until `amount` tokens are available and take them"""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            await sleep_within_deadline(wait)
+
+    def refund(self, amount: float) -> None:
+        """Return unused tokens reserved by an earlier acquire"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AdaptiveConcurrencyLimiter:
+    """Semaphore whose limit shrinks on throttling and grows on success (AIMD).
+
+    Waiters may belong to different event loops (each Streamlit session runs its own
+    asyncio.run on its own thread). Slots are handed out under a lock, and each waiter
+    is woken on its own loop with call_soon_threadsafe.
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 32):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(initial, maximum))
+        self._in_flight = 0
+        self._successes = 0
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._lock = threading.Lock()
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._in_flight < self.limit and not self._waiters:
+                self._in_flight += 1
+                return
+            entry = (loop, loop.create_future())
+            self._waiters.append(entry)
+        try:
+            await entry[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = entry not in self._waiters
+                if not granted:
+                    self._waiters.remove(entry)
+            if granted:
+                # The slot was handed to us just before we were cancelled
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._wake()
+
+    def _wake(self) -> None:
+        """Hand free slots to waiters in order; call with the lock held"""
+        while self._waiters and self._in_flight < self.limit:
+            loop, waiter = self._waiters.popleft()
+            self._in_flight += 1
+            try:
+                loop.call_soon_threadsafe(self._grant, waiter)
+            except RuntimeError:
+                # Its loop has closed, so nobody is waiting any more
+                self._in_flight -= 1
+
+    @staticmethod
+    def _grant(waiter: asyncio.Future) -> None:
+        if not waiter.done():
+            waiter.set_result(None)
+
+    def on_success(self) -> None:
+        """Additive increase: one extra slot per `limit` consecutive successes"""
+        with self._lock:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self._successes = 0
+                self._wake()
+
+    def on_throttle(self) -> None:
+        """Multiplicative decrease after a rate-limit response"""
+        with self._lock:
+            self.limit = max(self.minimum, self.limit // 2)
+            self._successes = 0
+
+
+class LLMScheduler:
+    """Process-wide gate in front of every LLM request, shared by every event loop"""
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        initial_concurrency: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+    ):
+        rpm = requests_per_minute or float(os.getenv("EDUMARK_LLM_RPM", "30"))
+        tpm = tokens_per_minute or float(os.getenv("EDUMARK_LLM_TPM", "12000"))
+        self.request_bucket = TokenBucket(rpm)
+        self.token_bucket = TokenBucket(tpm)
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("EDUMARK_LLM_MAX_RETRIES", "5"))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        maximum = max_concurrency or int(os.getenv("EDUMARK_LLM_MAX_CONCURRENCY", "16"))
+        self.limiter = AdaptiveConcurrencyLimiter(initial_concurrency or min(4, maximum), maximum=maximum)
+        self._paused_until = 0.0
+        self.throttled = 0
+        self.retries = 0
+
+    async def submit(self, call: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """Run `call` under the rate limits, retrying throttled and transient failures"""
+        attempt = 0
+        while True:
+            await self._wait_for_pause()
+            await self.limiter.acquire()
+            reserved = 0
+            try:
+                await self.request_bucket.acquire(1)
+                await self.token_bucket.acquire(tokens)
+                reserved = tokens
+                result = await within_deadline(call())
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                # A failed attempt produced no completion; its reservation is not spent
+                self.refund_tokens(reserved)
+                status = getattr(e, "status_code", None)
+                throttled = status == 429
+                retryable = throttled or status in RETRYABLE_STATUS_CODES or isinstance(e, APIConnectionError)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_after(e)
+                if delay is None:
+                    delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                left = remaining()
+                if left is not None and delay >= left:
+                    # No time for another attempt; surface the real error
+                    raise
+                if throttled:
+                    self.throttled += 1
+                    self.limiter.on_throttle()
+                    # Everyone waits out a 429, not just the request that saw it
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                attempt += 1
+                self.retries += 1
+                current_span().add("retries")
+                if throttled:
+                    current_span().add("throttled")
+                print(f"⏳ LLM request failed ({status or type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            else:
+                self.limiter.on_success()
+                return result
+            finally:
+                self.limiter.release()
+            if not throttled:
+                await sleep_within_deadline(delay)
+
+    def refund_tokens(self, amount: int) -> None:
+        """Give back the part of a token reservation the request did not use"""
+        if amount > 0:
+            self.token_bucket.refund(amount)
+
+    async def _wait_for_pause(self) -> None:
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await sleep_within_deadline(delay)
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        """Read the server's retry hint in seconds, if it sent one"""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+            value: Any = headers.get(header)
+            if value is None:
+                continue
+            try:
+                return max(0.0, float(value) * scale)
+            except (TypeError, ValueError):
+                continue
+        return None
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Return the scheduler shared by all submissions in the process"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler()
+    return _scheduler
+
+
+def set_llm_scheduler(scheduler: Optional[LLMScheduler]) -> None:
+    """Install a scheduler for the whole process; None rebuilds one from the environment"""
+    global _scheduler
+    _scheduler = scheduler
@@ -1,9 +1,20 @@
 from typing import Dict, Any
 from .base_agent import BaseAgent
+from .schemas import MARKING_SCHEMA
 from datetime import datetime
+import json
+
+
+MARKING_PROMPT = """Mark the student paper based on the following context:
+{context}
+
+Provide a JSON report structured as:
+{{"strengths": ["strength1", "strength2"], "weaknesses": ["weakness1", "weakness2"], "grading_details": {{"introduction": "score/10", "content": "score/10", "references": "score/10", "citation": "score/10", "data_usage": "score/10", "tables": "score/10", "images": "score/10", "recommendation": "score/10", "summary": "score/10"}}}}"""
 
 
 class ScreenerAgent(BaseAgent):
+    response_schema = MARKING_SCHEMA
+
     def __init__(self):
         super().__init__(
             name="Marker",
@@ -48,34 +59,16 @@ class ScreenerAgent(BaseAgent):
             }
 
         # Query Llama for detailed marking
-        marking_prompt = f"""
-        Mark the student paper based on the following context:
-        {workflow_context}
-
-        Provide a JSON report structured as:
-        {{
-            "strengths": ["strength1", "strength2"],
-            "weaknesses": ["weakness1", "weakness2"],
-            "grading_details": {{
-                "introduction": "score/10",
-                "content": "score/10",
-                "references": "score/10",
-                "citation": "score/10",
-                "data_usage": "score/10",
-                "tables": "score/10",
-                "images": "score/10",
-                "recommendation": "score/10",
-                "summary": "score/10"
-            }}
-        }}
-        """
-        marking_results = self._query_llama(marking_prompt)
+        marking_prompt = MARKING_PROMPT.format(context=workflow_context)
+        marking_details = await self._query_json(marking_prompt)
+        marking_results = json.dumps(marking_details, indent=2)
 
         # Dynamically calculate the score
         student_score = self._calculate_score(workflow_context)
 
         return {
             "marking_report": marking_results,
+            "marking_details": marking_details,
             "marking_timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "student_score": student_score,
         }
@@ -1,93 +1,274 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from db.checkpoints import CheckpointStore
+from db.database import EduMarkDatabase, get_database
 from .base_agent import BaseAgent
 from .extractor_agent import ExtractorAgent
+from .fused_agent import ExtractAnalyzeAgent
 from .analyzer_agent import EduMarkAgent
 from .grader_agent import GraderAgent
+from .pregrader import PreGrader
 from .marker_agent import ScreenerAgent
 from .recommender_agent import RecommenderAgent
+from .pipeline import Stage, StageGraph
+from .deadline import DeadlineExceeded, deadline_scope, within_deadline
+from .llm_client import count_prompt_tokens
+from .progress import ProgressCallback, emit_progress, progress_listener, stage_scope
+from .tracing import trace_span
+import asyncio
+import hashlib
+import os
+import time
+
+# "split": separate extraction and analysis calls; "fused": one combined call
+PIPELINE_MODE = os.getenv("EDUMARK_PIPELINE_MODE", "split")
+# Time budget for one submission in seconds (0 disables it)
+SUBMISSION_DEADLINE = float(os.getenv("EDUMARK_SUBMISSION_DEADLINE", "300"))
+
+
+def _project_submission(submission_data: Dict[str, Any]) -> Dict[str, Any]:
+    # student_id lets the extractor flag files already submitted under another ID
+    return {key: submission_data[key] for key in ("file_path", "text", "student_id") if key in submission_data}
+
+
+def _project_extraction(extracted_data: Dict[str, Any]) -> Dict[str, Any]:
+    # The analyzer only reads structured_data; raw_text is the bulk of the payload
+    return {"structured_data": extracted_data.get("structured_data", {})}
+
+
+def _project_grading(context: Dict[str, Any]) -> Dict[str, Any]:
+    # GraderAgent matches the sections the submission has against the catalogue, within its band
+    structured_data = context.get("extracted_data", {}).get("structured_data", {})
+    analysis = context.get("analysis_results", {}).get("student_analysis", {})
+    return {"result_analysis": {
+        "contents": PreGrader.present_sections(structured_data),
+        "grade_band": GraderAgent.band_for_score(analysis.get("total_score", 0)),
+    }}
+
+
+def _project_marking(context: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "structured_data": context["extracted_data"].get("structured_data", {}),
+        "student_analysis": context["analysis_results"].get("student_analysis", {}),
+    }
+
+
+def _project_recommendation(context: Dict[str, Any]) -> Dict[str, Any]:
+    # RecommenderAgent reads strengths and weaknesses; the analysis and the marking report supply them
+    analysis = context.get("analysis_results", {}).get("student_analysis", {})
+    marking = context.get("marking_results", {}).get("marking_details", {})
+    return {"strengths": analysis.get("strengths", []), "weaknesses": marking.get("weaknesses", [])}
 
 
 class OrchestratorAgent(BaseAgent):
-    def __init__(self):
+    def __init__(self, db: Optional[EduMarkDatabase] = None, mode: Optional[str] = None, project_inputs: bool = True):
         super().__init__(
             name="Orchestrator",
             instructions="""Coordinate the grading workflow and delegate tasks to specialized agents.
             Ensure proper flow of information between extraction, analysis, grading, marking, and recommendation phases.
             Maintain context and aggregate results from each stage.""",
         )
+        self.mode = mode or PIPELINE_MODE
+        # False hands every stage its whole unprojected input, to measure what projection saves
+        self.project_inputs = project_inputs
+        if self.mode not in ("split", "fused"):
+            raise ValueError(f"Unknown pipeline mode '{self.mode}'")
+        self.db = db or get_database()
+        self.checkpoints = CheckpointStore(self.db.db_path)
         self._setup_agents()
 
     def _setup_agents(self):
         """Initialize all specialized agents"""
         self.extractor = ExtractorAgent()
         self.analyzer = EduMarkAgent()
-        self.matcher = GraderAgent()
+        self.matcher = GraderAgent(db=self.db)
         self.screener = ScreenerAgent()
         self.recommender = RecommenderAgent()
+        self.fused = ExtractAnalyzeAgent(self.extractor, self.analyzer)
+        self.stage_graph = self._build_stage_graph()
+
+    def _build_stage_graph(self) -> StageGraph:
+        """Declare which stages feed which; independent stages run concurrently"""
+        if self.mode == "fused":
+            # Extraction and analysis share one LLM round-trip
+            front = [
+                Stage("extract_analyze", self.fused, (), lambda ctx: ctx["submission_data"],
+                      None, _project_submission),
+            ]
+            extraction = analysis = "extract_analyze"
+        else:
+            front = [
+                Stage("extraction", self.extractor, (), lambda ctx: ctx["submission_data"],
+                      "extracted_data", _project_submission),
+                Stage("analysis", self.analyzer, ("extraction",), lambda ctx: ctx["extracted_data"],
+                      "analysis_results", _project_extraction),
+            ]
+            extraction, analysis = "extraction", "analysis"
+        stages = front + [
+            # Grading is a local SQLite lookup on the analysis, so it overlaps with marking
+            Stage("grading", self.matcher, (analysis,), lambda ctx: dict(ctx),
+                  "grading_results", _project_grading),
+            Stage("marking", self.screener, tuple(dict.fromkeys((extraction, analysis))), lambda ctx: dict(ctx),
+                  "marking_results", _project_marking),
+            Stage("recommendation", self.recommender, ("grading", "marking"), lambda ctx: dict(ctx),
+                  "final_recommendation", _project_recommendation),
+        ]
+        if not self.project_inputs:
+            for stage in stages:
+                stage.project = None
+        return StageGraph(stages)
 
     async def run(self, messages: list) -> Dict[str, Any]:
         """Process a single message through the orchestrator"""
         prompt = messages[-1]["content"]
-        response = self._query_llama(prompt)
+        response = await self._query_llama(prompt)
         return self._parse_json_safely(response)
 
-    async def process_student_submission(self, submission_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Main workflow orchestrator for processing student submissions"""
+    async def _run_stage(
+        self, stage: str, agent: BaseAgent, payload: Any, prompt_tokens: Optional[Dict[str, int]] = None
+    ) -> Dict[str, Any]:
+        """Run one agent, reporting start, streamed output and completion for `stage`.
+
+        The estimated prompt tokens of the LLM requests the stage made are added to `prompt_tokens`.
+        """
+        content = str(payload)
+        with stage_scope(stage), trace_span(f"stage.{stage}", agent=agent.name, input_bytes=len(content)) as span, \
+                count_prompt_tokens() as counts:
+            emit_progress("stage_started")
+            result = await agent.run([{"role": "user", "content": content}])
+            span.set(output_bytes=len(str(result)), prompt_tokens=sum(counts))
+            emit_progress("stage_completed", result)
+        if prompt_tokens is not None:
+            prompt_tokens[stage] = sum(counts)
+        return result
+
+    @staticmethod
+    def submission_run_id(submission_data: Dict[str, Any]) -> str:
+        """Stable ID for a submission: the same student and file content resume the same run"""
+        if submission_data.get("run_id"):
+            return submission_data["run_id"]
+        digest = hashlib.sha256(str(submission_data.get("student_id", "")).encode("utf-8"))
+        file_path = submission_data.get("file_path")
+        if file_path:
+            with open(file_path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        else:
+            digest.update(submission_data.get("text", "").encode("utf-8"))
+        return digest.hexdigest()
+
+    async def process_student_submission(
+        self,
+        submission_data: Dict[str, Any],
+        on_progress: Optional[ProgressCallback] = None,
+        deadline_seconds: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Main workflow orchestrator for processing student submissions.
+
+        Every stage and LLM call shares one deadline. When it expires, running stages are
+        cancelled and a partial result with status "timed_out" is returned; completed stages
+        stay checkpointed so a retry resumes after them. Checkpoints of a completed run are
+        kept too, until the caller has saved the result and calls clear_checkpoints.
+        """
         print("🎯 Orchestrator: Starting grading workflow")
 
+        run_id = self.submission_run_id(submission_data)
+        budget = SUBMISSION_DEADLINE if deadline_seconds is None else deadline_seconds
+        with trace_span("submission", run_id=run_id, student_id=submission_data.get("student_id", "")) as span, \
+                deadline_scope(budget):
+            result = await self._process(submission_data, run_id, on_progress)
+            span.set(status=result["status"], resumed_stages=len(result.get("resumed_stages", [])))
+            return result
+
+    async def _process(
+        self, submission_data: Dict[str, Any], run_id: str, on_progress: Optional[ProgressCallback]
+    ) -> Dict[str, Any]:
         workflow_context = {
             "submission_data": submission_data,
+            "run_id": run_id,
             "status": "initiated",
-            "current_stage": "extraction",
+            "current_stage": self.stage_graph.order[0],
+            "pipeline_mode": self.mode,
         }
 
+        # Resume from the first incomplete stage of an earlier failed attempt
+        checkpoints = await asyncio.to_thread(self.checkpoints.load, run_id)
+        resumed = [name for name in self.stage_graph.order if name in checkpoints]
+        for name in resumed:
+            workflow_context.update(checkpoints[name])
+        if resumed:
+            workflow_context["completed_stages"] = list(resumed)
+            workflow_context["resumed_stages"] = resumed
+            print(f"♻️ Orchestrator: Resuming run {run_id[:12]} after {', '.join(resumed)}")
+
+        async def save_checkpoint(stage: str, updates: Dict[str, Any]) -> None:
+            await asyncio.to_thread(self.checkpoints.save, run_id, stage, updates)
+
+        prompt_tokens: Dict[str, int] = {}
         try:
-            # Step 1: Extract relevant information from the submission
-            extracted_data = await self.extractor.run(
-                [{"role": "user", "content": str(submission_data)}]
-            )
-            workflow_context.update(
-                {"extracted_data": extracted_data, "current_stage": "analysis"}
-            )
-
-            # Step 2: Analyze the extracted data
-            analysis_results = await self.analyzer.run(
-                [{"role": "user", "content": str(extracted_data)}]
-            )
-            workflow_context.update(
-                {"analysis_results": analysis_results, "current_stage": "grading"}
-            )
-
-            # Step 3: Grade the submission based on predefined bands
-            grading_results = await self.matcher.run(
-                [{"role": "user", "content": str(analysis_results)}]
-            )
-            workflow_context.update(
-                {"grading_results": grading_results, "current_stage": "marking"}
-            )
-
-            # Step 4: Mark the submission with detailed feedback
-            marking_results = await self.screener.run(
-                [{"role": "user", "content": str(workflow_context)}]
-            )
-            workflow_context.update(
-                {
-                    "marking_results": marking_results,
-                    "current_stage": "recommendation",
-                }
-            )
-
-            # Step 5: Provide tailored recommendations based on the marking results
-            final_recommendation = await self.recommender.run(
-                [{"role": "user", "content": str(workflow_context)}]
-            )
-            workflow_context.update(
-                {"final_recommendation": final_recommendation, "status": "completed"}
-            )
+            with progress_listener(on_progress):
+                started = time.perf_counter()
+                timings = await within_deadline(self.stage_graph.run(
+                    workflow_context,
+                    lambda stage, payload: self._run_stage(stage.name, stage.agent, payload, prompt_tokens),
+                    completed=resumed,
+                    on_stage_done=save_checkpoint,
+                ))
+                wall_seconds = time.perf_counter() - started
+            workflow_context["status"] = "completed"
+            workflow_context["pipeline_metrics"] = self._pipeline_metrics(timings, wall_seconds, prompt_tokens)
+            return workflow_context
 
+        except DeadlineExceeded as e:
+            self._mark_partial(workflow_context, "timed_out", str(e))
+            print(f"⌛ Orchestrator: Deadline reached after {workflow_context['completed_stages']}")
             return workflow_context
 
+        except asyncio.CancelledError:
+            # The caller went away (user left the page, worker lost its lease); stop all stages
+            self._mark_partial(workflow_context, "cancelled", "Cancelled")
+            print(f"🛑 Orchestrator: Cancelled after {workflow_context['completed_stages']}")
+            raise
+
         except Exception as e:
             workflow_context.update({"status": "failed", "error": str(e)})
             print(f"🚨 Error during workflow: {e}")
             raise
+
+    def clear_checkpoints(self, run_id: str) -> None:
+        """Forget a run's stage outputs once its result has been saved durably"""
+        self.checkpoints.clear(run_id)
+
+    def _mark_partial(self, workflow_context: Dict[str, Any], status: str, error: str) -> None:
+        """Record which stages finished before the run stopped"""
+        completed = workflow_context.setdefault("completed_stages", [])
+        workflow_context.update({
+            "status": status,
+            "error": error,
+            "pending_stages": [name for name in self.stage_graph.order if name not in completed],
+        })
+
+    def _pipeline_metrics(
+        self, timings: Dict[str, Dict[str, float]], wall_seconds: float, prompt_tokens: Dict[str, int]
+    ) -> Dict[str, Any]:
+        """Summarise stage timings and what running independent stages concurrently saved.
+
+        stage_input_tokens gives each stage's (projected) input message and the prompt tokens
+        its LLM requests actually carried (0 for local stages).
+        """
+        path, path_seconds = self.stage_graph.critical_path(timings)
+        serial_seconds = sum(t.get("duration", 0.0) for t in timings.values())
+        metrics = {
+            "stage_seconds": {name: round(t.get("duration", 0.0), 3) for name, t in timings.items()},
+            "stage_input_tokens": {
+                name: {"input": t["input_tokens"], "prompt": prompt_tokens.get(name, 0)}
+                for name, t in timings.items()
+            },
+            "critical_path": path,
+            "critical_path_seconds": round(path_seconds, 3),
+            "serial_seconds": round(serial_seconds, 3),
+            "wall_seconds": round(wall_seconds, 3),
+            "concurrency_saved_seconds": round(max(0.0, serial_seconds - wall_seconds), 3),
+        }
+        print(f"⏱️ Orchestrator: critical path {' → '.join(path)} took {metrics['critical_path_seconds']}s "
+              f"(serial {metrics['serial_seconds']}s, wall {metrics['wall_seconds']}s)")
+        return metrics
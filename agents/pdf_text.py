@@ -0,0 +1,390 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from pathlib import Path
+from typing import Dict, Any, AsyncIterator, Iterable, Iterator, List, Optional, Tuple
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams, LTContainer, LTPage, LTText, LTTextBox
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+import asyncio
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from .tracing import traced
+
+# Pages beyond this are not parsed when a document is loaded whole (0 parses every page).
+# Streamed documents are never capped: their memory stays bounded at any length
+MAX_PAGES = int(os.getenv("EDUMARK_PDF_MAX_PAGES", "200"))
+# Worker processes for page-range extraction
+PDF_WORKERS = int(os.getenv("EDUMARK_PDF_WORKERS", str(os.cpu_count() or 1)))
+# Every range re-reads the document's cross-reference table, so small ranges are not worth it
+MIN_PAGES_PER_TASK = 4
+# Page range size when streaming; at most one range per worker is held in memory
+STREAM_RANGE_PAGES = 8
+# How page text is produced; cached text is only reused for the same mode and page limit
+TEXT_MODE = "pdfminer.text/laparams=default"
+
+
+def file_sha256(file_path: str) -> str:
+    """Hash a file's bytes without reading it into memory at once"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _LayoutTextConverter(TextConverter):
+    """TextConverter that also records where each text box of the page sits.
+
+    The text is rendered exactly as TextConverter renders it. `layout` then holds the
+    page size and, per text box, its bounding box and the slice of the page text it produced.
+    """
+
+    layout: Optional[Dict[str, Any]] = None
+
+    def receive_layout(self, ltpage: LTPage) -> None:
+        parts: List[str] = []
+        boxes: List[List[float]] = []
+        length = 0
+
+        def write(text: str) -> None:
+            nonlocal length
+            parts.append(text)
+            length += len(text)
+
+        def render(item) -> None:
+            start = length
+            if isinstance(item, LTContainer):
+                for child in item:
+                    render(child)
+            elif isinstance(item, LTText):
+                write(item.get_text())
+            if isinstance(item, LTTextBox):
+                write("\n")
+                boxes.append([*(round(value, 1) for value in item.bbox), start, length])
+
+        render(ltpage)
+        write("\f")
+        self.write_text("".join(parts))
+        self.layout = {"width": round(ltpage.width, 1), "height": round(ltpage.height, 1), "boxes": boxes}
+
+
+def iter_pages(
+    file_path: str, page_numbers: Optional[Iterable[int]] = None, caching: bool = True
+) -> Iterator[Tuple[str, Dict[str, Any], float]]:
+    """Yield (text, layout, seconds) for each page, parsing one page at a time.
+
+    This is what pdfminer's extract_text does, but the output buffer is emptied after
+    every page. With caching off, parsed objects are not kept for the life of the
+    document, so memory does not grow with page count.
+    """
+    with open(file_path, "rb") as fp:
+        resources = PDFResourceManager(caching=caching)
+        output = StringIO()
+        device = _LayoutTextConverter(resources, output, laparams=LAParams())
+        interpreter = PDFPageInterpreter(resources, device)
+        wanted = set(page_numbers) if page_numbers is not None else None
+        for page in PDFPage.get_pages(fp, wanted, caching=caching):
+            started = time.perf_counter()
+            interpreter.process_page(page)
+            text = output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+            # TextConverter ends every page with a form feed
+            yield (text[:-1] if text.endswith("\f") else text), device.layout, time.perf_counter() - started
+        device.close()
+
+
+def count_pages(file_path: str) -> int:
+    """Count pages from the page tree without parsing their content"""
+    with open(file_path, "rb") as fp:
+        return sum(1 for _ in PDFPage.get_pages(fp))
+
+
+def _extract_page_range(
+    file_path: str, first: int, last: int, caching: bool = True
+) -> List[Tuple[str, Dict[str, Any], float]]:
+    """Process pool task: text, layout and timing for pages [first, last)"""
+    return list(iter_pages(file_path, range(first, last), caching))
+
+
+def _capped_page_count(total_pages: int, max_pages: Optional[int]) -> int:
+    cap = MAX_PAGES if max_pages is None else max_pages
+    return min(total_pages, cap) if cap > 0 else total_pages
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _pool_context():
+    # Never fork: the app and the workers are multithreaded, and a forked child can inherit
+    # a lock some other thread held at that moment and deadlock
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def get_pdf_executor() -> ProcessPoolExecutor:
+    """Return the process pool that parses PDFs off the event loop"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=max(1, PDF_WORKERS), mp_context=_pool_context())
+    return _executor
+
+
+async def pdf_page_count(file_path: str) -> int:
+    """Count a PDF's pages in the process pool"""
+    return await asyncio.get_running_loop().run_in_executor(get_pdf_executor(), count_pages, file_path)
+
+
+async def extract_pdf_pages(
+    file_path: str, max_pages: Optional[int] = None, total_pages: Optional[int] = None
+) -> Tuple[List[str], List[Dict[str, Any]], Dict[str, Any]]:
+    """Extract page texts in parallel page ranges across the process pool.
+
+    Pages come back in document order whatever order the ranges finish in. Returns the
+    page texts, their layouts and extraction metrics, including how long each page took.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_pdf_executor()
+    started = time.perf_counter()
+
+    if total_pages is None:
+        total_pages = await pdf_page_count(file_path)
+    page_count = _capped_page_count(total_pages, max_pages)
+    per_task = max(MIN_PAGES_PER_TASK, math.ceil(page_count / max(1, PDF_WORKERS)))
+    ranges = [(first, min(first + per_task, page_count)) for first in range(0, page_count, per_task)]
+
+    results = await asyncio.gather(
+        *(loop.run_in_executor(executor, _extract_page_range, file_path, first, last) for first, last in ranges)
+    )
+    pages = [text for result in results for text, _, _ in result]
+    layouts = [layout for result in results for _, layout, _ in result]
+    page_seconds = [round(seconds, 4) for result in results for _, _, seconds in result]
+
+    metrics = {
+        "pages": total_pages,
+        "pages_extracted": len(pages),
+        "truncated": page_count < total_pages,
+        "tasks": len(ranges),
+        "extract_seconds": round(time.perf_counter() - started, 3),
+        "page_seconds": page_seconds,
+    }
+    return pages, layouts, metrics
+
+
+async def stream_pdf_pages(
+    file_path: str, total_pages: int, metrics: Dict[str, Any], max_pages: Optional[int] = None
+) -> AsyncIterator[str]:
+    """Yield page texts in document order while later ranges are parsed in the pool.
+
+    At most one range per worker is in flight or buffered, so memory stays bounded however
+    long the document is, and every page is parsed unless `max_pages` says otherwise.
+    `metrics` is filled in as the stream is consumed.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_pdf_executor()
+    started = time.perf_counter()
+    page_count = _capped_page_count(total_pages, 0 if max_pages is None else max_pages)
+    ranges = iter([(first, min(first + STREAM_RANGE_PAGES, page_count))
+                   for first in range(0, page_count, STREAM_RANGE_PAGES)])
+    in_flight: deque = deque()
+    page_seconds: List[float] = []
+
+    def submit_next() -> None:
+        page_range = next(ranges, None)
+        if page_range is not None:
+            in_flight.append(loop.run_in_executor(executor, _extract_page_range, file_path, *page_range, False))
+
+    for _ in range(max(1, PDF_WORKERS)):
+        submit_next()
+    try:
+        while in_flight:
+            result = await in_flight.popleft()
+            submit_next()
+            for text, _, seconds in result:
+                page_seconds.append(round(seconds, 4))
+                yield text
+    finally:
+        for future in in_flight:
+            future.cancel()
+        metrics.update({
+            "pages": total_pages,
+            "pages_extracted": len(page_seconds),
+            "truncated": page_count < total_pages,
+            "tasks": math.ceil(page_count / STREAM_RANGE_PAGES),
+            "extract_seconds": round(time.perf_counter() - started, 3),
+            "page_seconds": page_seconds,
+            "streamed": True,
+        })
+
+
+class PDFTextCache:
+    """On-disk cache of extracted PDF text and page layout, keyed by the SHA-256 of the
+    file bytes, the page limit it was extracted under and TEXT_MODE.
+
+    It also records which student IDs submitted each file, so identical uploads under
+    different IDs can be flagged.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        max_entries: Optional[int] = None,
+        enabled: Optional[bool] = None,
+    ):
+        self.db_path = Path(db_path or os.getenv("EDUMARK_PDF_CACHE_PATH", ".cache/pdf_text.sqlite"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("EDUMARK_PDF_CACHE_MAX_ENTRIES", "500"))
+        if enabled is None:
+            enabled = os.getenv("EDUMARK_PDF_CACHE", "on").lower() not in ("0", "off", "false", "no")
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        if self.enabled:
+            self._init_db()
+
+    def _init_db(self):
+        """Create the text and submitter tables if needed"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pdf_page_text (
+                    sha256 TEXT NOT NULL,
+                    max_pages INTEGER NOT NULL,
+                    mode TEXT NOT NULL,
+                    pages TEXT NOT NULL,
+                    layouts TEXT,
+                    chars INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL,
+                    PRIMARY KEY (sha256, max_pages, mode)
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_pdf_page_text_last_accessed ON pdf_page_text(last_accessed)"
+            )
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pdf_submitters (
+                    sha256 TEXT NOT NULL,
+                    student_id TEXT NOT NULL,
+                    first_seen REAL NOT NULL,
+                    PRIMARY KEY (sha256, student_id)
+                )
+            """)
+
+    @staticmethod
+    def _key(sha256: str, max_pages: Optional[int]) -> Tuple[str, int, str]:
+        return sha256, MAX_PAGES if max_pages is None else max_pages, TEXT_MODE
+
+    @traced("sqlite.pdf_cache.get")
+    def get(self, sha256: str, max_pages: Optional[int] = None) -> Optional[List[str]]:
+        """Return the per-page text cached for a file under this page limit, or None on a miss"""
+        row = self._lookup("pages", sha256, max_pages)
+        return json.loads(row) if row is not None else None
+
+    @traced("sqlite.pdf_cache.get_layouts")
+    def get_layouts(self, sha256: str, max_pages: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """Return the per-page layout cached for a file, or None on a miss or when none was stored"""
+        row = self._lookup("layouts", sha256, max_pages)
+        return json.loads(row) if row is not None else None
+
+    def _lookup(self, column: str, sha256: str, max_pages: Optional[int]) -> Optional[str]:
+        if not self.enabled:
+            return None
+        key = self._key(sha256, max_pages)
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                f"SELECT {column} FROM pdf_page_text WHERE sha256 = ? AND max_pages = ? AND mode = ?", key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute(
+                "UPDATE pdf_page_text SET last_accessed = ? WHERE sha256 = ? AND max_pages = ? AND mode = ?",
+                (time.time(), *key),
+            )
+        self.hits += 1
+        return row[0]
+
+    @traced("sqlite.pdf_cache.set")
+    def set(
+        self,
+        sha256: str,
+        pages: List[str],
+        max_pages: Optional[int] = None,
+        layouts: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        """Store a file's per-page text and layout and evict the least recently used entries"""
+        if not self.enabled:
+            return
+        now = time.time()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO pdf_page_text
+                       (sha256, max_pages, mode, pages, layouts, chars, created_at, last_accessed)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (*self._key(sha256, max_pages), json.dumps(pages, ensure_ascii=False),
+                 json.dumps(layouts) if layouts is not None else None,
+                 sum(len(page) for page in pages), now, now),
+            )
+            if self.max_entries > 0:
+                conn.execute(
+                    """DELETE FROM pdf_page_text WHERE rowid IN (
+                           SELECT rowid FROM pdf_page_text
+                           ORDER BY last_accessed DESC LIMIT -1 OFFSET ?
+                       )""",
+                    (self.max_entries,),
+                )
+
+    @traced("sqlite.pdf_cache.record_submitter")
+    def record_submitter(self, sha256: str, student_id: str) -> List[str]:
+        """Remember that `student_id` submitted this file; return the other IDs that did too"""
+        if not self.enabled or not student_id:
+            return []
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO pdf_submitters (sha256, student_id, first_seen) VALUES (?, ?, ?)",
+                (sha256, student_id, time.time()),
+            )
+            rows = conn.execute(
+                "SELECT student_id FROM pdf_submitters WHERE sha256 = ? AND student_id != ? ORDER BY first_seen",
+                (sha256, student_id),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def clear(self) -> None:
+        """Remove every cached text and submitter record"""
+        if self.enabled:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("DELETE FROM pdf_page_text")
+                conn.execute("DELETE FROM pdf_submitters")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for this process"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+_cache: Optional[PDFTextCache] = None
+
+
+def get_pdf_text_cache() -> PDFTextCache:
+    """Return the process-wide PDF text cache"""
+    global _cache
+    if _cache is None:
+        _cache = PDFTextCache()
+    return _cache
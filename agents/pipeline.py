@@ -0,0 +1,133 @@
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import time
+from .base_agent import BaseAgent
+from .llm_client import estimate_tokens
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+@dataclass
+class Stage:
+    name: str
+    agent: BaseAgent
+    deps: Tuple[str, ...]
+    # Builds the agent's input from the workflow context once all deps are done
+    build_input: Callable[[Dict[str, Any]], Any]
+    # Context key for the result; None merges a dict result into the context
+    context_key: Optional[str] = None
+    # Narrows the input to the fields the agent actually reads
+    project: Optional[Callable[[Any], Any]] = None
+
+
+class StageGraph:
+    """Declared stage DAG that runs every stage as soon as its inputs are ready"""
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        state: Dict[str, str] = {}
+
+        def visit(name: str) -> None:
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Stage graph has a cycle through '{name}'")
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage dependency '{name}'")
+            state[name] = "visiting"
+            for dep in self.stages[name].deps:
+                visit(dep)
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    async def run(
+        self,
+        context: Dict[str, Any],
+        run_stage: Callable[[Stage, Any], Awaitable[Any]],
+        completed: Optional[List[str]] = None,
+        on_stage_done: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None,
+    ) -> Dict[str, Dict[str, float]]:
+        """Run all stages not in `completed`, returning per-stage timings in seconds.
+
+        `on_stage_done(name, updates)` receives the context updates of each stage as it finishes.
+        """
+        done = set(completed or [])
+        timings: Dict[str, Dict[str, float]] = {}
+        running: Dict[asyncio.Task, str] = {}
+        started_at = time.perf_counter()
+
+        def launch_ready() -> None:
+            for name in self.order:
+                stage = self.stages[name]
+                if name in done or name in running.values():
+                    continue
+                if all(dep in done for dep in stage.deps):
+                    context["current_stage"] = name
+                    payload = stage.build_input(context)
+                    if stage.project:
+                        payload = stage.project(payload)
+                    timings[name] = {
+                        "start": time.perf_counter() - started_at,
+                        "input_tokens": estimate_tokens(str(payload)),
+                    }
+                    task = asyncio.create_task(run_stage(stage, payload))
+                    running[task] = name
+
+        launch_ready()
+        try:
+            while running:
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    name = running.pop(task)
+                    result = task.result()
+                    stage = self.stages[name]
+                    updates = {stage.context_key: result} if stage.context_key else dict(result)
+                    context.update(updates)
+                    if on_stage_done is not None:
+                        await on_stage_done(name, updates)
+                    timings[name]["end"] = time.perf_counter() - started_at
+                    timings[name]["duration"] = timings[name]["end"] - timings[name]["start"]
+                    done.add(name)
+                    context.setdefault("completed_stages", []).append(name)
+                launch_ready()
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        return timings
+
+    def critical_path(self, timings: Dict[str, Dict[str, float]]) -> Tuple[List[str], float]:
+        """Longest dependency chain by stage duration; stages not run count as zero"""
+        finish: Dict[str, float] = {}
+        via: Dict[str, Optional[str]] = {}
+        for name in self.order:
+            deps = self.stages[name].deps
+            prev = max(deps, key=lambda dep: finish[dep]) if deps else None
+            finish[name] = timings.get(name, {}).get("duration", 0.0) + (finish[prev] if prev else 0.0)
+            via[name] = prev
+        if not finish:
+            return [], 0.0
+        node: Optional[str] = max(finish, key=finish.get)
+        total = finish[node]
+        path: List[str] = []
+        while node:
+            path.append(node)
+            node = via[node]
+        return list(reversed(path)), total
@@ -0,0 +1,135 @@
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from db.database import get_database
+import os
+import re
+import threading
+
+# Off by default: the confidences below are rule-based, not calibrated. Check them against a
+# labelled set with utils/pregrader_eval.py before letting them skip or downgrade LLM calls.
+PREGRADER_ENABLED = os.getenv("EDUMARK_PREGRADER", "off").lower() in ("1", "on", "true", "yes")
+# At or above this confidence the local score replaces the LLM analysis
+SKIP_CONFIDENCE = float(os.getenv("EDUMARK_PREGRADE_SKIP_CONFIDENCE", "0.9"))
+# At or above this confidence the analysis runs on DOWNGRADE_MODEL instead of the default model
+DOWNGRADE_CONFIDENCE = float(os.getenv("EDUMARK_PREGRADE_DOWNGRADE_CONFIDENCE", "0.8"))
+DOWNGRADE_MODEL = os.getenv("EDUMARK_PREGRADE_MODEL", "llama-3.1-8b-instant")
+
+CORE_SECTIONS = ("introduction", "content", "summary")
+OTHER_SECTIONS = ("references", "citations", "data", "tables", "images", "recommendations")
+_PLACEHOLDERS = ("", "not found", "n/a", "none")
+_YEAR = re.compile(r"\b(?:19|20)\d{2}[a-z]?\b")
+
+# Below this many words a submission is too short to be worth an LLM call
+MIN_WORDS = 40
+# Length, reference count and baseline similarity that earn full marks for that feature
+TARGET_WORDS = 600
+TARGET_REFERENCES = 5
+TARGET_SIMILARITY = 0.2
+
+
+@dataclass
+class PreGrade:
+    score: int
+    confidence: float
+    reason: str
+    features: Dict[str, Any] = field(default_factory=dict)
+
+
+def _text(value: Any) -> str:
+    text = " ".join(map(str, value)) if isinstance(value, list) else str(value or "")
+    return "" if text.strip().lower() in _PLACEHOLDERS else text
+
+
+class PreGrader:
+    """Score a submission from features of its extracted fields, without calling the LLM.
+
+    The score mirrors the 0-100 scale of EduMarkAgent. The confidence says how sure the
+    rules are: only clear-cut cases (empty or trivially short, or complete on every
+    feature) are confident enough to skip or downgrade the LLM analysis.
+    """
+
+    def __init__(self, baseline_texts: Optional[List[str]] = None):
+        self.baseline_texts = [text for text in (baseline_texts or []) if text.strip()]
+        self._vectorizer: Optional[TfidfVectorizer] = None
+        self._baseline_matrix = None
+        if self.baseline_texts:
+            self._vectorizer = TfidfVectorizer(stop_words="english")
+            self._baseline_matrix = self._vectorizer.fit_transform(self.baseline_texts)
+
+    @staticmethod
+    def has_content(structured_data: Dict[str, Any]) -> bool:
+        """False when every field is empty or a "Not found" placeholder, i.e. nothing was extracted"""
+        return any(_text(value).strip() for value in structured_data.values())
+
+    @staticmethod
+    def present_sections(structured_data: Dict[str, Any]) -> List[str]:
+        """Names of the extractor fields that hold real content, in schema order"""
+        return [name for name in CORE_SECTIONS + OTHER_SECTIONS if _text(structured_data.get(name))]
+
+    def features(self, structured_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Section presence, length, reference count and similarity to the baseline texts"""
+        fields = {name: _text(structured_data.get(name)) for name in CORE_SECTIONS + OTHER_SECTIONS}
+        body = " ".join(text for text in fields.values() if text)
+        return {
+            "core_sections": sum(1 for name in CORE_SECTIONS if fields[name]),
+            "other_sections": sum(1 for name in OTHER_SECTIONS if fields[name]),
+            "words": len(body.split()),
+            "references": len(set(_YEAR.findall(fields["references"] + " " + fields["citations"]))),
+            "baseline_similarity": round(self._baseline_similarity(body), 3),
+        }
+
+    def _baseline_similarity(self, text: str) -> float:
+        if self._vectorizer is None or not text:
+            return 0.0
+        return float(cosine_similarity(self._vectorizer.transform([text]), self._baseline_matrix).max())
+
+    def assess(self, structured_data: Dict[str, Any]) -> PreGrade:
+        """Score the submission and say how far the score can be trusted"""
+        f = self.features(structured_data)
+        score = round(
+            35 * f["core_sections"] / len(CORE_SECTIONS)
+            + 15 * min(f["other_sections"], 3) / 3
+            + 25 * min(f["words"] / TARGET_WORDS, 1.0)
+            + 15 * min(f["references"] / TARGET_REFERENCES, 1.0)
+            + 10 * min(f["baseline_similarity"] / TARGET_SIMILARITY, 1.0)
+        )
+
+        if f["words"] < MIN_WORDS:
+            return PreGrade(min(score, 20), 0.95, "empty or trivially short", f)
+        if (f["core_sections"] == len(CORE_SECTIONS) and f["words"] >= TARGET_WORDS
+                and f["references"] >= 3 and f["other_sections"] >= 2):
+            return PreGrade(score, 0.85, "complete on every feature", f)
+        return PreGrade(score, 0.5, "needs qualitative assessment", f)
+
+    @staticmethod
+    def local_analysis(pregrade: PreGrade, structured_data: Dict[str, Any]) -> Dict[str, Any]:
+        """An analysis in EduMarkAgent's response shape, built from the features alone"""
+        missing = [name for name in CORE_SECTIONS if not _text(structured_data.get(name))]
+        recommendations = [f"Add a {name if name != 'content' else 'main body'} section" for name in missing]
+        if pregrade.features["words"] < TARGET_WORDS:
+            recommendations.append("Develop the argument in more depth and detail")
+        if pregrade.features["references"] < TARGET_REFERENCES:
+            recommendations.append("Support the work with more cited references")
+        strengths = [f"Includes a {name if name != 'content' else 'main body'} section"
+                     for name in CORE_SECTIONS if name not in missing]
+        return {
+            "total_score": pregrade.score,
+            "recommendations": recommendations,
+            "strengths": strengths,
+        }
+
+
+_pregrader: Optional[PreGrader] = None
+_pregrader_lock = threading.Lock()
+
+
+def get_pregrader() -> PreGrader:
+    """Return the process-wide pre-grader, fitted on the database's baseline texts"""
+    global _pregrader
+    if _pregrader is None:
+        with _pregrader_lock:
+            if _pregrader is None:
+                _pregrader = PreGrader(get_database().get_baseline_texts())
+    return _pregrader
@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional
+
+# Called as callback(stage, event, payload). Events: "stage_started",
+# "token" (payload is the text delta), "stage_completed" (payload is the stage result).
+ProgressCallback = Callable[[str, str, Any], None]
+
+_progress_callback: ContextVar[Optional[ProgressCallback]] = ContextVar("edumark_progress_callback", default=None)
+_current_stage: ContextVar[str] = ContextVar("edumark_current_stage", default="")
+
+
+@contextmanager
+def progress_listener(callback: Optional[ProgressCallback]) -> Iterator[None]:
+    """Forward pipeline progress in the current context to `callback`"""
+    token = _progress_callback.set(callback)
+    try:
+        yield
+    finally:
+        _progress_callback.reset(token)
+
+
+@contextmanager
+def stage_scope(stage: str) -> Iterator[None]:
+    """Attribute progress events raised inside the block to `stage`"""
+    token = _current_stage.set(stage)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+
+def streaming_enabled() -> bool:
+    """True when someone is listening for incremental output"""
+    return _progress_callback.get() is not None
+
+
+def emit_progress(event: str, payload: Any = None, stage: Optional[str] = None) -> None:
+    """Send a progress event to the active listener, if any"""
+    callback = _progress_callback.get()
+    if callback is None:
+        return
+    try:
+        callback(stage or _current_stage.get(), event, payload)
+    except Exception as e:
+        # A broken UI callback must not fail the grading run
+        print(f"Error in progress callback: {e}")
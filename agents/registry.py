@@ -0,0 +1,95 @@
+from typing import Any, Dict, Optional
+import threading
+from db.database import EduMarkDatabase, get_database
+from db.job_queue import JobStore, SQLiteJobStore, job_store_from_env
+from .llm_cache import LLMResponseCache, get_llm_cache
+from .llm_client import get_llm_client
+from .orchestrator import OrchestratorAgent
+from .pdf_text import PDFTextCache, get_pdf_text_cache
+from .progress import ProgressCallback
+
+# Process-wide singletons. The pipeline holds no per-submission state on the
+# agents themselves, so one instance can serve every request in the process.
+_orchestrator: Optional[OrchestratorAgent] = None
+_job_queue: Optional[JobStore] = None
+_lock = threading.Lock()
+
+
+def get_orchestrator() -> OrchestratorAgent:
+    """Return the shared orchestrator, building the agent pipeline on first use"""
+    global _orchestrator
+    if _orchestrator is None:
+        with _lock:
+            if _orchestrator is None:
+                _orchestrator = OrchestratorAgent(db=get_database())
+    return _orchestrator
+
+
+def get_job_queue() -> JobStore:
+    """Return the shared job queue handle, backed by the store EDUMARK_JOB_STORE selects"""
+    global _job_queue
+    if _job_queue is None:
+        with _lock:
+            if _job_queue is None:
+                _job_queue = job_store_from_env()
+    return _job_queue
+
+
+async def grade_submission(
+    submission_data: Dict[str, Any],
+    on_progress: Optional[ProgressCallback] = None,
+    deadline_seconds: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Run the grading pipeline on one submission and save the outcome to the submissions table"""
+    orchestrator = get_orchestrator()
+    result = await orchestrator.process_student_submission(
+        submission_data, on_progress=on_progress, deadline_seconds=deadline_seconds
+    )
+    if result.get("status") != "completed":
+        # Partial results are not graded; completed stages stay checkpointed for a retry
+        return result
+
+    try:
+        db = get_database()
+        student_name = submission_data.get("student_name", "")
+        student_id = submission_data.get("student_id", "")
+        # One row per student ID: re-uploads update the existing record
+        record = db.submission_record(student_name, student_id, result)
+        print(f"About to save submission for {student_name} with ID {student_id}")
+        print(f"Score: {record['score']}, Feedback: {record['feedback']}")
+        db.upsert_submissions([record])
+        print(f"✅ Saved submission for student ID {student_id}")
+        # Only now is the result safe; until here a rerun resumes from the checkpoints
+        orchestrator.clear_checkpoints(result["run_id"])
+    except Exception as e:
+        print(f"❌ Error saving to database: {e}")
+        import traceback
+        traceback.print_exc()
+        # Continue even if database save fails
+
+    return result
+
+
+def reset_registry() -> None:
+    """Drop the shared orchestrator and queue so the next call rebuilds them"""
+    global _orchestrator, _job_queue
+    with _lock:
+        _orchestrator = None
+        _job_queue = None
+
+
+__all__ = [
+    "EduMarkDatabase",
+    "JobStore",
+    "LLMResponseCache",
+    "PDFTextCache",
+    "SQLiteJobStore",
+    "get_database",
+    "get_job_queue",
+    "get_llm_cache",
+    "get_llm_client",
+    "get_orchestrator",
+    "get_pdf_text_cache",
+    "grade_submission",
+    "reset_registry",
+]
@@ -0,0 +1,89 @@
+from typing import Any, Dict, List
+
+# Minimal JSON Schema subset: type, required, properties, items, enum, minimum, maximum.
+_TYPE_CHECKS = {
+    "string": lambda v: isinstance(v, str),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "array": lambda v: isinstance(v, list),
+    "object": lambda v: isinstance(v, dict),
+    "null": lambda v: v is None,
+}
+
+
+def validate_schema(value: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """Return every way `value` violates `schema`; an empty list means it is valid"""
+    errors: List[str] = []
+    expected = schema.get("type")
+    if expected:
+        types = expected if isinstance(expected, list) else [expected]
+        if not any(_TYPE_CHECKS[t](value) for t in types):
+            return [f"{path}: expected {'/'.join(types)}, got {type(value).__name__}"]
+
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} is not one of {schema['enum']}")
+    if _TYPE_CHECKS["number"](value):
+        if "minimum" in schema and value < schema["minimum"]:
+            errors.append(f"{path}: {value} is below {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            errors.append(f"{path}: {value} is above {schema['maximum']}")
+
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}: missing required field '{key}'")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(validate_schema(value[key], subschema, f"{path}.{key}"))
+    if isinstance(value, list) and "items" in schema:
+        for index, item in enumerate(value):
+            errors.extend(validate_schema(item, schema["items"], f"{path}[{index}]"))
+    return errors
+
+
+_TEXT_FIELD = {"type": ["string", "array"]}
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+EXTRACTION_SCHEMA = {
+    "type": "object",
+    "required": [
+        "introduction", "content", "references", "citations", "data",
+        "tables", "images", "recommendations", "summary",
+    ],
+    "properties": {
+        field: _TEXT_FIELD
+        for field in (
+            "introduction", "content", "references", "citations", "data",
+            "tables", "images", "recommendations", "summary",
+        )
+    },
+}
+
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "required": ["total_score", "grade", "recommendations", "strengths"],
+    "properties": {
+        "total_score": {"type": "number", "minimum": 0, "maximum": 100},
+        "grade": {"type": "string"},
+        "recommendations": _STRING_LIST,
+        "strengths": _STRING_LIST,
+    },
+}
+
+# Items are validated one by one against ANALYSIS_SCHEMA so a bad item fails alone
+BATCH_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "required": ["results"],
+    "properties": {"results": {"type": "array", "items": {"type": "object"}}},
+}
+
+MARKING_SCHEMA = {
+    "type": "object",
+    "required": ["strengths", "weaknesses", "grading_details"],
+    "properties": {
+        "strengths": _STRING_LIST,
+        "weaknesses": _STRING_LIST,
+        "grading_details": {"type": "object"},
+    },
+}
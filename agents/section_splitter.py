@@ -0,0 +1,124 @@
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+import os
+import re
+
+# Heading words for each extraction field, matched case-insensitively on their own line
+HEADING_ALIASES = {
+    "introduction": ("introduction", "background", "overview"),
+    "content": ("body", "main body", "content", "discussion", "analysis", "methodology", "methods", "main text"),
+    "references": ("references", "reference list", "bibliography", "works cited", "sources"),
+    "citations": ("citations",),
+    "data": ("data", "results", "findings"),
+    "tables": ("tables",),
+    "images": ("images", "figures"),
+    "recommendations": ("recommendations", "recommendation", "future work"),
+    "summary": ("conclusion", "conclusions", "summary", "concluding remarks"),
+}
+
+# The fields every well-formed submission has; the split is only trusted when it finds all of them
+CORE_FIELDS = ("introduction", "content", "summary")
+
+_HEADING = re.compile(
+    r"^\s*(?:(?:\d+(?:\.\d+)*|[IVX]+)[.)]?\s+)?(?P<name>{})\s*(?::\s*(?P<rest>.*))?$".format(
+        "|".join(sorted((re.escape(a) for aliases in HEADING_ALIASES.values() for a in aliases), key=len, reverse=True))
+    ),
+    re.IGNORECASE,
+)
+_ALIAS_FIELD = {alias: name for name, aliases in HEADING_ALIASES.items() for alias in aliases}
+_CAPTION = re.compile(r"^\s*(?P<kind>table|fig\.?|figure)\s+\d+", re.IGNORECASE)
+_CITATION = re.compile(r"\([A-Z][A-Za-z'\-]+(?: et al\.)?(?:,| and [A-Z][A-Za-z'\-]+,)? \d{4}[a-z]?\)|\[\d+(?:[,–-]\s*\d+)*\]")
+# Sign-off lines that follow the conclusion but are not part of it
+_SIGN_OFF = re.compile(r"^\s*(thank you for|best regards|kind regards|yours sincerely|sincerely)", re.IGNORECASE)
+
+MIN_CONFIDENCE = float(os.getenv("EDUMARK_SPLITTER_MIN_CONFIDENCE", "0.75"))
+
+
+@dataclass
+class SectionSplit:
+    fields: Dict[str, str]
+    confidence: float
+    headings: List[str] = field(default_factory=list)
+
+
+class SectionSplitter:
+    """Fill the nine extraction fields from headings, captions and citation patterns.
+
+    Deterministic and local; the extractor trusts it when `confidence` is at least
+    `min_confidence` and otherwise asks the LLM.
+    """
+
+    def __init__(self, min_confidence: Optional[float] = None):
+        self.min_confidence = MIN_CONFIDENCE if min_confidence is None else min_confidence
+        self.attempts = 0
+        self.hits = 0
+
+    def split(self, text: str) -> SectionSplit:
+        """Assign each line to the field of the heading above it"""
+        sections: Dict[str, List[str]] = {name: [] for name in HEADING_ALIASES}
+        captions: Dict[str, List[str]] = {"tables": [], "images": []}
+        headings: List[str] = []
+        current: Optional[str] = None
+        assigned_chars = total_chars = 0
+
+        for line in text.replace("\f", "\n").splitlines():
+            stripped = line.strip()
+            if not stripped:
+                continue
+            heading = _HEADING.match(stripped) if len(stripped.split()) <= 8 else None
+            if heading:
+                current = _ALIAS_FIELD[heading.group("name").lower()]
+                headings.append(heading.group("name"))
+                stripped = (heading.group("rest") or "").strip()
+                if not stripped:
+                    continue
+            elif _SIGN_OFF.match(stripped):
+                current = None
+            total_chars += len(stripped)
+            caption = _CAPTION.match(stripped)
+            if caption:
+                captions["tables" if caption.group("kind").lower() == "table" else "images"].append(stripped)
+            if current is not None:
+                sections[current].append(stripped)
+                assigned_chars += len(stripped)
+
+        for name, lines in captions.items():
+            sections[name].extend(line for line in lines if line not in sections[name])
+        citations = list(dict.fromkeys(_CITATION.findall(text)))
+        sections["citations"].extend(citations)
+
+        fields = {name: " ".join(lines) if lines else "Not found" for name, lines in sections.items()}
+        coverage = assigned_chars / total_chars if total_chars else 0.0
+        # A missing core section means its text went under some other heading (or nowhere),
+        # e.g. the body of an Introduction/Conclusion-only essay; let the LLM place it
+        missing_core = any(not sections[name] for name in CORE_FIELDS)
+        confidence = 0.0 if len(headings) < 2 or missing_core else 0.6 + 0.4 * coverage
+        return SectionSplit(fields, round(confidence, 3), headings)
+
+    def try_split(self, text: str) -> Optional[SectionSplit]:
+        """Return the split if it is confident enough, counting fast-path hits"""
+        self.attempts += 1
+        result = self.split(text)
+        if result.confidence < self.min_confidence:
+            return None
+        self.hits += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Return fast-path counters for this process"""
+        return {
+            "attempts": self.attempts,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.attempts, 3) if self.attempts else 0.0,
+        }
+
+
+_splitter: Optional[SectionSplitter] = None
+
+
+def get_section_splitter() -> SectionSplitter:
+    """Return the process-wide section splitter"""
+    global _splitter
+    if _splitter is None:
+        _splitter = SectionSplitter()
+    return _splitter
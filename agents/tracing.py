@@ -0,0 +1,196 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import json
+import os
+import threading
+import time
+import uuid
+
+
+class Span:
+    """One timed unit of work with free-form attributes"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start_time = time.time()
+        self.duration = 0.0
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self._started = time.perf_counter()
+        self.otel_span: Any = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, key: str, amount: float = 1) -> None:
+        """Increment a numeric attribute, e.g. retries"""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Returned when tracing is off so call sites never need to check"""
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def add(self, key: str, amount: float = 1) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JSONLSpanExporter:
+    """Appends each finished span as one JSON line"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def on_start(self, span: Span) -> None:
+        pass
+
+    def on_end(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class OpenTelemetrySpanExporter:
+    """Mirrors spans into the OpenTelemetry API (requires opentelemetry-api/sdk to be configured)"""
+
+    def __init__(self):
+        from opentelemetry import trace
+
+        self._trace = trace
+        self._tracer = trace.get_tracer("edumark")
+
+    def on_start(self, span: Span) -> None:
+        parent = _otel_parents.get()
+        context = self._trace.set_span_in_context(parent) if parent is not None else None
+        span.otel_span = self._tracer.start_span(span.name, context=context, start_time=int(span.start_time * 1e9))
+
+    def on_end(self, span: Span) -> None:
+        otel_span = span.otel_span
+        if otel_span is None:
+            return
+        for key, value in span.attributes.items():
+            if isinstance(value, (str, bool, int, float)):
+                otel_span.set_attribute(key, value)
+        if span.error:
+            otel_span.set_attribute("error.message", span.error)
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=int((span.start_time + span.duration) * 1e9))
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("edumark_current_span", default=None)
+_otel_parents: ContextVar[Any] = ContextVar("edumark_otel_parent", default=None)
+
+
+class Tracer:
+    def __init__(self, exporters: Optional[List[Any]] = None):
+        self.exporters = exporters or []
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Any]:
+        """Time the enclosed block as a child of the current span"""
+        if not self.exporters:
+            yield NOOP_SPAN
+            return
+        parent = _current_span.get()
+        span = Span(name, parent.trace_id if parent else uuid.uuid4().hex, parent.span_id if parent else None, attributes)
+        for exporter in self.exporters:
+            exporter.on_start(span)
+        token = _current_span.set(span)
+        otel_token = _otel_parents.set(span.otel_span) if span.otel_span is not None else None
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration = time.perf_counter() - span._started
+            if otel_token is not None:
+                _otel_parents.reset(otel_token)
+            _current_span.reset(token)
+            for exporter in self.exporters:
+                try:
+                    exporter.on_end(span)
+                except Exception as e:
+                    print(f"Error exporting span: {e}")
+
+
+def _tracer_from_env() -> Tracer:
+    exporters: List[Any] = []
+    trace_file = os.getenv("EDUMARK_TRACE_FILE")
+    if trace_file:
+        exporters.append(JSONLSpanExporter(trace_file))
+    if os.getenv("EDUMARK_TRACE_OTEL", "").lower() in ("1", "on", "true", "yes"):
+        try:
+            exporters.append(OpenTelemetrySpanExporter())
+        except ImportError:
+            print("OpenTelemetry is not installed; skipping the OTel exporter")
+    return Tracer(exporters)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """Tracer configured by EDUMARK_TRACE_FILE (JSONL path) and EDUMARK_TRACE_OTEL"""
+    global _tracer
+    if _tracer is None:
+        _tracer = _tracer_from_env()
+    return _tracer
+
+
+def set_tracer(tracer: Optional[Tracer]) -> None:
+    global _tracer
+    _tracer = tracer
+
+
+def trace_span(name: str, **attributes: Any):
+    """Shorthand for get_tracer().span(...)"""
+    return get_tracer().span(name, **attributes)
+
+
+def current_span() -> Any:
+    """The innermost active span, or a no-op span outside any trace"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def traced(name: str) -> Callable:
+    """Decorator that wraps a synchronous function in a span"""
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with trace_span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,50 @@
+import json
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Union
+from agents.tracing import traced
+
+
+class CheckpointStore:
+    """Persists each completed pipeline stage's output so a failed run can resume"""
+
+    def __init__(self, db_path: Union[str, Path]):
+        self.db_path = Path(db_path)
+        self._init_db()
+
+    def _init_db(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS workflow_checkpoints (
+                    run_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    output TEXT NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (run_id, stage)
+                )
+            """)
+
+    @traced("sqlite.checkpoints.save")
+    def save(self, run_id: str, stage: str, output: Dict[str, Any]) -> None:
+        """Record the context updates produced by one stage"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO workflow_checkpoints (run_id, stage, output, updated_at)
+                   VALUES (?, ?, ?, CURRENT_TIMESTAMP)""",
+                (run_id, stage, json.dumps(output, default=str)),
+            )
+
+    @traced("sqlite.checkpoints.load")
+    def load(self, run_id: str) -> Dict[str, Dict[str, Any]]:
+        """Return {stage: context updates} for every stage already completed in this run"""
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute(
+                "SELECT stage, output FROM workflow_checkpoints WHERE run_id = ?", (run_id,)
+            ).fetchall()
+        return {stage: json.loads(output) for stage, output in rows}
+
+    @traced("sqlite.checkpoints.clear")
+    def clear(self, run_id: str) -> None:
+        """Forget a run once it has completed"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM workflow_checkpoints WHERE run_id = ?", (run_id,))
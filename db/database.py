@@ -1,10 +1,25 @@
 import sqlite3
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
 import json
 import os
+import re
+import string
+import threading
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+from agents.tracing import traced
+
+# SQL twin of EduMarkDatabase.normalize_requirement, applied to json_each(...).value by the
+# triggers that keep grade_requirements in sync: ASCII lower case, tabs and newlines as
+# spaces, runs of spaces collapsed (via char(1)/char(2) markers) and the ends trimmed
+NORMALIZED_REQUIREMENT_SQL = """
+    trim(replace(replace(replace(
+        replace(replace(replace(lower(CAST(value AS TEXT)), char(9), ' '), char(10), ' '), char(13), ' '),
+        ' ', char(1) || char(2)), char(2) || char(1), ''), char(1) || char(2), ' '))
+"""
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+_REQUIREMENT_WHITESPACE = re.compile(r"[ \t\n\r]+")
 
 
 class EduMarkDatabase:
@@ -12,6 +27,7 @@ class EduMarkDatabase:
         self.db_path = Path("edumark.sqlite")
         self._init_db()
 
+    @traced("sqlite.init_db")
     def _init_db(self):
         """Initialize the database with baseline data."""
         with sqlite3.connect(self.db_path) as conn:
@@ -50,6 +66,145 @@ class EduMarkDatabase:
                 ]
                 cursor.executemany("INSERT INTO baseline (reference_text) VALUES (?)", [(doc,) for doc in baseline_docs])
 
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS grades (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    title TEXT,
+                    location TEXT,
+                    grade_band TEXT,
+                    requirements TEXT
+                )
+            """
+            )
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_grades_grade_band ON grades(grade_band)")
+            # One row per (requirement, grade): lookups by requirement use the primary key.
+            # Triggers on grades keep it in sync, so direct edits to grades are indexed too
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'grade_requirements'")
+            backfill = cursor.fetchone() is None
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS grade_requirements (
+                    requirement TEXT NOT NULL,
+                    grade_id INTEGER NOT NULL,
+                    PRIMARY KEY (requirement, grade_id)
+                ) WITHOUT ROWID
+            """
+            )
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_grade_requirements_grade ON grade_requirements(grade_id)")
+            index_new_requirements = f"""
+                INSERT OR IGNORE INTO grade_requirements (requirement, grade_id)
+                SELECT requirement, NEW.id FROM (
+                    SELECT {NORMALIZED_REQUIREMENT_SQL} AS requirement
+                    FROM json_each(CASE WHEN json_valid(NEW.requirements) THEN NEW.requirements ELSE '[]' END)
+                )
+                WHERE requirement <> '';
+            """
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS index_grade_requirements_insert
+                AFTER INSERT ON grades
+                BEGIN
+                    {index_new_requirements}
+                END
+            """)
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS index_grade_requirements_update
+                AFTER UPDATE ON grades
+                BEGIN
+                    DELETE FROM grade_requirements WHERE grade_id = OLD.id;
+                    {index_new_requirements}
+                END
+            """)
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS index_grade_requirements_delete
+                AFTER DELETE ON grades
+                BEGIN
+                    DELETE FROM grade_requirements WHERE grade_id = OLD.id;
+                END
+            """)
+            if backfill:
+                # Index grades stored before the table existed
+                cursor.execute(f"""
+                    INSERT OR IGNORE INTO grade_requirements (requirement, grade_id)
+                    SELECT requirement, grade_id FROM (
+                        SELECT {NORMALIZED_REQUIREMENT_SQL} AS requirement, grades.id AS grade_id
+                        FROM grades, json_each(
+                            CASE WHEN json_valid(grades.requirements) THEN grades.requirements ELSE '[]' END
+                        )
+                    )
+                    WHERE requirement <> ''
+                """)
+
+            # Bumped by triggers on every catalogue change, from any connection or process,
+            # so cached copies of the catalogue can tell when they are stale
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS catalogue_version (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    version INTEGER NOT NULL
+                )
+            """
+            )
+            cursor.execute("INSERT OR IGNORE INTO catalogue_version (id, version) VALUES (1, 0)")
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS bump_catalogue_version_grades_{event.lower()}
+                    AFTER {event} ON grades
+                    BEGIN
+                        UPDATE catalogue_version SET version = version + 1 WHERE id = 1;
+                    END
+                """)
+
+    @staticmethod
+    def normalize_requirement(requirement: str) -> str:
+        """Case- and whitespace-insensitive form requirements are stored and matched in.
+
+        Must agree with NORMALIZED_REQUIREMENT_SQL, which the triggers use: SQLite's
+        lower() only folds ASCII letters, so this does the same.
+        """
+        return " ".join(_REQUIREMENT_WHITESPACE.split(str(requirement).translate(_ASCII_LOWER))).strip()
+
+    @classmethod
+    def normalize_requirements(cls, requirements: List[str]) -> List[str]:
+        return list(dict.fromkeys(r for r in map(cls.normalize_requirement, requirements) if r))
+
+    @traced("sqlite.add_grade")
+    def add_grade(self, title: str, location: str, grade_band: str, requirements: List[str]) -> int:
+        """Add a grade to the catalogue"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO grades (title, location, grade_band, requirements) VALUES (?, ?, ?, ?)",
+                (title, location, grade_band, json.dumps(requirements)),
+            )
+            return cursor.lastrowid
+
+    @traced("sqlite.candidate_grades")
+    def candidate_grades(self, contents: List[str], grade_band: str) -> Dict[int, Tuple[int, int]]:
+        """Grades in the band sharing a requirement with `contents`: {grade_id: (matched, required)}.
+
+        An indexed join: the cost scales with the rows matching `contents`, not with the
+        size of the catalogue.
+        """
+        requirements = self.normalize_requirements(contents)
+        if not requirements:
+            return {}
+        placeholders = ", ".join("?" for _ in requirements)
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute(
+                f"""
+                SELECT matched.grade_id, matched.n,
+                       (SELECT COUNT(*) FROM grade_requirements AS own WHERE own.grade_id = matched.grade_id)
+                FROM (
+                    SELECT grade_id, COUNT(*) AS n FROM grade_requirements
+                    WHERE requirement IN ({placeholders})
+                    GROUP BY grade_id
+                ) AS matched
+                JOIN grades ON grades.id = matched.grade_id
+                WHERE grades.grade_band = ?
+                """,
+                (*requirements, grade_band),
+            ).fetchall()
+        return {grade_id: (matched, required) for grade_id, matched, required in rows}
+
+    @traced("sqlite.add_submission")
     def add_submission(self, student_name, student_id, submission_text):
         """Add a new submission and compute its similarity score."""
         with sqlite3.connect(self.db_path) as conn:
@@ -75,6 +230,76 @@ class EduMarkDatabase:
             )
             return score
 
+    @staticmethod
+    def submission_record(student_name: str, student_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Flatten an orchestrator result into a submissions row"""
+        analysis = result.get("analysis_results", {}).get("student_analysis", {})
+        score = analysis.get("total_score", 0)
+        grade = analysis.get("grade", "F")
+        recommendations = analysis.get("recommendations", [])
+
+        feedback_text = f"Score: {score}/100, Grade: {grade}. "
+        if recommendations:
+            feedback_text += f"Recommendations: {'; '.join(recommendations)}"
+
+        return {
+            "student_name": student_name,
+            "student_id": student_id,
+            "submission_text": result.get("extracted_data", {}).get("raw_text", ""),
+            "topics_covered": json.dumps(["AI in Education", "Personalized Learning"]),  # Default topics
+            "strengths": json.dumps(analysis.get("strengths", [])),
+            "weaknesses": json.dumps(analysis.get("weaknesses", [])),
+            "feedback": feedback_text,
+            "score": score,
+        }
+
+    @traced("sqlite.upsert_submissions")
+    def upsert_submissions(self, records: List[Dict[str, Any]]) -> int:
+        """Insert or update many submissions in one transaction, one row per student ID"""
+        if not records:
+            return 0
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            student_ids = [record["student_id"] for record in records]
+            placeholders = ", ".join("?" for _ in student_ids)
+            cursor.execute(
+                f"SELECT student_id FROM submissions WHERE student_id IN ({placeholders})", student_ids
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+
+            updates = [r for r in records if r["student_id"] in existing]
+            inserts = [r for r in records if r["student_id"] not in existing]
+            cursor.executemany(
+                """
+                UPDATE submissions SET
+                    student_name = :student_name,
+                    submission_text = :submission_text,
+                    topics_covered = :topics_covered,
+                    strengths = :strengths,
+                    weaknesses = :weaknesses,
+                    feedback = :feedback,
+                    score = :score,
+                    created_at = CURRENT_TIMESTAMP
+                WHERE student_id = :student_id
+                """,
+                updates,
+            )
+            cursor.executemany(
+                """
+                INSERT INTO submissions (
+                    student_name, student_id, submission_text,
+                    topics_covered, strengths, weaknesses, feedback, score
+                ) VALUES (
+                    :student_name, :student_id, :submission_text,
+                    :topics_covered, :strengths, :weaknesses, :feedback, :score
+                )
+                """,
+                inserts,
+            )
+            conn.commit()
+        return len(records)
+
+    @traced("sqlite.get_all_submissions")
     def get_all_submissions(self):
         """Retrieve all student submissions."""
         with sqlite3.connect(self.db_path) as conn:
@@ -83,6 +308,26 @@ class EduMarkDatabase:
             cursor.execute("SELECT * FROM submissions ORDER BY created_at DESC")
             return [dict(row) for row in cursor.fetchall()]
 
+    @traced("sqlite.get_baseline_texts")
+    def get_baseline_texts(self) -> List[str]:
+        """Return the reference texts submissions are compared against"""
+        with sqlite3.connect(self.db_path) as conn:
+            return [row[0] for row in conn.execute("SELECT reference_text FROM baseline ORDER BY id")]
+
+_database = None
+_database_lock = threading.Lock()
+
+
+def get_database() -> EduMarkDatabase:
+    """Return the process-wide database handle, creating the schema only once"""
+    global _database
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                _database = EduMarkDatabase()
+    return _database
+
+
 # Usage example
 if __name__ == "__main__":
     db = EduMarkDatabase()
@@ -0,0 +1,339 @@
+import importlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+from agents.tracing import traced
+
+ACTIVE_STATUSES = ("queued", "running")
+# How often a worker reports that it is alive; the app routes uploads to the queue while one is
+WORKER_PRESENCE_SECONDS = 10.0
+
+
+class JobStore:
+    """Where the grading job queue keeps its jobs.
+
+    The app and the workers only go through these methods, so any store that implements
+    them atomically can back the queue. Workers claim jobs under a lease they keep alive
+    with heartbeats; a job whose lease expires (crashed worker) is handed to the next
+    worker that asks. A store on a shared database server lets workers run on any number
+    of hosts; select it with EDUMARK_JOB_STORE (see job_store_from_env).
+    """
+
+    def enqueue(
+        self,
+        payload: Dict[str, Any],
+        file_name: Optional[str] = None,
+        file_data: Optional[bytes] = None,
+        dedupe_key: Optional[str] = None,
+    ) -> int:
+        """Add a job and return its ID; an active or finished job with the same dedupe key is reused"""
+        raise NotImplementedError("Job stores must implement enqueue()")
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest runnable job, including ones whose lease has expired"""
+        raise NotImplementedError("Job stores must implement claim()")
+
+    def heartbeat(self, job_id: int, worker_id: str, lease_seconds: float) -> bool:
+        """Extend the lease; False means the job was cancelled or claimed by someone else"""
+        raise NotImplementedError("Job stores must implement heartbeat()")
+
+    def complete(self, job_id: int, worker_id: str, result: Dict[str, Any]) -> bool:
+        """Store the result of a job this worker still holds the lease on"""
+        raise NotImplementedError("Job stores must implement complete()")
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> bool:
+        """Record a failure, re-queueing the job while it has attempts left"""
+        raise NotImplementedError("Job stores must implement fail()")
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a queued or running job; a running worker notices at its next heartbeat"""
+        raise NotImplementedError("Job stores must implement cancel()")
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Job status and, once completed, its result"""
+        raise NotImplementedError("Job stores must implement get()")
+
+    def queue_position(self, job_id: int) -> int:
+        """Number of queued jobs ahead of this one"""
+        raise NotImplementedError("Job stores must implement queue_position()")
+
+    def touch_worker(self, worker_id: str) -> None:
+        """Record that a worker is alive and polling"""
+        raise NotImplementedError("Job stores must implement touch_worker()")
+
+    def forget_worker(self, worker_id: str) -> None:
+        """Remove a worker that is shutting down"""
+        raise NotImplementedError("Job stores must implement forget_worker()")
+
+    def live_workers(self, max_age_seconds: float = 3 * WORKER_PRESENCE_SECONDS) -> int:
+        """Number of workers seen within `max_age_seconds`"""
+        raise NotImplementedError("Job stores must implement live_workers()")
+
+
+class SQLiteJobStore(JobStore):
+    """The default job store: a local SQLite file in WAL mode.
+
+    WAL relies on shared memory between the processes using the file, so the app and every
+    worker using this store must run on the same host, and the file must not live on a
+    network filesystem. For workers on several hosts, use a store on a shared server.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_attempts: int = 3):
+        self.db_path = Path(db_path or os.getenv("EDUMARK_JOB_DB", ".cache/jobs.sqlite"))
+        self.max_attempts = max_attempts
+        self._init_db()
+
+    def __repr__(self) -> str:
+        return f"SQLiteJobStore({self.db_path})"
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS grading_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    dedupe_key TEXT,
+                    payload TEXT NOT NULL,
+                    file_name TEXT,
+                    file_data BLOB,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    worker_id TEXT,
+                    lease_expires_at REAL,
+                    heartbeat_at REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_grading_jobs_status ON grading_jobs(status, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_grading_jobs_dedupe ON grading_jobs(dedupe_key)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS grading_workers (
+                    worker_id TEXT PRIMARY KEY,
+                    seen_at REAL NOT NULL
+                )
+            """)
+        finally:
+            conn.close()
+
+    @traced("sqlite.jobs.enqueue")
+    def enqueue(
+        self,
+        payload: Dict[str, Any],
+        file_name: Optional[str] = None,
+        file_data: Optional[bytes] = None,
+        dedupe_key: Optional[str] = None,
+    ) -> int:
+        """Add a job and return its ID; an active or finished job with the same dedupe key is reused"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if dedupe_key:
+                row = conn.execute(
+                    """SELECT id FROM grading_jobs
+                       WHERE dedupe_key = ? AND status IN ('queued', 'running', 'completed')
+                       ORDER BY id DESC LIMIT 1""",
+                    (dedupe_key,),
+                ).fetchone()
+                if row:
+                    conn.execute("COMMIT")
+                    return row["id"]
+            cursor = conn.execute(
+                """INSERT INTO grading_jobs
+                       (dedupe_key, payload, file_name, file_data, max_attempts, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (dedupe_key, json.dumps(payload), file_name, file_data, self.max_attempts, now, now),
+            )
+            conn.execute("COMMIT")
+            return cursor.lastrowid
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    @traced("sqlite.jobs.claim")
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest runnable job, including ones whose lease has expired"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Expired leases that already used every attempt are given up on
+            conn.execute(
+                """UPDATE grading_jobs SET status = 'failed', error = 'Lease expired too many times', updated_at = ?
+                   WHERE status = 'running' AND lease_expires_at < ? AND attempts >= max_attempts""",
+                (now, now),
+            )
+            row = conn.execute(
+                """SELECT * FROM grading_jobs
+                   WHERE status = 'queued' OR (status = 'running' AND lease_expires_at < ?)
+                   ORDER BY id LIMIT 1""",
+                (now,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                """UPDATE grading_jobs
+                   SET status = 'running', worker_id = ?, attempts = attempts + 1,
+                       lease_expires_at = ?, heartbeat_at = ?, updated_at = ?
+                   WHERE id = ?""",
+                (worker_id, now + lease_seconds, now, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+            job = dict(row)
+            job["payload"] = json.loads(job["payload"])
+            job["attempts"] += 1
+            return job
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    @traced("sqlite.jobs.heartbeat")
+    def heartbeat(self, job_id: int, worker_id: str, lease_seconds: float) -> bool:
+        """Extend the lease; False means the job was cancelled or claimed by someone else"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                """UPDATE grading_jobs SET lease_expires_at = ?, heartbeat_at = ?, updated_at = ?
+                   WHERE id = ? AND worker_id = ? AND status = 'running'""",
+                (now + lease_seconds, now, now, job_id, worker_id),
+            )
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    @traced("sqlite.jobs.complete")
+    def complete(self, job_id: int, worker_id: str, result: Dict[str, Any]) -> bool:
+        return self._finish(job_id, worker_id, "completed", result=json.dumps(result, default=str))
+
+    @traced("sqlite.jobs.fail")
+    def fail(self, job_id: int, worker_id: str, error: str) -> bool:
+        """Record a failure, re-queueing the job while it has attempts left"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT attempts, max_attempts FROM grading_jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        status = "queued" if row and row["attempts"] < row["max_attempts"] else "failed"
+        return self._finish(job_id, worker_id, status, error=error)
+
+    def _finish(self, job_id: int, worker_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None) -> bool:
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                """UPDATE grading_jobs
+                   SET status = ?, result = COALESCE(?, result), error = ?, lease_expires_at = NULL,
+                       file_data = CASE WHEN ? IN ('completed', 'failed') THEN NULL ELSE file_data END,
+                       updated_at = ?
+                   WHERE id = ? AND worker_id = ? AND status = 'running'""",
+                (status, result, error, status, time.time(), job_id, worker_id),
+            )
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    @traced("sqlite.jobs.cancel")
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a queued or running job; a running worker notices at its next heartbeat"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                """UPDATE grading_jobs SET status = 'cancelled', file_data = NULL, updated_at = ?
+                   WHERE id = ? AND status IN ('queued', 'running')""",
+                (time.time(), job_id),
+            )
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    @traced("sqlite.jobs.get")
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Job status and, once completed, its result"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                """SELECT id, status, payload, result, error, attempts, worker_id, heartbeat_at, created_at, updated_at
+                   FROM grading_jobs WHERE id = ?""",
+                (job_id,),
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def queue_position(self, job_id: int) -> int:
+        """Number of queued jobs ahead of this one"""
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT COUNT(*) FROM grading_jobs WHERE status = 'queued' AND id < ?", (job_id,)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+    @traced("sqlite.jobs.touch_worker")
+    def touch_worker(self, worker_id: str) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO grading_workers (worker_id, seen_at) VALUES (?, ?)", (worker_id, time.time())
+            )
+        finally:
+            conn.close()
+
+    def forget_worker(self, worker_id: str) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM grading_workers WHERE worker_id = ?", (worker_id,))
+        finally:
+            conn.close()
+
+    def live_workers(self, max_age_seconds: float = 3 * WORKER_PRESENCE_SECONDS) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT COUNT(*) FROM grading_workers WHERE seen_at >= ?", (time.time() - max_age_seconds,)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+
+def job_store_from_env() -> JobStore:
+    """The store selected by EDUMARK_JOB_STORE.
+
+    "sqlite" (the default) is SQLiteJobStore at EDUMARK_JOB_DB. "package.module:factory"
+    calls that factory with no arguments, e.g. to return a store on a shared database server.
+    """
+    spec = os.getenv("EDUMARK_JOB_STORE", "sqlite")
+    if spec == "sqlite":
+        return SQLiteJobStore()
+    module_name, _, factory_name = spec.partition(":")
+    if not module_name or not factory_name:
+        raise ValueError(f"EDUMARK_JOB_STORE must be 'sqlite' or 'module:factory', got '{spec}'")
+    store = getattr(importlib.import_module(module_name), factory_name)()
+    if not isinstance(store, JobStore):
+        raise TypeError(f"{spec} returned {type(store).__name__}, not a JobStore")
+    return store
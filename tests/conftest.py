@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pytest
+
+# Adjust this path to point to your project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agents import llm_cache, pregrader, registry
+from agents.llm_backends import ReplayBackend, set_llm_backend
+from agents.llm_cache import LLMResponseCache
+from agents.llm_scheduler import LLMScheduler, set_llm_scheduler
+from db import database
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory so databases and caches never touch the checked-in files"""
+    monkeypatch.chdir(tmp_path)
+    # Process-wide handles would otherwise keep pointing at the previous test's files
+    monkeypatch.setattr(database, "_database", None)
+    monkeypatch.setattr(pregrader, "_pregrader", None)
+    monkeypatch.setattr(registry, "_orchestrator", None)
+    monkeypatch.setattr(registry, "_job_queue", None)
+    return tmp_path
+
+
+class CountingReplayBackend(ReplayBackend):
+    """Synthetic backend that keeps every request it answers"""
+
+    def __init__(self):
+        super().__init__(latency=0, tokens_per_second=1e9)
+        self.requests = []
+
+    async def complete(self, request):
+        self.requests.append(request)
+        return await super().complete(request)
+
+    async def stream(self, request):
+        self.requests.append(request)
+        async for delta in super().stream(request):
+            yield delta
+
+
+@pytest.fixture
+def offline_llm(workdir, monkeypatch):
+    """Synthetic LLM responses with no latency or rate limits and an empty response cache"""
+    backend = CountingReplayBackend()
+    set_llm_backend(backend)
+    set_llm_scheduler(LLMScheduler(requests_per_minute=1e6, tokens_per_minute=1e10, max_concurrency=16))
+    monkeypatch.setattr(llm_cache, "_cache", LLMResponseCache(str(workdir / "llm_responses.sqlite")))
+    yield backend
+    set_llm_backend(None)
+    set_llm_scheduler(None)
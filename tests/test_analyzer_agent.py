@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+import pytest
+
+from agents import analyzer_agent
+from agents.analyzer_agent import EduMarkAgent
+from agents.deadline import DeadlineExceeded, deadline_scope
+from agents.llm_client import count_prompt_tokens
+from agents.llm_backends import SYNTHETIC_RESPONSES, ReplayBackend, set_llm_backend
+
+
+class DroppingBatchBackend(ReplayBackend):
+    """Synthetic answers, but batch responses leave out the last submission"""
+
+    def __init__(self):
+        super().__init__(latency=0, tokens_per_second=1e9)
+        self.prompts = []
+
+    async def complete(self, request):
+        self.prompts.append(request.prompt)
+        response = await super().complete(request)
+        parsed = json.loads(response.content)
+        if "results" in parsed:
+            response.content = json.dumps({"results": parsed["results"][:-1]})
+        return response
+
+
+@pytest.fixture(autouse=True)
+def no_pregrader(monkeypatch):
+    monkeypatch.setattr(analyzer_agent, "PREGRADER_ENABLED", False)
+
+
+def test_batches_respect_the_item_limit_and_token_budget(monkeypatch):
+    monkeypatch.setattr(analyzer_agent, "ANALYSIS_BATCH_SIZE", 3)
+    analyzer = EduMarkAgent()
+    batches = analyzer._pack_batches({str(i): "short" for i in range(7)})
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+
+    monkeypatch.setattr(analyzer_agent, "ANALYSIS_BATCH_TOKENS", 1000)
+    batches = analyzer._pack_batches({"a": "x" * 4000, "b": "short", "c": "short"})
+    assert [list(batch) for batch in batches] == [["a"], ["b", "c"]]
+
+
+def test_demux_matches_ids_in_any_form():
+    ids = ["1", "2", "3"]
+    parsed = {"results": [{"id": "Submission 2", "total_score": 50}, {"id": 1, "total_score": 70}, "junk"]}
+    assert EduMarkAgent._demux(parsed, ids) == {"2": {"total_score": 50}, "1": {"total_score": 70}}
+    # No IDs at all but one item per submission: order decides
+    assert EduMarkAgent._demux({"results": [{"a": 1}, {"a": 2}, {"a": 3}]}, ids)["3"] == {"a": 3}
+    assert EduMarkAgent._demux({}, ids) == {}
+
+
+def test_items_missing_from_a_batch_are_analyzed_alone(offline_llm):
+    backend = DroppingBatchBackend()
+    set_llm_backend(backend)
+    submissions = {f"s{i}": {"content": f"Essay {i}"} for i in range(3)}
+    results = asyncio.run(EduMarkAgent().analyze_batch(submissions))
+    assert set(results) == set(submissions)
+    assert all(r["student_analysis"]["total_score"] == SYNTHETIC_RESPONSES["EduMark"]["total_score"]
+               for r in results.values())
+    assert len(backend.prompts) == 2
+    assert "Essay 2" in backend.prompts[1] and "Submission id" not in backend.prompts[1]
+
+
+def test_concurrent_runs_within_the_window_share_one_request(offline_llm):
+    analyzer = EduMarkAgent()
+    analyzer.batch_window = 0.05
+
+    async def run_all():
+        return await asyncio.gather(*(
+            analyzer.run([{"role": "user", "content": str({"structured_data": {"content": f"Essay {i}"}})}])
+            for i in range(4)
+        ))
+
+    results = asyncio.run(run_all())
+    assert all(result["analysis_method"] == "llm" for result in results)
+    assert len(offline_llm.requests) == 1
+
+
+def test_an_item_out_of_time_does_not_fail_the_rest_of_its_batch(offline_llm):
+    offline_llm.latency = 0.3
+    analyzer = EduMarkAgent()
+    analyzer.batch_window = 0.02
+
+    async def analyze(text, seconds):
+        with deadline_scope(seconds), count_prompt_tokens() as counts:
+            result = await analyzer._analyze_in_batch({"content": text})
+        return result, sum(counts)
+
+    async def run_both():
+        # The short-deadline item joins first, so the batch starts from its context
+        return await asyncio.gather(analyze("Essay 1", 0.1), analyze("Essay 2", 5), return_exceptions=True)
+
+    short, (result, prompt_tokens) = asyncio.run(run_both())
+    assert isinstance(short, DeadlineExceeded)
+    assert result["student_analysis"]["grade"] in ("A", "B", "C", "F") and prompt_tokens > 0
+    assert len(offline_llm.requests) == 1 and "Essay 1" in offline_llm.requests[0].prompt
@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+import pytest
+
+from agents.analyzer_agent import EduMarkAgent
+from agents.base_agent import InvalidResponseError
+from agents.llm_backends import LLMBackend, LLMResponse, set_llm_backend
+from agents.marker_agent import ScreenerAgent
+from agents.progress import progress_listener
+
+VALID_ANALYSIS = {"total_score": 72, "grade": "?", "recommendations": ["More sources"], "strengths": ["Clear"]}
+
+
+class ScriptedBackend(LLMBackend):
+    """Answers with the given responses in order, streaming each in small pieces"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    async def complete(self, request):
+        self.requests.append(request)
+        content = self.responses.pop(0)
+        return LLMResponse(content=content, prompt_tokens=1, completion_tokens=1)
+
+    async def stream(self, request):
+        self.requests.append(request)
+        content = self.responses.pop(0)
+        for start in range(0, len(content), 5):
+            yield content[start:start + 5]
+
+
+def analyze(analyzer, structured_data):
+    return analyzer.run([{"role": "user", "content": str({"structured_data": structured_data})}])
+
+
+def test_invalid_response_is_retried_without_serving_it_from_the_cache(offline_llm):
+    backend = ScriptedBackend('{"total_score": "high"}', json.dumps(VALID_ANALYSIS))
+    set_llm_backend(backend)
+    result = asyncio.run(EduMarkAgent()._analyze({"content": "Essay"}))
+    assert result["student_analysis"]["total_score"] == 72
+    assert result["student_analysis"]["grade"] == "A"
+    assert len(backend.requests) == 2
+    assert all(request.json_mode for request in backend.requests)
+
+
+def test_exhausted_retries_fail_the_stage_instead_of_a_placeholder(offline_llm):
+    set_llm_backend(ScriptedBackend("not json", "still not json"))
+    with pytest.raises(InvalidResponseError):
+        asyncio.run(EduMarkAgent()._analyze({"content": "Essay"}))
+
+
+def test_marker_fails_on_invalid_response(offline_llm):
+    set_llm_backend(ScriptedBackend("{}", "{}"))
+    with pytest.raises(InvalidResponseError):
+        asyncio.run(ScreenerAgent().run([{"role": "user", "content": str({"structured_data": {}})}]))
+
+
+def test_streamed_stage_uses_plain_mode_and_forwards_deltas(offline_llm):
+    backend = ScriptedBackend("Here is the analysis:\n" + json.dumps(VALID_ANALYSIS))
+    set_llm_backend(backend)
+    events = []
+
+    async def run():
+        with progress_listener(lambda stage, event, payload: events.append(event)):
+            return await EduMarkAgent()._analyze({"content": "Essay"})
+
+    result = asyncio.run(run())
+    assert result["student_analysis"]["total_score"] == 72
+    assert not backend.requests[0].json_mode
+    assert events.count("token") > 1
@@ -0,0 +1,104 @@
+import sqlite3
+
+from agents.grade_catalogue import CatalogueCache
+from db.database import EduMarkDatabase
+
+
+def version(db):
+    with sqlite3.connect(db.db_path) as conn:
+        return conn.execute("SELECT version FROM catalogue_version WHERE id = 1").fetchone()[0]
+
+
+def test_every_edit_to_grades_bumps_the_catalogue_version(workdir):
+    db = EduMarkDatabase()
+    start = version(db)
+    grade_id = db.add_grade("Essay", "Online", "Pass", ["Introduction"])
+    assert version(db) == start + 1
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("UPDATE grades SET requirements = '[\"Summary\"]' WHERE id = ?", (grade_id,))
+    assert version(db) == start + 2
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("DELETE FROM grades WHERE id = ?", (grade_id,))
+    assert version(db) == start + 3
+
+
+def test_direct_edits_reach_a_cached_catalogue(workdir):
+    db = EduMarkDatabase()
+    grade_id = db.add_grade("Essay", "Online", "Pass", ["Introduction"])
+    cache = CatalogueCache(db.db_path, check_seconds=0)
+    assert cache.get().top_k(["introduction"], "Pass")[1] == 1
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("UPDATE grades SET requirements = '[\"Summary\"]' WHERE id = ?", (grade_id,))
+    assert cache.get().top_k(["introduction"], "Pass")[1] == 0
+    assert cache.get().top_k(["SUMMARY "], "Pass")[1] == 1
+
+
+def requirement_rows(db):
+    with sqlite3.connect(db.db_path) as conn:
+        return sorted(conn.execute("SELECT grade_id, requirement FROM grade_requirements"))
+
+
+def test_requirement_index_follows_every_edit_to_grades(workdir):
+    db = EduMarkDatabase()
+    grade_id = db.add_grade("Essay", "Online", "Pass", ["  Data\tTables", "data tables", "", "Summary"])
+    assert requirement_rows(db) == [(grade_id, "data tables"), (grade_id, "summary")]
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("UPDATE grades SET requirements = '[\"Introduction\"]' WHERE id = ?", (grade_id,))
+    assert requirement_rows(db) == [(grade_id, "introduction")]
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("UPDATE grades SET requirements = 'not json' WHERE id = ?", (grade_id,))
+    assert requirement_rows(db) == []
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("UPDATE grades SET requirements = '[\"Summary\"]' WHERE id = ?", (grade_id,))
+        conn.execute("DELETE FROM grades WHERE id = ?", (grade_id,))
+    assert requirement_rows(db) == []
+
+
+def test_grades_stored_before_the_index_existed_are_backfilled(workdir):
+    db = EduMarkDatabase()
+    grade_id = db.add_grade("Essay", "Online", "Pass", ["Introduction", "SUMMARY"])
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("DROP TABLE grade_requirements")
+    EduMarkDatabase()
+    assert requirement_rows(db) == [(grade_id, "introduction"), (grade_id, "summary")]
+
+
+def test_sql_and_python_normalisation_agree(workdir):
+    db = EduMarkDatabase()
+    requirements = ["  Data \t\n Tables  ", "ÉTUDE Cas", "a\r\nb", "x     y", "MiXeD"]
+    grade_id = db.add_grade("Essay", "Online", "Pass", requirements)
+    stored = [requirement for _, requirement in requirement_rows(db)]
+    assert sorted(stored) == sorted(EduMarkDatabase.normalize_requirements(requirements))
+    assert db.candidate_grades(requirements, "Pass") == {grade_id: (5, 5)}
+
+
+def test_candidate_grades_is_an_indexed_join(workdir):
+    db = EduMarkDatabase()
+    essay = db.add_grade("Essay", "Online", "Pass", ["Introduction", "Summary", "References"])
+    db.add_grade("Report", "Online", "Pass", ["Tables"])
+    db.add_grade("Thesis", "Online", "Merit", ["Introduction"])
+    assert db.candidate_grades(["introduction ", "Tables?"], "Pass") == {essay: (1, 3)}
+    assert db.candidate_grades([], "Pass") == {}
+
+    with sqlite3.connect(db.db_path) as conn:
+        plan = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT grade_id FROM grade_requirements WHERE requirement IN (?, ?)",
+            ("introduction", "tables"),
+        ))
+    assert "SEARCH grade_requirements USING PRIMARY KEY" in plan
+
+
+def test_loaded_catalogue_uses_the_requirement_index(workdir):
+    db = EduMarkDatabase()
+    db.add_grade("Essay", "Online", "Pass", ["Introduction", "Summary"])
+    with sqlite3.connect(db.db_path) as conn:
+        # Only the index changes, so the catalogue must be reading it
+        conn.execute("DELETE FROM grade_requirements WHERE requirement = 'summary'")
+    catalogue = CatalogueCache(db.db_path, check_seconds=0).get()
+    assert catalogue.top_k(["introduction"], "Pass", min_score=100)[1] == 1
+
+
+def test_requirements_normalise_case_whitespace_and_duplicates():
+    assert EduMarkDatabase.normalize_requirements(["  Data  Tables", "data tables", "", "Summary"]) == [
+        "data tables", "summary",
+    ]
@@ -0,0 +1,30 @@
+import asyncio
+
+from agents import extractor_agent, pdf_text
+from agents.extractor_agent import ExtractorAgent
+from utils.pdf_memory_benchmark import write_synthetic_pdf
+
+
+async def pages_of(texts):
+    for text in texts:
+        yield text
+
+
+def test_blank_pages_in_a_stream_are_skipped(offline_llm, monkeypatch):
+    monkeypatch.setattr(extractor_agent, "CHUNK_TOKENS", 50)
+    pages = [" \n" * 200, "\n\n" * 200, "Introduction\nA page with words on it.", " " * 400]
+    document = {}
+    fields = asyncio.run(ExtractorAgent()._structure_stream(pages_of(pages), document))
+    assert set(fields) == set(extractor_agent.EXTRACTION_FIELDS)
+    assert len(offline_llm.requests) == 1
+    assert "A page with words on it." in offline_llm.requests[0].prompt
+
+
+def test_streamed_documents_are_not_cut_at_the_page_cap(offline_llm, workdir, monkeypatch):
+    pdf = workdir / "long.pdf"
+    write_synthetic_pdf(str(pdf), pages=12, lines_per_page=2)
+    monkeypatch.setattr(extractor_agent, "STREAM_PAGES", 4)
+    monkeypatch.setattr(pdf_text, "MAX_PAGES", 5)
+    result = asyncio.run(ExtractorAgent().run([{"role": "user", "content": str({"file_path": str(pdf)})}]))
+    metrics = result["pdf_metrics"]
+    assert metrics["streamed"] and metrics["pages_extracted"] == 12 and not metrics["truncated"]
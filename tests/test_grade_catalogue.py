@@ -0,0 +1,105 @@
+import asyncio
+import random
+
+from agents.grade_catalogue import GradeCatalogue
+from db.database import EduMarkDatabase
+
+BANDS = ["Fail", "Pass", "Merit", "Distinction"]
+VOCABULARY = [f"requirement {i}" for i in range(40)]
+
+
+def random_catalogue(rng, size):
+    return [
+        {
+            "id": i,
+            "title": f"Grade {i}",
+            "location": "Online",
+            "grade_band": rng.choice(BANDS),
+            # Mixed case and padding exercise normalisation; duplicates must count once
+            "requirements": [
+                rng.choice([r, r.upper(), f"  {r} "]) for r in rng.sample(VOCABULARY, rng.randint(1, 6))
+            ] + ([VOCABULARY[0]] if i % 7 == 0 else []),
+        }
+        for i in range(size)
+    ]
+
+
+def brute_force(grades, contents, band, k, min_score):
+    have = set(EduMarkDatabase.normalize_requirements(contents))
+    scored = []
+    for index, grade in enumerate(grades):
+        required = set(EduMarkDatabase.normalize_requirements(grade["requirements"]))
+        if grade["grade_band"] != band or not required:
+            continue
+        score = len(required & have) * 100 / len(required)
+        if score >= min_score:
+            scored.append((-score, index, grade))
+    scored.sort(key=lambda item: item[:2])
+    return [(grade["id"], -negative) for negative, _, grade in scored[:k]], len(scored)
+
+
+def test_top_k_matches_brute_force_on_a_random_catalogue():
+    rng = random.Random(7)
+    grades = random_catalogue(rng, 3000)
+    catalogue = GradeCatalogue(grades)
+    for _ in range(200):
+        contents = rng.sample(VOCABULARY, rng.randint(0, 12))
+        band = rng.choice(BANDS + ["Unknown"])
+        k = rng.choice([1, 3, 10])
+        min_score = rng.choice([0.01, 30, 50, 100])
+        top, qualified = catalogue.top_k(contents, band, k=k, min_score=min_score)
+        expected, expected_qualified = brute_force(grades, contents, band, k, min_score)
+        assert qualified == expected_qualified
+        assert [(grade["id"], round(score, 3)) for grade, score in top] == [
+            (grade_id, round(score, 3)) for grade_id, score in expected
+        ]
+
+
+def test_ties_keep_catalogue_order_and_other_bands_score_zero():
+    grades = [
+        {"id": i, "title": str(i), "location": "", "grade_band": band, "requirements": ["a", "b"]}
+        for i, band in enumerate(["Pass", "Merit", "Pass", "Pass"])
+    ]
+    catalogue = GradeCatalogue(grades)
+    top, qualified = catalogue.top_k(["A", "b"], "Pass", k=2)
+    assert [grade["id"] for grade, _ in top] == [0, 2] and qualified == 3
+    assert catalogue.match_scores(["a"], "Merit").tolist() == [0, 50, 0, 0]
+
+
+def test_empty_contents_and_empty_catalogue_match_nothing():
+    catalogue = GradeCatalogue(random_catalogue(random.Random(1), 50))
+    assert catalogue.top_k([], "Pass") == ([], 0)
+    assert GradeCatalogue([]).top_k(["requirement 1"], "Pass") == ([], 0)
+
+
+def test_empty_catalogue_is_cached_until_the_check_interval(workdir, monkeypatch):
+    from agents import grade_catalogue
+    from agents.grade_catalogue import CatalogueCache
+    from agents import grader_agent
+    from agents.grader_agent import GraderAgent
+
+    now = [1000.0]
+    monkeypatch.setattr(grade_catalogue.time, "monotonic", lambda: now[0])
+    hops = []
+    to_thread = asyncio.to_thread
+
+    async def counting_to_thread(func, *args):
+        hops.append(func)
+        return await to_thread(func, *args)
+
+    monkeypatch.setattr(grader_agent.asyncio, "to_thread", counting_to_thread)
+    db = EduMarkDatabase()
+    cache = CatalogueCache(db.db_path, check_seconds=5)
+    grader = GraderAgent(db)
+    grader.catalogues = cache
+    message = [{"role": "user", "content": str({"result_analysis": {"contents": ["Summary"], "grade_band": "Pass"}})}]
+
+    assert asyncio.run(grader.run(message))["number_of_grades"] == 0
+    assert asyncio.run(grader.run(message))["number_of_grades"] == 0
+    # The second lookup is served by peek() without leaving the event loop
+    assert cache.checks == 1 and cache.loads == 1 and len(hops) == 1
+
+    db.add_grade("Essay", "Online", "Pass", ["Summary"])
+    now[0] += 6
+    assert asyncio.run(grader.run(message))["number_of_grades"] == 1
+    assert cache.checks == 2 and cache.loads == 2 and len(hops) == 2
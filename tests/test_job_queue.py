@@ -0,0 +1,170 @@
+import asyncio
+import time
+
+import pytest
+
+from agents import registry
+from db.job_queue import JobStore, SQLiteJobStore, job_store_from_env
+from utils import worker
+
+
+def make_queue(workdir, max_attempts=3):
+    return SQLiteJobStore(str(workdir / "jobs.sqlite"), max_attempts=max_attempts)
+
+
+class MemoryJobStore(JobStore):
+    """The smallest store that satisfies the protocol, to show workers need nothing else"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.workers = {}
+
+    def enqueue(self, payload, file_name=None, file_data=None, dedupe_key=None):
+        job_id = len(self.jobs) + 1
+        self.jobs[job_id] = {"id": job_id, "status": "queued", "payload": payload, "file_name": file_name,
+                             "file_data": file_data, "attempts": 0, "worker_id": None, "result": None}
+        return job_id
+
+    def claim(self, worker_id, lease_seconds):
+        for job in self.jobs.values():
+            if job["status"] == "queued":
+                job.update(status="running", worker_id=worker_id, attempts=job["attempts"] + 1)
+                return dict(job)
+        return None
+
+    def heartbeat(self, job_id, worker_id, lease_seconds):
+        job = self.jobs[job_id]
+        return job["status"] == "running" and job["worker_id"] == worker_id
+
+    def complete(self, job_id, worker_id, result):
+        self.jobs[job_id].update(status="completed", result=result)
+        return True
+
+    def fail(self, job_id, worker_id, error):
+        self.jobs[job_id].update(status="failed", error=error)
+        return True
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def touch_worker(self, worker_id):
+        self.workers[worker_id] = time.time()
+
+    def forget_worker(self, worker_id):
+        self.workers.pop(worker_id, None)
+
+    def live_workers(self, max_age_seconds=30):
+        return sum(1 for seen in self.workers.values() if time.time() - seen <= max_age_seconds)
+
+
+def test_default_store_is_sqlite_outside_the_source_tree(workdir, monkeypatch):
+    monkeypatch.delenv("EDUMARK_JOB_DB", raising=False)
+    monkeypatch.delenv("EDUMARK_JOB_STORE", raising=False)
+    store = job_store_from_env()
+    assert isinstance(store, SQLiteJobStore) and store.db_path.as_posix() == ".cache/jobs.sqlite"
+
+
+def test_store_factory_is_selected_from_the_environment(monkeypatch):
+    monkeypatch.setenv("EDUMARK_JOB_STORE", f"{__name__}:MemoryJobStore")
+    assert isinstance(job_store_from_env(), MemoryJobStore)
+    monkeypatch.setenv("EDUMARK_JOB_STORE", "redis")
+    with pytest.raises(ValueError):
+        job_store_from_env()
+
+
+def test_worker_runs_jobs_from_any_store_and_reports_its_presence(workdir, monkeypatch):
+    store = MemoryJobStore()
+    monkeypatch.setattr(registry, "_job_queue", store)
+
+    async def fake_grade_submission(submission_data):
+        assert open(submission_data["file_path"], "rb").read() == b"%PDF"
+        return {"status": "completed", "submission_data": dict(submission_data)}
+
+    monkeypatch.setattr(worker, "grade_submission", fake_grade_submission)
+    job_id = store.enqueue({"student_id": "s1"}, file_name="a.pdf", file_data=b"%PDF")
+    grading_worker = worker.GradingWorker("w1", concurrency=1, lease_seconds=30, poll_seconds=0.01)
+
+    async def run_briefly():
+        task = asyncio.create_task(grading_worker.run_forever())
+        await asyncio.sleep(0.1)
+        assert store.live_workers() == 1
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run_briefly())
+    assert store.get(job_id)["status"] == "completed"
+    assert store.get(job_id)["result"]["submission_data"] == {"student_id": "s1"}
+    assert store.live_workers() == 0
+
+
+def test_sqlite_store_tracks_live_workers(workdir):
+    queue = make_queue(workdir)
+    assert queue.live_workers() == 0
+    queue.touch_worker("w1")
+    queue.touch_worker("w2")
+    assert queue.live_workers() == 2 and queue.live_workers(max_age_seconds=-1) == 0
+    queue.forget_worker("w1")
+    assert queue.live_workers() == 1
+
+
+def test_enqueue_reuses_an_active_job_with_the_same_dedupe_key(workdir):
+    queue = make_queue(workdir)
+    first = queue.enqueue({"student_id": "s1"}, dedupe_key="s1:abc")
+    assert queue.enqueue({"student_id": "s1"}, dedupe_key="s1:abc") == first
+    assert queue.enqueue({"student_id": "s2"}, dedupe_key="s2:abc") != first
+
+
+def test_claimed_job_is_leased_to_one_worker(workdir):
+    queue = make_queue(workdir)
+    job_id = queue.enqueue({"student_id": "s1"}, file_name="a.pdf", file_data=b"%PDF")
+    job = queue.claim("w1", lease_seconds=30)
+    assert job["id"] == job_id and job["attempts"] == 1 and job["file_data"] == b"%PDF"
+    assert queue.claim("w2", lease_seconds=30) is None
+    assert queue.heartbeat(job_id, "w1", 30)
+    assert not queue.heartbeat(job_id, "w2", 30)
+
+
+def test_expired_lease_is_handed_to_the_next_worker(workdir):
+    queue = make_queue(workdir)
+    job_id = queue.enqueue({"student_id": "s1"})
+    queue.claim("w1", lease_seconds=0.05)
+    time.sleep(0.1)
+    job = queue.claim("w2", lease_seconds=30)
+    assert job["id"] == job_id and job["attempts"] == 2
+    # The first worker lost the job and can no longer finish it
+    assert not queue.heartbeat(job_id, "w1", 30)
+    assert not queue.complete(job_id, "w1", {"status": "completed"})
+    assert queue.complete(job_id, "w2", {"status": "completed"})
+    assert queue.get(job_id)["result"] == {"status": "completed"}
+
+
+def test_lease_expiring_on_the_last_attempt_fails_the_job(workdir):
+    queue = make_queue(workdir, max_attempts=1)
+    job_id = queue.enqueue({"student_id": "s1"})
+    queue.claim("w1", lease_seconds=0.05)
+    time.sleep(0.1)
+    assert queue.claim("w2", lease_seconds=30) is None
+    assert queue.get(job_id)["status"] == "failed"
+
+
+def test_failures_requeue_until_attempts_run_out(workdir):
+    queue = make_queue(workdir, max_attempts=2)
+    job_id = queue.enqueue({"student_id": "s1"}, file_data=b"%PDF")
+    queue.claim("w1", lease_seconds=30)
+    queue.fail(job_id, "w1", "timed_out")
+    assert queue.get(job_id)["status"] == "queued"
+    assert queue.claim("w1", lease_seconds=30)["file_data"] == b"%PDF"
+    queue.fail(job_id, "w1", "timed_out")
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["error"] == "timed_out"
+
+
+def test_cancelled_job_stops_its_worker_at_the_next_heartbeat(workdir):
+    queue = make_queue(workdir)
+    job_id = queue.enqueue({"student_id": "s1"})
+    queue.enqueue({"student_id": "s2"})
+    queue.claim("w1", lease_seconds=30)
+    assert queue.queue_position(job_id + 1) == 0
+    assert queue.cancel(job_id)
+    assert not queue.heartbeat(job_id, "w1", 30)
+    assert queue.get(job_id)["status"] == "cancelled"
@@ -0,0 +1,32 @@
+import asyncio
+import json
+
+from agents.analyzer_agent import BATCH_ANALYSIS_PROMPT, EduMarkAgent
+from agents.llm_backends import SYNTHETIC_RESPONSES, LLMRequest, ReplayBackend
+
+
+def request(agent, prompt):
+    return LLMRequest(agent=agent, model="m", instructions="", prompt=prompt, temperature=0.7, max_tokens=100)
+
+
+def test_synthetic_backend_answers_each_agent_in_its_shape():
+    backend = ReplayBackend(latency=0)
+    response = asyncio.run(backend.complete(request("Marker", "Mark this")))
+    assert json.loads(response.content) == SYNTHETIC_RESPONSES["Marker"]
+
+
+def test_synthetic_backend_answers_batched_analysis_per_submission():
+    backend = ReplayBackend(latency=0)
+    prompt = BATCH_ANALYSIS_PROMPT.format(submissions="Submission id: 1\n{}\n\nSubmission id: 2\n{}")
+    response = json.loads(asyncio.run(backend.complete(request("EduMark", prompt))).content)
+    assert [item["id"] for item in response["results"]] == ["1", "2"]
+    assert response["results"][0]["total_score"] == SYNTHETIC_RESPONSES["EduMark"]["total_score"]
+
+
+def test_batched_analysis_uses_one_request_offline(offline_llm):
+    analyzer = EduMarkAgent()
+    submissions = {f"s{i}": {"introduction": f"Intro {i}", "content": f"Body {i}"} for i in range(3)}
+    results = asyncio.run(analyzer.analyze_batch(submissions))
+    assert set(results) == set(submissions)
+    assert all(result["student_analysis"]["grade"] == "B" for result in results.values())
+    assert len(offline_llm.requests) == 1
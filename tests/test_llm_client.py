@@ -0,0 +1,34 @@
+import asyncio
+
+from agents import llm_client
+from agents.llm_client import close_llm_client, get_llm_client
+
+
+def test_client_is_shared_within_a_loop_and_closed_with_it(monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+
+    async def session():
+        client = get_llm_client()
+        assert get_llm_client() is client
+        await close_llm_client()
+        return client
+
+    client = asyncio.run(session())
+    assert client._client.is_closed
+    assert len(llm_client._clients) == 0
+
+
+def test_each_loop_gets_its_own_client(monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+
+    async def session():
+        try:
+            return get_llm_client()
+        finally:
+            await close_llm_client()
+
+    assert asyncio.run(session()) is not asyncio.run(session())
+
+
+def test_close_without_a_client_is_a_no_op():
+    asyncio.run(close_llm_client())
@@ -0,0 +1,133 @@
+import asyncio
+import threading
+
+import pytest
+
+from agents.llm_scheduler import AdaptiveConcurrencyLimiter, LLMScheduler, TokenBucket
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+
+def make_scheduler(**kwargs):
+    options = dict(requests_per_minute=1e6, tokens_per_minute=6000, max_retries=3, base_delay=0.001,
+                   initial_concurrency=2, max_concurrency=4)
+    options.update(kwargs)
+    return LLMScheduler(**options)
+
+
+def test_throttled_request_is_retried_and_failed_attempts_are_refunded():
+    scheduler = make_scheduler()
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise FakeAPIError(429, {"retry-after-ms": "1"})
+        return "ok"
+
+    assert asyncio.run(scheduler.submit(call, tokens=1000)) == "ok"
+    assert len(attempts) == 2
+    assert scheduler.retries == 1 and scheduler.throttled == 1
+    # Only the successful attempt keeps its reservation
+    assert 4990 < scheduler.token_bucket.tokens <= 5010
+
+
+def test_non_retryable_error_is_raised_at_once_and_refunded():
+    scheduler = make_scheduler()
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise FakeAPIError(400)
+
+    with pytest.raises(FakeAPIError):
+        asyncio.run(scheduler.submit(call, tokens=1000))
+    assert len(attempts) == 1
+    assert scheduler.token_bucket.tokens > 5990
+
+
+def test_retries_stop_after_max_retries():
+    scheduler = make_scheduler(max_retries=2)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise FakeAPIError(503)
+
+    with pytest.raises(FakeAPIError):
+        asyncio.run(scheduler.submit(call))
+    assert len(attempts) == 3
+
+
+def test_token_bucket_refund_is_capped_at_capacity():
+    bucket = TokenBucket(600)
+    asyncio.run(bucket.acquire(100))
+    bucket.refund(1000)
+    assert bucket.tokens == 600
+
+
+def test_limiter_grows_on_success_and_halves_on_throttle():
+    limiter = AdaptiveConcurrencyLimiter(initial=4, maximum=8)
+    for _ in range(4):
+        limiter.on_success()
+    assert limiter.limit == 5
+    limiter.on_throttle()
+    assert limiter.limit == 2
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    limiter = AdaptiveConcurrencyLimiter(initial=1)
+
+    async def scenario():
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        limiter.release()
+        await asyncio.wait_for(limiter.acquire(), timeout=1)
+        limiter.release()
+
+    asyncio.run(scenario())
+    assert limiter._in_flight == 0
+
+
+def test_limiter_is_shared_safely_by_loops_on_different_threads():
+    limiter = AdaptiveConcurrencyLimiter(initial=1, maximum=1)
+    active = []
+    peak = []
+    errors = []
+
+    async def work():
+        await limiter.acquire()
+        try:
+            active.append(1)
+            peak.append(len(active))
+            await asyncio.sleep(0.001)
+            active.pop()
+        finally:
+            limiter.release()
+
+    async def many():
+        await asyncio.wait_for(asyncio.gather(*(work() for _ in range(20))), timeout=10)
+
+    def session():
+        try:
+            asyncio.run(many())
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=session) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=15)
+    assert not errors
+    assert len(peak) == 80 and max(peak) == 1
+    assert limiter._in_flight == 0
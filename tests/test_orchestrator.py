@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from agents.base_agent import InvalidResponseError
+from agents.llm_backends import ReplayBackend, set_llm_backend
+from agents.orchestrator import OrchestratorAgent, _project_grading, _project_recommendation
+from agents.registry import get_orchestrator, grade_submission
+from db.database import get_database
+
+SUBMISSION = {
+    "text": "A short essay on artificial intelligence in education without any headings at all.",
+    "student_name": "Ada Student",
+    "student_id": "s-001",
+}
+
+
+class FailingAgentsBackend(ReplayBackend):
+    """Synthetic answers, except invalid ones for the agents listed in `failing`"""
+
+    def __init__(self, failing=()):
+        super().__init__(latency=0, tokens_per_second=1e9)
+        self.failing = set(failing)
+        self.agents = []
+
+    async def complete(self, request):
+        self.agents.append(request.agent)
+        response = await super().complete(request)
+        if request.agent in self.failing:
+            response.content = "no JSON here"
+        return response
+
+
+def test_failed_stage_is_retried_alone_on_resume(offline_llm):
+    orchestrator = OrchestratorAgent(db=get_database())
+    backend = FailingAgentsBackend(failing={"Marker"})
+    set_llm_backend(backend)
+    with pytest.raises(InvalidResponseError):
+        asyncio.run(orchestrator.process_student_submission(dict(SUBMISSION)))
+    run_id = orchestrator.submission_run_id(SUBMISSION)
+    assert set(orchestrator.checkpoints.load(run_id)) == {"extraction", "analysis", "grading"}
+
+    backend.failing.clear()
+    backend.agents.clear()
+    result = asyncio.run(orchestrator.process_student_submission(dict(SUBMISSION)))
+    assert result["status"] == "completed"
+    assert result["resumed_stages"] == ["extraction", "analysis", "grading"]
+    assert backend.agents == ["Marker"]
+
+
+def test_checkpoints_are_kept_until_the_result_is_saved(offline_llm):
+    orchestrator = OrchestratorAgent(db=get_database())
+    result = asyncio.run(orchestrator.process_student_submission(dict(SUBMISSION)))
+    assert result["status"] == "completed"
+    assert set(orchestrator.checkpoints.load(result["run_id"])) == set(orchestrator.stage_graph.order)
+    orchestrator.clear_checkpoints(result["run_id"])
+    assert orchestrator.checkpoints.load(result["run_id"]) == {}
+
+
+def test_grade_submission_clears_checkpoints_after_saving(offline_llm):
+    result = asyncio.run(grade_submission(dict(SUBMISSION)))
+    assert result["status"] == "completed"
+    assert [row["student_id"] for row in get_database().get_all_submissions()] == ["s-001"]
+    assert get_orchestrator().checkpoints.load(result["run_id"]) == {}
+
+
+def test_timed_out_run_keeps_finished_stages(offline_llm):
+    backend = FailingAgentsBackend()
+    backend.latency = 0.3
+    set_llm_backend(backend)
+    orchestrator = OrchestratorAgent(db=get_database())
+    result = asyncio.run(orchestrator.process_student_submission(dict(SUBMISSION), deadline_seconds=0.45))
+    assert result["status"] == "timed_out"
+    assert result["completed_stages"] == ["extraction"]
+    assert set(orchestrator.checkpoints.load(result["run_id"])) == {"extraction"}
+
+
+def test_metrics_report_the_prompt_tokens_each_stage_sent(offline_llm):
+    orchestrator = OrchestratorAgent(db=get_database())
+    result = asyncio.run(orchestrator.process_student_submission(dict(SUBMISSION)))
+    tokens = result["pipeline_metrics"]["stage_input_tokens"]
+    extraction_prompt = next(r for r in offline_llm.requests if r.agent == "Extractor")
+    assert tokens["extraction"]["prompt"] >= len(extraction_prompt.prompt) // 4
+    assert tokens["marking"]["prompt"] > 0
+    assert tokens["grading"]["prompt"] == 0
+
+
+def test_later_stages_receive_the_fields_earlier_stages_produce():
+    context = {
+        "extracted_data": {"raw_text": "...", "structured_data": {
+            "introduction": "Opening", "content": "Body", "summary": "Not found", "references": ["Smith 2020"],
+        }},
+        "analysis_results": {"student_analysis": {"total_score": 64, "strengths": ["Clear"]}},
+        "marking_results": {"marking_details": {"weaknesses": ["Thin"]}},
+    }
+    assert _project_grading(context) == {
+        "result_analysis": {"contents": ["introduction", "content", "references"], "grade_band": "Merit"},
+    }
+    assert _project_recommendation(context) == {"strengths": ["Clear"], "weaknesses": ["Thin"]}
+
+
+def test_recommendations_build_on_the_analysis_and_marking(offline_llm):
+    result = asyncio.run(OrchestratorAgent(db=get_database()).process_student_submission(dict(SUBMISSION)))
+    strengths = result["analysis_results"]["student_analysis"]["strengths"]
+    assert strengths and ", ".join(strengths) in result["final_recommendation"]["final_recommendation"]["encouragement"]
+    assert result["grading_results"]["number_of_grades"] == 0
+
+
+def test_projection_shrinks_the_marking_prompt(offline_llm):
+    prompts = {}
+    for project_inputs in (False, True):
+        orchestrator = OrchestratorAgent(db=get_database(), project_inputs=project_inputs)
+        submission = dict(SUBMISSION, student_id=f"s-{project_inputs}")
+        result = asyncio.run(orchestrator.process_student_submission(submission))
+        prompts[project_inputs] = result["pipeline_metrics"]["stage_input_tokens"]["marking"]["prompt"]
+    assert prompts[True] < prompts[False]
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from agents import pdf_text
+from agents.extractor_agent import ExtractorAgent
+from agents.pdf_text import PDFTextCache
+from utils.pdf_memory_benchmark import write_synthetic_pdf
+
+
+@pytest.fixture
+def text_cache(workdir, monkeypatch):
+    cache = PDFTextCache(str(workdir / "pdf_text.sqlite"))
+    monkeypatch.setattr(pdf_text, "_cache", cache)
+    return cache
+
+
+def test_cached_text_is_keyed_by_page_limit_and_mode(text_cache, monkeypatch):
+    text_cache.set("abc", ["page 1", "page 2"], max_pages=2)
+    assert text_cache.get("abc", max_pages=2) == ["page 1", "page 2"]
+    assert text_cache.get("abc", max_pages=0) is None
+    monkeypatch.setattr(pdf_text, "TEXT_MODE", "another extractor")
+    assert text_cache.get("abc", max_pages=2) is None
+
+
+def test_identical_files_under_other_ids_are_reported(text_cache):
+    assert text_cache.record_submitter("abc", "s1") == []
+    assert text_cache.record_submitter("abc", "s2") == ["s1"]
+    assert text_cache.record_submitter("abc", "s1") == ["s2"]
+
+
+def test_raising_the_page_limit_re_extracts_instead_of_serving_truncated_text(text_cache, workdir, monkeypatch):
+    pdf = workdir / "five_pages.pdf"
+    write_synthetic_pdf(str(pdf), pages=5, lines_per_page=3)
+    extractor = ExtractorAgent()
+
+    monkeypatch.setattr(pdf_text, "MAX_PAGES", 2)
+    truncated = asyncio.run(extractor._load_document({"file_path": str(pdf), "student_id": "s1"}))
+    assert truncated["raw_text"].count("\f") == 1 and truncated["pdf_metrics"]["truncated"]
+
+    monkeypatch.setattr(pdf_text, "MAX_PAGES", 0)
+    full = asyncio.run(extractor._load_document({"file_path": str(pdf), "student_id": "s1"}))
+    assert full["raw_text"].count("\f") == 4 and "pdf_metrics" in full
+
+    cached = asyncio.run(extractor._load_document({"file_path": str(pdf), "student_id": "s1"}))
+    assert cached["raw_text"] == full["raw_text"] and "pdf_metrics" not in cached
+    assert text_cache.hits == 1
+
+
+def test_page_layout_is_cached_with_the_text(text_cache, workdir, monkeypatch):
+    pdf = workdir / "two_pages.pdf"
+    write_synthetic_pdf(str(pdf), pages=2, lines_per_page=3)
+    monkeypatch.setattr(pdf_text, "MAX_PAGES", 0)
+    document = asyncio.run(ExtractorAgent()._load_document({"file_path": str(pdf), "student_id": "s1"}))
+
+    sha256 = pdf_text.file_sha256(str(pdf))
+    pages = text_cache.get(sha256, max_pages=0)
+    layouts = text_cache.get_layouts(sha256, max_pages=0)
+    assert "\f".join(pages) == document["raw_text"] and len(layouts) == 2
+    assert (layouts[0]["width"], layouts[0]["height"]) == (612, 842)
+    # Every text box points at the slice of the page text it produced, top of the page first
+    x0, y0, x1, y1, start, end = layouts[0]["boxes"][0]
+    assert 0 <= x0 < x1 <= 612 and 0 <= y0 < y1 <= 842
+    assert pages[0][start:end].startswith("Appendix table row 1.0")
+
+
+def test_pool_workers_are_not_forked_from_the_threaded_process(monkeypatch):
+    monkeypatch.setattr(pdf_text, "_executor", None)
+    executor = pdf_text.get_pdf_executor()
+    try:
+        assert executor._mp_context.get_start_method() in ("forkserver", "spawn")
+    finally:
+        executor.shutdown(wait=True)
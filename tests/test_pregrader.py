@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from agents import analyzer_agent
+from agents.analyzer_agent import EduMarkAgent
+from agents.pregrader import DOWNGRADE_MODEL, PreGrader
+
+PLACEHOLDERS = {field: "Not found" for field in ("introduction", "content", "summary", "references")}
+
+COMPLETE = {
+    "introduction": "This essay examines adaptive tutoring. " * 10,
+    "content": "Adaptive systems adjust pacing and feedback to each learner. " * 70,
+    "summary": "Adaptive tutoring helps when teachers stay in charge. " * 5,
+    "references": "Smith 2019; Jones 2020; Lee 2021; Patel 2022; Chen 2023",
+    "data": "Survey of 120 students",
+    "tables": "Table 1: outcomes",
+}
+
+
+def analyze(structured_data):
+    return asyncio.run(EduMarkAgent().run([{"role": "user", "content": str({"structured_data": structured_data})}]))
+
+
+@pytest.fixture
+def pregrader_on(monkeypatch):
+    monkeypatch.setattr(analyzer_agent, "PREGRADER_ENABLED", True)
+    monkeypatch.setattr(analyzer_agent, "get_pregrader", lambda: PreGrader())
+
+
+def test_features_and_confidence_of_clear_cut_cases():
+    pregrader = PreGrader()
+    short = pregrader.assess({"introduction": "Too short to judge."})
+    assert short.features["words"] < 40 and short.confidence >= 0.9 and short.score <= 20
+    complete = pregrader.assess(COMPLETE)
+    assert complete.features["core_sections"] == 3 and complete.features["references"] == 5
+    assert complete.reason == "complete on every feature"
+
+
+def test_extraction_that_found_nothing_is_not_pregraded():
+    assert not PreGrader.has_content(PLACEHOLDERS)
+    assert PreGrader.has_content({"content": "An actual sentence."})
+
+
+def test_placeholder_extraction_goes_to_the_llm(offline_llm, pregrader_on):
+    result = analyze(PLACEHOLDERS)
+    assert result["analysis_method"] == "llm" and "pregrade" not in result
+    assert len(offline_llm.requests) == 1
+
+
+def test_trivially_short_submission_is_scored_locally(offline_llm, pregrader_on):
+    result = analyze({"introduction": "Too short to judge."})
+    assert result["analysis_method"] == "local"
+    assert result["student_analysis"]["grade"] == "F"
+    assert offline_llm.requests == []
+
+
+def test_complete_submission_is_downgraded_to_the_smaller_model(offline_llm, pregrader_on):
+    result = analyze(COMPLETE)
+    assert result["analysis_method"] == f"llm:{DOWNGRADE_MODEL}"
+    assert offline_llm.requests[0].model == DOWNGRADE_MODEL
+
+
+def test_disabled_pregrader_always_uses_the_llm(offline_llm, monkeypatch):
+    monkeypatch.setattr(analyzer_agent, "PREGRADER_ENABLED", False)
+    result = analyze({"introduction": "Too short to judge."})
+    assert result["analysis_method"] == "llm" and "pregrade" not in result
@@ -0,0 +1,53 @@
+from agents.section_splitter import SectionSplitter
+
+WELL_STRUCTURED = """Artificial Intelligence in Education
+
+1. Introduction
+Artificial intelligence is changing how students learn.
+
+2. Discussion
+Adaptive tutoring personalises content (Smith, 2020), and automated marking shortens feedback loops [1].
+Table 1 Survey results by year group
+
+3. References
+Smith, J. (2020). AI and Learning.
+
+4. Conclusion
+AI should support, not replace, teachers.
+"""
+
+INTRODUCTION_AND_CONCLUSION_ONLY = """Introduction
+Artificial intelligence is changing how students learn.
+Adaptive tutoring personalises content, and automated marking shortens feedback loops.
+Teachers gain time for the students who need them most, and feedback arrives sooner.
+Conclusion
+AI should support, not replace, teachers.
+"""
+
+
+def test_well_structured_submission_is_split_locally():
+    result = SectionSplitter(min_confidence=0.75).try_split(WELL_STRUCTURED)
+    assert result is not None and result.confidence >= 0.75
+    assert result.fields["introduction"] == "Artificial intelligence is changing how students learn."
+    assert result.fields["content"].startswith("Adaptive tutoring")
+    assert result.fields["summary"] == "AI should support, not replace, teachers."
+    assert result.fields["tables"] == "Table 1 Survey results by year group"
+    assert result.fields["citations"] == "(Smith, 2020) [1]"
+
+
+def test_missing_core_section_falls_back_to_the_llm():
+    splitter = SectionSplitter(min_confidence=0.75)
+    split = splitter.split(INTRODUCTION_AND_CONCLUSION_ONLY)
+    assert split.fields["content"] == "Not found"
+    assert split.confidence == 0.0
+    assert splitter.try_split(INTRODUCTION_AND_CONCLUSION_ONLY) is None
+    assert splitter.stats() == {"attempts": 1, "hits": 0, "hit_rate": 0.0}
+
+
+def test_text_without_headings_is_not_split():
+    assert SectionSplitter().split("Just one paragraph of prose about education.").confidence == 0.0
+
+
+def test_low_coverage_is_below_the_threshold():
+    text = "Unheaded preamble. " * 50 + "\nIntroduction\nShort.\nBody\nShort.\nConclusion\nShort.\n"
+    assert SectionSplitter(min_confidence=0.75).try_split(text) is None
@@ -2,15 +2,17 @@
 import sys
 import streamlit as st
 import asyncio
+import hashlib
 import os
 import json
+import time
 import sqlite3
 from datetime import datetime
 from pathlib import Path
 from streamlit_option_menu import option_menu
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from agents.orchestrator import OrchestratorAgent
-from db.database import EduMarkDatabase
+from agents.llm_client import close_llm_client
+from agents.registry import get_database, get_job_queue, grade_submission
 
 
 # Configure Streamlit page
@@ -60,129 +62,69 @@ st.markdown(
 )
 
 
-async def process_submission(file_path: str, student_name: str, student_id: str) -> dict:
+async def process_submission(file_path: str, student_name: str, student_id: str, on_progress=None) -> dict:
     """Process student submission through the AI grading pipeline."""
+    submission_data = {
+        "file_path": file_path,
+        "submission_timestamp": datetime.now().isoformat(),
+        "student_name": student_name,
+        "student_id": student_id
+    }
     try:
-        orchestrator = OrchestratorAgent()
-        submission_data = {
-            "file_path": file_path,
-            "submission_timestamp": datetime.now().isoformat(),
-            "student_name": student_name,
-            "student_id": student_id
-        }
-        result = await orchestrator.process_student_submission(submission_data)
-        
-        # Save submission to database
-        try:
-            db = EduMarkDatabase()
-            print(f"Database path: {db.db_path}")
-            print("Database connection established")
-            
-            # Extract necessary data for database storage
-            score = result.get("analysis_results", {}).get("student_analysis", {}).get("total_score", 0)
-            grade = result.get("analysis_results", {}).get("student_analysis", {}).get("grade", "F")
-            strengths = result.get("analysis_results", {}).get("student_analysis", {}).get("strengths", [])
-            weaknesses = result.get("analysis_results", {}).get("student_analysis", {}).get("weaknesses", [])
-            recommendations = result.get("analysis_results", {}).get("student_analysis", {}).get("recommendations", [])
-            
-            # Extract text content
-            extracted_text = result.get("extracted_data", {}).get("raw_text", "")
-            topics_covered = ["AI in Education", "Personalized Learning"]  # Default topics
-            
-            print(f"About to save submission for {student_name} with ID {student_id}")
-            print(f"Score: {score}, Grade: {grade}")
-            
-            # Prepare feedback text
-            feedback_text = f"Score: {score}/100, Grade: {grade}. "
-            if recommendations:
-                feedback_text += f"Recommendations: {'; '.join(recommendations)}"
-            
-            try:
-                # Check for existing student ID before inserting
-                with sqlite3.connect(db.db_path) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT id FROM submissions WHERE student_id = ?", (student_id,))
-                    existing_record = cursor.fetchone()
-
-                    if existing_record:
-                        # Update existing record instead of creating a duplicate
-                        cursor.execute(
-                            """
-                            UPDATE submissions SET 
-                                student_name = ?,
-                                submission_text = ?,
-                                topics_covered = ?,
-                                strengths = ?,
-                                weaknesses = ?,
-                                feedback = ?,
-                                created_at = CURRENT_TIMESTAMP
-                            WHERE student_id = ?
-                            """,
-                            (
-                                student_name,
-                                extracted_text,
-                                json.dumps(topics_covered),
-                                json.dumps(strengths),
-                                json.dumps(weaknesses),
-                                feedback_text,
-                                student_id
-                            )
-                        )
-                        conn.commit()
-                        submission_id = existing_record[0]
-                        print(f"✅ Updated existing submission for student ID {student_id} with submission ID: {submission_id}")
-                    else:
-                        # No duplicate, insert new record
-                        cursor.execute(
-                            """
-                            INSERT INTO submissions (
-                                student_name, student_id, submission_text, 
-                                topics_covered, strengths, weaknesses, feedback
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                            """,
-                            (
-                                student_name,
-                                student_id,
-                                extracted_text,
-                                json.dumps(topics_covered),
-                                json.dumps(strengths),
-                                json.dumps(weaknesses),
-                                feedback_text
-                            )
-                        )
-                        conn.commit()
-                        submission_id = cursor.lastrowid
-                        print(f"✅ Successfully saved new submission to database with ID: {submission_id}")
-                
-            except Exception as direct_db_error:
-                print(f"Error on direct DB operation: {direct_db_error}")
-                # Fall back to the class method if necessary
-                try:
-                    # First check if record exists using the database class
-                    submissions = db.search_submissions([], [])
-                    existing_submission = next((s for s in submissions if s["student_id"] == student_id), None)
-                    
-                    if existing_submission:
-                        # Update feedback for existing record
-                        db.add_feedback(existing_submission["id"], feedback_text)
-                        print(f"✅ Updated feedback for existing submission via class method")
-                    else:
-                        # Create new record
-                        submission_id = db.add_submission(student_name, student_id, extracted_text)
-                        print(f"✅ Created new submission via class method with ID: {submission_id}")
-                except Exception as class_method_error:
-                    print(f"Error using class methods: {class_method_error}")
-                    raise
-                    
-        except Exception as e:
-            print(f"❌ Error saving to database: {e}")
-            import traceback
-            traceback.print_exc()
-            # Continue even if database save fails
-        
-        return result
-    except Exception as e:
-        raise
+        return await grade_submission(submission_data, on_progress=on_progress)
+    finally:
+        # Every page run has its own event loop; close its pooled connections with it
+        await close_llm_client()
+
+
+# Grade through the background job queue instead of inside the page: "auto" (the default)
+# whenever a grading worker (`python utils/worker.py`) is polling the queue, or always "on" / "off"
+USE_JOB_QUEUE = os.getenv("EDUMARK_USE_JOB_QUEUE", "auto").lower()
+POLL_SECONDS = float(os.getenv("EDUMARK_JOB_POLL_SECONDS", "2"))
+
+STAGE_LABELS = {
+    "extract_analyze": "Extracting and analyzing submission...",
+    "extraction": "Extracting submission content...",
+    "analysis": "Analyzing submission...",
+    "grading": "Matching grade bands...",
+    "marking": "Marking submission...",
+    "recommendation": "Preparing recommendations...",
+}
+
+# Stages whose LLM output is worth showing while it is generated
+LIVE_STAGES = {"extract_analyze": "📊 Live analysis", "analysis": "📊 Live analysis", "marking": "📝 Live feedback"}
+
+
+def make_progress_handler(progress_bar, status_text, live_container):
+    """Build a pipeline progress callback that updates the page incrementally"""
+    completed = set()
+    buffers = {}
+    placeholders = {}
+    last_render = {}
+
+    def on_progress(stage, event, payload):
+        if event == "stage_started":
+            status_text.text(STAGE_LABELS.get(stage, f"Running {stage}..."))
+            if stage in LIVE_STAGES and stage not in placeholders:
+                live_container.caption(LIVE_STAGES[stage])
+                placeholders[stage] = live_container.empty()
+                buffers[stage] = ""
+        elif event == "token" and stage in placeholders:
+            buffers[stage] += payload
+            # Throttle redraws; Streamlit re-renders the whole element each time
+            now = datetime.now().timestamp()
+            if now - last_render.get(stage, 0) >= 0.1:
+                placeholders[stage].code(buffers[stage], language="json")
+                last_render[stage] = now
+        elif event == "stage_completed":
+            completed.add(stage)
+            if stage in placeholders:
+                placeholders[stage].code(buffers[stage], language="json")
+            # Fused mode runs one combined stage instead of extraction + analysis
+            total = len(STAGE_LABELS) - (2 if "extract_analyze" in completed else 1)
+            progress_bar.progress(min(100, int(100 * len(completed) / total)))
+
+    return on_progress
 
 
 def save_uploaded_file(uploaded_file) -> str:
@@ -241,7 +183,7 @@ def display_students_tab():
     
     try:
         # Create database connection
-        db = EduMarkDatabase()
+        db = get_database()
         
         # Get all submissions directly from the database to ensure we get all fields
         try:
@@ -391,6 +333,143 @@ def display_students_tab():
         traceback.print_exc()
 
 
+def display_results(result: dict, save: bool = True):
+    """Render a completed grading result and optionally save it under results/"""
+    # Display results in tabs
+    tab1, tab2, tab3 = st.tabs(
+        ["📊 Analysis", "📈 Strengths & Weaknesses", "💡 Recommendations"]
+    )
+
+    # Analysis tab
+    with tab1:
+        st.subheader("Submission Analysis")
+        duplicate_of = result.get("extracted_data", {}).get("duplicate_of")
+        if duplicate_of:
+            st.warning(f"⚠️ An identical file was already submitted by: {', '.join(duplicate_of)}")
+        extracted_data = result.get("extracted_data", {}).get("structured_data", {})
+        st.write(extracted_data.get("content", "No analysis available."))
+
+        score = result.get("analysis_results", {}).get("student_analysis", {}).get("total_score", 0)
+        grade = result.get("analysis_results", {}).get("student_analysis", {}).get("grade", "F")
+        st.metric(
+            "Overall Score",
+            f"{score}/100",
+            f"Grade: {grade}"
+        )
+
+    # Strengths & Weaknesses tab
+    with tab2:
+        st.subheader("Strengths & Weaknesses")
+        strengths = result.get("analysis_results", {}).get("student_analysis", {}).get("strengths", [])
+        weaknesses = result.get("analysis_results", {}).get("student_analysis", {}).get("weaknesses", [])
+
+        if strengths:
+            st.success("### Strengths")
+            for item in strengths:
+                st.write(f"- {item}")
+        else:
+            st.warning("No strengths identified.")
+
+        if weaknesses:
+            st.error("### Weaknesses")
+            for item in weaknesses:
+                st.write(f"- {item}")
+        else:
+            st.warning("No weaknesses identified.")
+
+    # Recommendations tab
+    with tab3:
+        st.subheader("Recommendations")
+        recommendations = result.get("analysis_results", {}).get("student_analysis", {}).get("recommendations", [])
+        if recommendations:
+            for rec in recommendations:
+                st.info(f"- {rec}", icon="💡")
+        else:
+            st.warning("No specific recommendations available.")
+
+    if not save:
+        return
+
+    # Save results
+    output_dir = Path("results")
+    if not output_dir.exists():  # Check if directory exists
+        try:
+            output_dir.mkdir(parents=True, exist_ok=True)
+            print(f"✅ Created directory: {output_dir}")  # Debugging log
+        except Exception as e:
+            print(f"❌ Error creating results directory: {e}")  # Debugging log
+            st.error(f"Error creating results directory: {str(e)}")
+    output_file = output_dir / f"analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    # Try saving the result
+    try:
+        with open(output_file, "w") as f:
+            f.write(str(result))  # Make sure 'result' is a string
+        st.success(f"Results saved to: {output_file}")
+        print(f"✅ Successfully saved results to: {output_file}")  # Debugging log
+    except Exception as e:
+        print(f"❌ Error saving results: {e}")  # Debugging log
+        st.error(f"Error saving results: {str(e)}")
+
+
+def queue_by_default() -> bool:
+    """Whether uploads go to the job queue unless the user says otherwise"""
+    if USE_JOB_QUEUE in ("1", "on", "true", "yes"):
+        return True
+    if USE_JOB_QUEUE in ("0", "off", "false", "no"):
+        return False
+    try:
+        return get_job_queue().live_workers() > 0
+    except Exception as e:
+        print(f"Job queue unavailable, grading in the page: {e}")
+        return False
+
+
+def handle_queued_submission(uploaded_file, student_name: str, student_id: str):
+    """Enqueue the upload for a grading worker once, then poll its status without blocking"""
+    file_bytes = uploaded_file.getvalue()
+    job_key = f"{student_id}:{hashlib.sha256(file_bytes).hexdigest()}"
+    jobs = st.session_state.setdefault("grading_jobs", {})
+    queue = get_job_queue()
+
+    if job_key not in jobs:
+        payload = {
+            "submission_timestamp": datetime.now().isoformat(),
+            "student_name": student_name,
+            "student_id": student_id,
+        }
+        jobs[job_key] = queue.enqueue(payload, file_name=uploaded_file.name, file_data=file_bytes, dedupe_key=job_key)
+
+    job = queue.get(jobs[job_key])
+    if job is None:
+        jobs.pop(job_key, None)
+        st.error("Grading job not found. Please upload the file again.")
+        return
+
+    if job["status"] == "queued":
+        ahead = queue.queue_position(job["id"])
+        st.info(f"Job #{job['id']} is queued ({ahead} ahead). Waiting for a grading worker (`python utils/worker.py`)...")
+    elif job["status"] == "running":
+        st.info(f"Job #{job['id']} is being graded by {job['worker_id']} (attempt {job['attempts']})...")
+    elif job["status"] == "completed":
+        st.success(f"Job #{job['id']} completed.")
+        saved = st.session_state.setdefault("saved_jobs", set())
+        display_results(job["result"], save=job["id"] not in saved)
+        saved.add(job["id"])
+        return
+    else:
+        st.error(f"Job #{job['id']} {job['status']}: {job.get('error') or 'no details'}")
+        if st.button("Retry grading"):
+            jobs.pop(job_key, None)
+            st.rerun()
+        return
+
+    if st.button("Cancel grading"):
+        queue.cancel(job["id"])
+    # Poll: rerun the script shortly to refresh the job status
+    time.sleep(POLL_SECONDS)
+    st.rerun()
+
+
 def main():
     # Sidebar navigation
     with st.sidebar:
@@ -424,7 +503,16 @@ def main():
             help="Upload a PDF file to analyze.",
         )
 
-        if uploaded_file and student_name and student_id:
+        use_queue = st.checkbox(
+            "Grade in the background",
+            value=queue_by_default(),
+            help="Queue the submission for a grading worker instead of processing it in this page. "
+                 "On by default while a worker (`python utils/worker.py`) is running.",
+        )
+
+        if uploaded_file and student_name and student_id and use_queue:
+            handle_queued_submission(uploaded_file, student_name, student_id)
+        elif uploaded_file and student_name and student_id:
             try:
                 with st.spinner("Saving uploaded file..."):
                     file_path = save_uploaded_file(uploaded_file)
@@ -436,86 +524,30 @@ def main():
                 status_text = st.empty()
 
                 # Process submission
+                live_output = st.container()
+
                 try:
-                    status_text.text("Analyzing submission...")
-                    progress_bar.progress(25)
+                    status_text.text("Starting analysis...")
+                    on_progress = make_progress_handler(progress_bar, status_text, live_output)
 
-                    # Run analysis asynchronously
-                    result = asyncio.run(process_submission(file_path, student_name, student_id))
+                    # Run analysis asynchronously, streaming partial output to the page. If the user
+                    # leaves or reruns the page, Streamlit raises StopException from a progress
+                    # callback, which cancels every running stage and LLM call.
+                    result = asyncio.run(process_submission(file_path, student_name, student_id, on_progress))
 
                     # Check if the process was successful
                     if result.get("status") == "completed":
                         progress_bar.progress(100)
                         status_text.text("Analysis complete!")
 
-                        # Display results in tabs
-                        tab1, tab2, tab3 = st.tabs(
-                            ["📊 Analysis", "📈 Strengths & Weaknesses", "💡 Recommendations"]
+                        display_results(result)
+                    elif result.get("status") == "timed_out":
+                        st.warning(
+                            f"Grading timed out after {', '.join(result.get('completed_stages', [])) or 'no stages'}. "
+                            "Submit again to resume from where it stopped."
                         )
-
-                        # Analysis tab
-                        with tab1:
-                            st.subheader("Submission Analysis")
-                            extracted_data = result.get("extracted_data", {}).get("structured_data", {})
-                            st.write(extracted_data.get("content", "No analysis available."))
-                            
-                            score = result.get("analysis_results", {}).get("student_analysis", {}).get("total_score", 0)
-                            grade = result.get("analysis_results", {}).get("student_analysis", {}).get("grade", "F")
-                            st.metric(
-                                "Overall Score",
-                                f"{score}/100",
-                                f"Grade: {grade}"
-                            )
-
-                        # Strengths & Weaknesses tab
-                        with tab2:
-                            st.subheader("Strengths & Weaknesses")
-                            strengths = result.get("analysis_results", {}).get("student_analysis", {}).get("strengths", [])
-                            weaknesses = result.get("analysis_results", {}).get("student_analysis", {}).get("weaknesses", [])
-
-                            if strengths:
-                                st.success("### Strengths")
-                                for item in strengths:
-                                    st.write(f"- {item}")
-                            else:
-                                st.warning("No strengths identified.")
-
-                            if weaknesses:
-                                st.error("### Weaknesses")
-                                for item in weaknesses:
-                                    st.write(f"- {item}")
-                            else:
-                                st.warning("No weaknesses identified.")
-
-                        # Recommendations tab
-                        with tab3:
-                            st.subheader("Recommendations")
-                            recommendations = result.get("analysis_results", {}).get("student_analysis", {}).get("recommendations", [])
-                            if recommendations:
-                                for rec in recommendations:
-                                    st.info(f"- {rec}", icon="💡")
-                            else:
-                                st.warning("No specific recommendations available.")
-
-                        # Save results
-                        output_dir = Path("results")
-                        if not output_dir.exists():  # Check if directory exists
-                            try:
-                                output_dir.mkdir(parents=True, exist_ok=True)
-                                print(f"✅ Created directory: {output_dir}")  # Debugging log
-                            except Exception as e:
-                                print(f"❌ Error creating results directory: {e}")  # Debugging log
-                                st.error(f"Error creating results directory: {str(e)}")
-                        output_file = output_dir / f"analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-                        # Try saving the result
-                        try:
-                            with open(output_file, "w") as f:
-                                f.write(str(result))  # Make sure 'result' is a string
-                            st.success(f"Results saved to: {output_file}")
-                            print(f"✅ Successfully saved results to: {output_file}")  # Debugging log
-                        except Exception as e:
-                            print(f"❌ Error saving results: {e}")  # Debugging log
-                            st.error(f"Error saving results: {str(e)}")
+                    else:
+                        st.error(f"Analysis did not complete: {result.get('error', result.get('status'))}")
 
                 finally:
                     # Cleanup uploaded file
@@ -0,0 +1,192 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Set
+
+# Adjust this path to point to your project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agents.llm_client import close_llm_client
+from agents.pipeline import percentile
+from agents.registry import get_database, get_orchestrator
+from agents.section_splitter import get_section_splitter
+
+
+def load_manifest(source: Path) -> List[Dict[str, str]]:
+    """Read submissions from a folder of PDFs or a CSV/JSONL manifest (student_name, student_id, file)"""
+    if source.is_dir():
+        entries = []
+        for pdf in sorted(source.glob("*.pdf")):
+            # "<student_id>_<name>.pdf", or the bare file stem for both
+            student_id, _, name = pdf.stem.partition("_")
+            entries.append({
+                "student_name": name.replace("_", " ") or student_id,
+                "student_id": student_id,
+                "file": str(pdf),
+            })
+        return entries
+
+    with open(source, "r", encoding="utf-8") as f:
+        if source.suffix == ".jsonl":
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    for row in rows:
+        file_path = Path(row["file"])
+        if not file_path.is_absolute():
+            row["file"] = str(source.parent / file_path)
+    return rows
+
+
+def load_completed(state_file: Path) -> Set[str]:
+    """Student IDs already graded and saved by an earlier run"""
+    completed: Set[str] = set()
+    if state_file.exists():
+        with open(state_file, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    if entry.get("status") == "completed":
+                        completed.add(entry["student_id"])
+    return completed
+
+
+class BatchRunner:
+    def __init__(self, state_file: Path, concurrency: int, flush_every: int):
+        self.state_file = state_file
+        self.concurrency = concurrency
+        self.flush_every = flush_every
+        self.orchestrator = get_orchestrator()
+        self.db = get_database()
+        self.pending: List[Dict[str, Any]] = []
+        self.latencies: List[float] = []
+        self.stage_seconds: Dict[str, List[float]] = {}
+        self.stage_tokens: Dict[str, List[Dict[str, int]]] = {}
+        self.failed = 0
+
+    async def grade_one(self, entry: Dict[str, str], semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            submission = {
+                "file_path": entry["file"],
+                "submission_timestamp": datetime.now().isoformat(),
+                "student_name": entry["student_name"],
+                "student_id": entry["student_id"],
+            }
+            started = time.perf_counter()
+            try:
+                result = await self.orchestrator.process_student_submission(submission)
+            except Exception as e:
+                result = {"status": "failed", "error": str(e)}
+            if result.get("status") != "completed":
+                # Not marked done, so the next run retries it from its checkpoints
+                self.failed += 1
+                self._append_state({
+                    "student_id": entry["student_id"],
+                    "file": entry["file"],
+                    "status": result.get("status"),
+                    "error": result.get("error"),
+                })
+                return
+            self.latencies.append(time.perf_counter() - started)
+            metrics = result.get("pipeline_metrics", {})
+            for stage, seconds in metrics.get("stage_seconds", {}).items():
+                self.stage_seconds.setdefault(stage, []).append(seconds)
+            for stage, tokens in metrics.get("stage_input_tokens", {}).items():
+                self.stage_tokens.setdefault(stage, []).append(tokens)
+
+            record = self.db.submission_record(entry["student_name"], entry["student_id"], result)
+            self.pending.append({"record": record, "file": entry["file"], "run_id": result["run_id"]})
+            if len(self.pending) >= self.flush_every:
+                self.flush()
+
+    def flush(self) -> None:
+        """Write buffered results to the database, then mark them done in the state file"""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        self.db.upsert_submissions([item["record"] for item in batch])
+        for item in batch:
+            # Saved: the run no longer needs its checkpoints to be resumed
+            self.orchestrator.clear_checkpoints(item["run_id"])
+            record = item["record"]
+            self._append_state({
+                "student_id": record["student_id"],
+                "file": item["file"],
+                "status": "completed",
+                "score": record["score"],
+            })
+        print(f"💾 Saved {len(batch)} submissions")
+
+    def _append_state(self, entry: Dict[str, Any]) -> None:
+        with open(self.state_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    async def run(self, entries: List[Dict[str, str]]) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            await asyncio.gather(*(self.grade_one(entry, semaphore) for entry in entries))
+        finally:
+            # Keep finished work even if the batch is interrupted
+            self.flush()
+            await close_llm_client()
+
+    def report(self, elapsed: float, skipped: int) -> None:
+        graded = len(self.latencies)
+        print("\n📊 Batch summary")
+        print(f"Graded: {graded}  Failed: {self.failed}  Skipped (already done): {skipped}")
+        print(f"Wall time: {elapsed:.1f}s  Throughput: {graded / elapsed if elapsed else 0:.2f} submissions/s")
+        rows = [("total", self.latencies)] + sorted(self.stage_seconds.items())
+        print(f"{'stage':<16}{'p50':>9}{'p90':>9}{'p99':>9}")
+        for name, values in rows:
+            if values:
+                print(f"{name:<16}{percentile(values, 50):>8.2f}s{percentile(values, 90):>8.2f}s{percentile(values, 99):>8.2f}s")
+        splitter = get_section_splitter().stats()
+        if splitter["attempts"]:
+            print(f"Local section splitting: {splitter['hits']}/{splitter['attempts']} "
+                  f"submissions ({splitter['hit_rate']:.0%}) skipped the extraction LLM call")
+        if self.stage_tokens:
+            # input: the stage's projected input message; prompt: what its LLM requests carried
+            print(f"\n{'stage input tokens (mean)':<28}{'input':>9}{'prompt':>9}")
+            for name, samples in sorted(self.stage_tokens.items()):
+                given = sum(s["input"] for s in samples) / len(samples)
+                prompt = sum(s["prompt"] for s in samples) / len(samples)
+                print(f"{name:<28}{given:>9.0f}{prompt:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade a cohort of PDF submissions")
+    parser.add_argument("source", help="Folder of PDFs, or a CSV/JSONL manifest with student_name, student_id, file")
+    parser.add_argument("--concurrency", type=int, default=4, help="Submissions graded at the same time")
+    parser.add_argument("--flush-every", type=int, default=20, help="Database write batch size")
+    parser.add_argument("--batch-window", type=float, default=None,
+                        help="Seconds to pool concurrent analyses into one request (default: EDUMARK_ANALYSIS_BATCH_WINDOW)")
+    parser.add_argument("--state-file", help="Progress file used to resume (default: results/batch_<source>.state.jsonl)")
+    args = parser.parse_args()
+
+    source = Path(args.source)
+    state_file = Path(args.state_file or Path("results") / f"batch_{source.stem}.state.jsonl")
+    state_file.parent.mkdir(parents=True, exist_ok=True)
+
+    entries = load_manifest(source)
+    completed = load_completed(state_file)
+    todo = [entry for entry in entries if entry["student_id"] not in completed]
+    print(f"🎓 {len(entries)} submissions, {len(entries) - len(todo)} already done, {len(todo)} to grade")
+
+    runner = BatchRunner(state_file, args.concurrency, args.flush_every)
+    if args.batch_window is not None:
+        runner.orchestrator.analyzer.batch_window = args.batch_window
+    started = time.perf_counter()
+    try:
+        asyncio.run(runner.run(todo))
+    except KeyboardInterrupt:
+        print("\n⏸️ Interrupted; re-run the same command to resume")
+    runner.report(time.perf_counter() - started, len(entries) - len(todo))
+
+
+if __name__ == "__main__":
+    main()
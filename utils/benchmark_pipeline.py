@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# Adjust this path to point to your project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agents.llm_backends import ReplayBackend, set_llm_backend
+from agents.llm_cache import get_llm_cache
+from agents.llm_scheduler import LLMScheduler, set_llm_scheduler
+from agents.orchestrator import OrchestratorAgent
+from agents.pipeline import percentile
+from agents.registry import get_database, get_orchestrator
+from agents.section_splitter import get_section_splitter
+
+SAMPLE_TEXT = """Artificial Intelligence in Education
+
+Introduction
+Artificial intelligence is changing how students learn and how teachers assess work.
+
+Body
+Adaptive tutoring systems personalise content, while automated marking shortens feedback loops.
+
+References
+Smith, J. (2020). AI and Learning. Jones, K. (2021). Automated Assessment.
+
+Conclusion
+AI should support, not replace, teachers.
+"""
+
+
+async def compare_projection(text: str) -> None:
+    """Grade the text with stage input projection off, then on, and compare the prompts sent"""
+    prompts = {}
+    for label, project_inputs in (("before", False), ("after", True)):
+        orchestrator = OrchestratorAgent(db=get_database(), project_inputs=project_inputs)
+        submission = {"text": text, "student_name": "Benchmark Student", "student_id": f"projection-{label}"}
+        result = await orchestrator.process_student_submission(submission)
+        orchestrator.clear_checkpoints(result["run_id"])
+        for name, tokens in result["pipeline_metrics"]["stage_input_tokens"].items():
+            prompts.setdefault(name, {})[label] = tokens["prompt"]
+
+    print("\n📊 Prompt tokens per stage, without and with input projection")
+    print(f"{'stage':<16}{'before':>9}{'after':>9}")
+    for name, tokens in prompts.items():
+        print(f"{name:<16}{tokens.get('before', 0):>9}{tokens.get('after', 0):>9}")
+
+
+async def run_benchmark(args) -> None:
+    text = SAMPLE_TEXT
+    if args.text_file:
+        with open(args.text_file, "r", encoding="utf-8") as f:
+            text = f.read()
+    if args.compare_projection:
+        await compare_projection(text)
+        return
+
+    orchestrator = get_orchestrator()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one(index: int) -> None:
+        submission = {
+            "text": text,
+            "student_name": f"Benchmark Student {index}",
+            "student_id": f"bench-{index}",
+        }
+        async with semaphore:
+            started = time.perf_counter()
+            result = await orchestrator.process_student_submission(submission)
+            latencies.append(time.perf_counter() - started)
+            # Nothing is saved, so drop the checkpoints or the next run would resume from them
+            orchestrator.clear_checkpoints(result["run_id"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.submissions)))
+    elapsed = time.perf_counter() - started
+
+    print("\n📊 Benchmark results")
+    print(f"Submissions:  {args.submissions} (concurrency {args.concurrency})")
+    print(f"Wall time:    {elapsed:.2f}s")
+    print(f"Throughput:   {args.submissions / elapsed:.2f} submissions/s")
+    print(f"Latency mean: {statistics.mean(latencies):.3f}s")
+    print(f"Latency p50:  {percentile(latencies, 50):.3f}s")
+    print(f"Latency p95:  {percentile(latencies, 95):.3f}s")
+    print(f"Cache:        {get_llm_cache().stats()}")
+    print(f"Splitter:     {get_section_splitter().stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the grading pipeline without network access")
+    parser.add_argument("--submissions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated seconds per LLM call")
+    parser.add_argument("--tokens-per-second", type=float, default=250.0)
+    parser.add_argument("--replay-file", help="JSONL recorded with EDUMARK_LLM_BACKEND=record")
+    parser.add_argument("--text-file", help="Plain-text submission to grade")
+    parser.add_argument("--rpm", type=float, default=100000.0, help="Scheduler request limit")
+    parser.add_argument("--cache", action="store_true", help="Keep the LLM response cache enabled")
+    parser.add_argument("--compare-projection", action="store_true",
+                        help="Report each stage's prompt tokens with input projection off and on, then exit")
+    args = parser.parse_args()
+
+    set_llm_backend(ReplayBackend(args.replay_file, latency=args.latency, tokens_per_second=args.tokens_per_second))
+    set_llm_scheduler(LLMScheduler(
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.rpm * 10000,
+        max_concurrency=max(args.concurrency * 4, 1),
+        initial_concurrency=max(args.concurrency * 4, 1),
+    ))
+    if not args.cache:
+        get_llm_cache().enabled = False
+    asyncio.run(run_benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Adjust this path to point to your project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+LINE = "Appendix table row {page}.{line}: measured value, expected value, deviation and notes on the method used"
+
+
+def write_synthetic_pdf(path: str, pages: int, lines_per_page: int = 60) -> None:
+    """Write a plain-text PDF with `pages` pages of Helvetica text lines"""
+    font_ref = 3 + 2 * pages
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * i} 0 R' for i in range(pages))}] /Count {pages} >>",
+    ]
+    for page in range(pages):
+        lines = " ".join(f"({LINE.format(page=page + 1, line=line)}) '" for line in range(lines_per_page))
+        content = f"BT /F1 9 Tf 40 800 Td 12 TL {lines} ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents {4 + 2 * page} 0 R "
+            f"/Resources << /Font << /F1 {font_ref} 0 R >> >> >>"
+        )
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    with open(path, "wb") as f:
+        offsets = []
+        position = f.write(b"%PDF-1.4\n")
+        for number, body in enumerate(objects, start=1):
+            offsets.append(position)
+            position += f.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+        f.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+        f.write("".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1"))
+        f.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{position}\n%%EOF\n".encode("latin-1"))
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # bytes on macOS, KiB elsewhere
+    return round(own / scale, 1)
+
+
+def pool_peak_rss_mb(executor) -> float:
+    """Largest peak resident memory among the pool's workers (Linux only, else 0).
+
+    The pool does not fork its workers from this process, so RUSAGE_CHILDREN never sees them;
+    read each live worker's high-water mark from /proc before the pool shuts down.
+    """
+    peak_kib = 0
+    for pid in list(getattr(executor, "_processes", None) or {}):
+        try:
+            with open(f"/proc/{pid}/status", encoding="ascii") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        peak_kib = max(peak_kib, int(line.split()[1]))
+        except OSError:
+            continue
+    return round(peak_kib / 1024, 1)
+
+
+async def extract_once(pdf_path: str) -> dict:
+    """Child process: run the extraction stage on one PDF and report peak memory"""
+    from agents.extractor_agent import ExtractorAgent
+    from agents.llm_backends import ReplayBackend, set_llm_backend
+    from agents.llm_scheduler import LLMScheduler, set_llm_scheduler
+    from agents.pdf_text import get_pdf_executor
+
+    set_llm_backend(ReplayBackend(latency=0.0, tokens_per_second=1e9))
+    set_llm_scheduler(LLMScheduler(requests_per_minute=1e6, tokens_per_minute=1e10, max_concurrency=16))
+    started = time.perf_counter()
+    result = await ExtractorAgent().run([{"role": "user", "content": str({"file_path": pdf_path})}])
+    elapsed = time.perf_counter() - started
+    workers = pool_peak_rss_mb(get_pdf_executor())
+    get_pdf_executor().shutdown(wait=True)
+
+    return {
+        "seconds": round(elapsed, 2),
+        "raw_text_chars": len(result["raw_text"]),
+        "peak_rss_mb": peak_rss_mb(),
+        "worker_peak_rss_mb": workers,
+    }
+
+
+def measure(pdf_path: str, streamed: bool) -> dict:
+    """Run one extraction in a fresh interpreter so peak RSS is not shared between runs"""
+    env = dict(
+        os.environ,
+        EDUMARK_STREAM_PAGES="1" if streamed else "0",
+        EDUMARK_PDF_MAX_PAGES="0",
+        EDUMARK_PDF_CACHE="off",
+        EDUMARK_LLM_CACHE="off",
+    )
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", pdf_path],
+        env=env, cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show peak memory of PDF extraction as documents grow")
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 150, 300])
+    parser.add_argument("--lines-per-page", type=int, default=60)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            result = asyncio.run(extract_once(args.child))
+            sys.stdout = stdout
+        print(json.dumps(result))
+        return
+
+    print("\n📊 Peak RSS (MB) by document size")
+    print(f"{'pages':>6} {'PDF MB':>7} {'whole':>8} {'workers':>8} {'streamed':>9} {'workers':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in args.pages:
+            pdf_path = os.path.join(tmp, f"synthetic_{pages}.pdf")
+            write_synthetic_pdf(pdf_path, pages, args.lines_per_page)
+            whole = measure(pdf_path, streamed=False)
+            streamed = measure(pdf_path, streamed=True)
+            print(
+                f"{pages:>6} {os.path.getsize(pdf_path) / 1e6:>7.1f} "
+                f"{whole['peak_rss_mb']:>8} {whole['worker_peak_rss_mb']:>8} "
+                f"{streamed['peak_rss_mb']:>9} {streamed['worker_peak_rss_mb']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
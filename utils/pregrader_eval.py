@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Adjust this path to point to your project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agents.analyzer_agent import EduMarkAgent
+from agents.llm_client import close_llm_client
+from agents.pregrader import DOWNGRADE_CONFIDENCE, SKIP_CONFIDENCE, get_pregrader
+from agents.section_splitter import get_section_splitter
+
+
+def load_labelled(path: Path) -> List[Dict[str, Any]]:
+    """JSONL items with structured_data or text, labelled with a human-assigned total_score.
+
+    The submissions table is no usable source of labels: its score column mixes TF-IDF
+    novelty scores, LLM scores and, once the pre-grader is on, the pre-grader's own scores.
+    """
+    items = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                items.append(json.loads(line))
+    return items
+
+
+async def label_missing(items: List[Dict[str, Any]]) -> None:
+    """Ask EduMarkAgent for the score of items that have no label yet.
+
+    These labels come from another model, not from a marker, so they are tagged
+    label_source "EduMarkAgent" and kept out of the headline accuracy.
+    """
+    analyzer = EduMarkAgent()
+    unlabelled = [item for item in items if item.get("total_score") is None]
+    try:
+        results = await asyncio.gather(*(analyzer._analyze(item["structured_data"]) for item in unlabelled))
+    finally:
+        await close_llm_client()
+    for item, result in zip(unlabelled, results):
+        item["total_score"] = result["student_analysis"]["total_score"]
+        item["label_source"] = "EduMarkAgent"
+
+
+def decision(confidence: float) -> str:
+    if confidence >= SKIP_CONFIDENCE:
+        return "skip"
+    if confidence >= DOWNGRADE_CONFIDENCE:
+        return "downgrade"
+    return "llm"
+
+
+def report(rows: List[Dict[str, Any]], title: str) -> None:
+    grade = EduMarkAgent()._calculate_grade
+    print(f"\n📊 {title} ({len(rows)} submissions)")
+    print(f"{'decision':<11}{'n':>5}{'share':>8}{'MAE':>8}{'±10':>8}{'grade':>8}")
+    for name in ("skip", "downgrade", "llm", "all"):
+        group = rows if name == "all" else [row for row in rows if row["decision"] == name]
+        if not group:
+            continue
+        errors = [abs(row["pregrade"] - row["label"]) for row in group]
+        within = sum(1 for error in errors if error <= 10) / len(group)
+        same_grade = sum(1 for row in group if grade(row["pregrade"]) == grade(row["label"])) / len(group)
+        print(f"{name:<11}{len(group):>5}{len(group) / len(rows):>8.0%}{sum(errors) / len(group):>8.1f}"
+              f"{within:>8.0%}{same_grade:>8.0%}")
+    print(f"LLM analysis calls skipped: {sum(row['decision'] == 'skip' for row in rows)}, "
+          f"downgraded: {sum(row['decision'] == 'downgrade' for row in rows)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the local pre-grader against human labels, and optionally against EduMarkAgent"
+    )
+    parser.add_argument("--labels", required=True, help="JSONL with structured_data or text and a human total_score")
+    parser.add_argument("--label-missing", action="store_true",
+                        help="Score unlabelled items with EduMarkAgent (calls the LLM); reported apart from human labels")
+    parser.add_argument("--save-labels", help="Write the labelled set to this JSONL file for reuse")
+    args = parser.parse_args()
+
+    items = load_labelled(Path(args.labels))
+    splitter = get_section_splitter()
+    for item in items:
+        if "structured_data" not in item:
+            # Raw text is split locally so the pre-grader sees the same fields the extractor produces
+            item["structured_data"] = splitter.split(item.get("text", "")).fields
+    if args.label_missing:
+        asyncio.run(label_missing(items))
+    items = [item for item in items if item.get("total_score") is not None]
+    if not items:
+        print("No labelled submissions found.")
+        return
+    if args.save_labels:
+        with open(args.save_labels, "w", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(item) + "\n")
+
+    pregrader = get_pregrader()
+    rows = []
+    for item in items:
+        pregrade = pregrader.assess(item["structured_data"])
+        rows.append({
+            "label": float(item["total_score"]),
+            "model_label": item.get("label_source") == "EduMarkAgent",
+            "pregrade": pregrade.score,
+            "decision": decision(pregrade.confidence),
+        })
+
+    human = [row for row in rows if not row["model_label"]]
+    model = [row for row in rows if row["model_label"]]
+    if human:
+        report(human, "Pre-grader vs human-labelled scores")
+    if model:
+        report(model, "Pre-grader vs EduMarkAgent scores (model-derived labels, not ground truth)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+import traceback
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Set
+
+# Adjust this path to point to your project root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agents.llm_client import close_llm_client
+from agents.registry import get_job_queue, grade_submission
+from db.job_queue import WORKER_PRESENCE_SECONDS
+
+
+class GradingWorker:
+    """Claims grading jobs from the shared queue and runs them, keeping each lease alive.
+
+    While it runs, the worker reports itself to the store, which is how the app knows
+    to grade uploads in the background.
+    """
+
+    def __init__(self, worker_id: str, concurrency: int, lease_seconds: float, poll_seconds: float):
+        self.worker_id = worker_id
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.queue = get_job_queue()
+        self.upload_dir = Path(os.getenv("EDUMARK_WORKER_UPLOAD_DIR", "uploads"))
+        self.active: Set[asyncio.Task] = set()
+
+    async def run_forever(self) -> None:
+        print(f"👷 Worker {self.worker_id}: polling {self.queue!r} with {self.concurrency} slots")
+        seen_at = float("-inf")
+        try:
+            while True:
+                if time.monotonic() - seen_at >= WORKER_PRESENCE_SECONDS:
+                    await asyncio.to_thread(self.queue.touch_worker, self.worker_id)
+                    seen_at = time.monotonic()
+                if len(self.active) < self.concurrency:
+                    job = await asyncio.to_thread(self.queue.claim, self.worker_id, self.lease_seconds)
+                    if job is not None:
+                        task = asyncio.create_task(self.run_job(job))
+                        self.active.add(task)
+                        task.add_done_callback(self.active.discard)
+                        continue
+                await asyncio.sleep(self.poll_seconds)
+        finally:
+            for task in self.active:
+                task.cancel()
+            await asyncio.gather(*self.active, return_exceptions=True)
+            await asyncio.to_thread(self.queue.forget_worker, self.worker_id)
+            await close_llm_client()
+
+    async def run_job(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        print(f"👷 Worker {self.worker_id}: running job {job_id} (attempt {job['attempts']})")
+        submission_data = dict(job["payload"])
+        file_path = None
+        if job.get("file_data") is not None:
+            self.upload_dir.mkdir(parents=True, exist_ok=True)
+            file_path = self.upload_dir / f"job_{job_id}_{job.get('file_name') or 'submission.pdf'}"
+            file_path.write_bytes(job["file_data"])
+            submission_data["file_path"] = str(file_path)
+
+        grading = asyncio.create_task(grade_submission(submission_data))
+        heartbeat = asyncio.create_task(self.keep_lease(job_id, grading))
+        try:
+            result = await grading
+            result["submission_data"].pop("file_path", None)
+            if result.get("status") == "completed":
+                await asyncio.to_thread(self.queue.complete, job_id, self.worker_id, result)
+                print(f"✅ Worker {self.worker_id}: job {job_id} completed")
+            else:
+                # Re-queued jobs resume from the stages that did finish
+                error = f"{result.get('status')}: {result.get('error')} (pending {result.get('pending_stages')})"
+                await asyncio.to_thread(self.queue.fail, job_id, self.worker_id, error)
+                print(f"⌛ Worker {self.worker_id}: job {job_id} {result.get('status')}")
+        except asyncio.CancelledError:
+            print(f"🛑 Worker {self.worker_id}: job {job_id} cancelled or lease lost")
+        except Exception as e:
+            traceback.print_exc()
+            await asyncio.to_thread(self.queue.fail, job_id, self.worker_id, str(e))
+        finally:
+            heartbeat.cancel()
+            if file_path is not None:
+                file_path.unlink(missing_ok=True)
+
+    async def keep_lease(self, job_id: int, grading: asyncio.Task) -> None:
+        """Heartbeat until the job ends; stop the job if it was cancelled or the lease was lost"""
+        while not grading.done():
+            await asyncio.sleep(self.lease_seconds / 3)
+            alive = await asyncio.to_thread(self.queue.heartbeat, job_id, self.worker_id, self.lease_seconds)
+            if not alive:
+                grading.cancel()
+                return
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a grading worker against the job queue selected by EDUMARK_JOB_STORE"
+    )
+    parser.add_argument("--concurrency", type=int, default=4, help="Jobs processed at the same time")
+    parser.add_argument("--lease", type=float, default=60.0, help="Lease length in seconds")
+    parser.add_argument("--poll", type=float, default=1.0, help="Seconds between polls of an empty queue")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    args = parser.parse_args()
+
+    worker = GradingWorker(args.worker_id, args.concurrency, args.lease, args.poll)
+    try:
+        asyncio.run(worker.run_forever())
+    except KeyboardInterrupt:
+        # Unfinished jobs are picked up by another worker once their leases expire
+        print(f"\n👋 Worker {args.worker_id} stopped at {datetime.now().isoformat(timespec='seconds')}")
+
+
+if __name__ == "__main__":
+    main()